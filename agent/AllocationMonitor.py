@@ -0,0 +1,106 @@
+import gc
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+class AllocationMonitor:
+    """
+    Measures allocations and garbage collector pauses per step, to track down latency spikes in the step loop.
+
+    Call begin_step() and end_step() around every step. Every `report_every` steps we print:
+        - the net number of memory blocks and of gc tracked objects allocated per step
+        - how many collections of each generation ran and how long they paused us for
+        - with `trace`, the lines that allocated the most since the last report, using tracemalloc. This is precise but
+            slows everything down, so it's off by default.
+    """
+    def __init__(self, report_every=1000, trace=False, top=10):
+        self.report_every = report_every
+        self.trace = trace
+        self.top = top
+
+        self.steps = 0
+        self.step_start_blocks = 0
+        self.step_start_objects = 0
+        self.step_collections = 0
+
+        # Per step in the current report window
+        self.blocks = []
+        self.objects = []
+        self.pauses = []
+
+        # Per collection in the current report window
+        self.collections = [0, 0, 0]
+        self.collection_start = None
+
+        self.snapshot = None
+        if self.trace:
+            tracemalloc.start()
+            self.snapshot = tracemalloc.take_snapshot()
+
+        gc.callbacks.append(self.on_gc)
+
+    def close(self):
+        if self.on_gc in gc.callbacks:
+            gc.callbacks.remove(self.on_gc)
+
+        if self.trace:
+            tracemalloc.stop()
+
+    def on_gc(self, phase, info):
+        if phase == "start":
+            self.collection_start = time.perf_counter()
+        elif self.collection_start is not None:
+            self.pauses.append(time.perf_counter() - self.collection_start)
+            self.collections[info["generation"]] += 1
+            self.step_collections += 1
+            self.collection_start = None
+
+    def begin_step(self):
+        self.step_start_blocks = sys.getallocatedblocks()
+        self.step_start_objects = gc.get_count()[0]
+        self.step_collections = 0
+
+    def end_step(self):
+        self.blocks.append(sys.getallocatedblocks() - self.step_start_blocks)
+
+        # The count is reset by every collection, so it's only meaningful for steps without one
+        if self.step_collections == 0:
+            self.objects.append(gc.get_count()[0] - self.step_start_objects)
+
+        self.steps += 1
+        if self.steps % self.report_every == 0:
+            self.report()
+
+    def report(self):
+        blocks = np.array(self.blocks) if self.blocks else np.zeros(1)
+        objects = np.array(self.objects) if self.objects else np.zeros(1)
+        pauses = np.array(self.pauses) * 1000 if self.pauses else np.zeros(1)
+
+        print(f"Allocations over {len(self.blocks)} steps: "
+              f"blocks/step mean {blocks.mean():.1f} max {blocks.max():.0f}, "
+              f"gc objects/step mean {objects.mean():.1f} max {objects.max():.0f}, "
+              f"collections gen0/1/2 {self.collections[0]}/{self.collections[1]}/{self.collections[2]}, "
+              f"gc pause ms total {pauses.sum() if self.pauses else 0.0:.2f} max {pauses.max():.2f}")
+
+        if self.trace:
+            snapshot = tracemalloc.take_snapshot()
+            for statistic in snapshot.compare_to(self.snapshot, "lineno")[:self.top]:
+                print(f"    {statistic}")
+            self.snapshot = snapshot
+
+        self.blocks.clear()
+        self.objects.clear()
+        self.pauses.clear()
+        self.collections = [0, 0, 0]
+
+
+def freeze_gc():
+    """
+    Collects everything and moves what's left, like the model and the environment, into the permanent generation so
+        later collections don't have to scan it. Call it once setup is done, before the step loop.
+    """
+    gc.collect()
+    gc.freeze()
@@ -1,56 +1,120 @@
 import time
 import numpy as np
-import torch
 
 from Game.Game import Game, Vector3
 from Game.RC1Game import RC1Game
+from .ObservationBuilder import ObservationBuilder, FeatureSpec
 from .RatchetEnvironment import RatchetEnvironment
 
 
 class FitnessCourseEnvironment(RatchetEnvironment):
-    def __init__(self, pid, eval_mode=False, device="cpu"):
+    checkpoints_template = [
+        Vector3(226, 143, 49.5),
+        Vector3(213, 141, 57),
+        Vector3(198, 140, 64),
+        Vector3(198, 147, 77.5),
+        Vector3(140, 161, 50.5),
+        Vector3(114, 200, 63),
+        Vector3(142, 197, 70),
+        Vector3(130, 189, 89),
+        Vector3(117, 86, 66),
+        Vector3(136, 114, 70),
+        Vector3(201, 128, 50),
+        Vector3(269.9619445800781, 143.47598266601562, 50.0),
+        Vector3(269.9619445800781, 143.47598266601562, 50.0),
+        Vector3(298.1654052734375, 143.35801696777344, 48.0625),
+        Vector3(301.29742431640625, 178.26695251464844, 45.689918518066406),
+        Vector3(265.7449035644531, 195.6828155517578, 46.0),
+        Vector3(228.53050231933594, 203.75091552734375, 46.25),
+        Vector3(233.90478515625, 239.93067932128906, 36.0),
+        Vector3(293.2232971191406, 244.1248321533203, 34.5),
+        Vector3(320.4754943847656, 240.56504821777344, 42.0),
+        Vector3(339.72320556640625, 243.81422424316406, 60.0),
+        Vector3(329.45880126953125, 282.32977294921875, 47.75),
+        Vector3(308.2227783203125, 302.4566650390625, 75.015625),
+        Vector3(261.9341125488281, 349.85101318359375, 75.203125),
+        Vector3(247.73629760742188, 374.39923095703125, 85.03430938720703),
+        Vector3(262.2768249511719, 375.6791076660156, 87.02777099609375),
+        Vector3(280.4011535644531, 392.7554016113281, 88.98082733154297),
+        Vector3(247.2918243408203, 375.9893493652344, 85.04957580566406),
+        Vector3(264.1728515625, 345.2733154296875, 75.0),
+        Vector3(308.86572265625, 299.5409240722656, 75.015625),
+        Vector3(326.81341552734375, 279.9330749511719, 47.75),
+        Vector3(307.574951171875, 244.40528869628906, 34.0),
+        Vector3(239.2870635986328, 244.0665740966797, 36.0),
+        Vector3(228.46156311035156, 195.80406188964844, 46.0),
+        Vector3(278.11517333984375, 195.728759765625, 45.89271545410156),
+        Vector3(302.5223693847656, 146.34388732910156, 48.0625),
+    ]
+
+    # Features in the observation, in order. Features with a range are mapped from it to [-1, 1]
+    observation_features = [
+        # Position
+        FeatureSpec("position_x", 0, 500),
+        FeatureSpec("position_y", 0, 500),
+        FeatureSpec("position_z", -150, 150),
+        FeatureSpec("rotation_z", -4, 4),
+
+        FeatureSpec("camera_position_x", 0, 500),
+        FeatureSpec("camera_position_y", 0, 500),
+        FeatureSpec("camera_position_z", -150, 150),
+        FeatureSpec("camera_rotation_z", -4, 4),
+
+        FeatureSpec("camera_to_checkpoint_angle", -4, 4),
+
+        # Checkpoints
+        FeatureSpec("checkpoint_x", 0, 500),
+        FeatureSpec("checkpoint_y", 0, 500),
+        FeatureSpec("checkpoint_z", -150, 150),
+        FeatureSpec("checkpoint_diff_x"),
+        FeatureSpec("checkpoint_diff_y"),
+        FeatureSpec("checkpoint_diff_z"),
+
+        FeatureSpec("pre_distance_from_checkpoint", 0, 500),
+        FeatureSpec("distance_from_checkpoint", 0, 500),
+        FeatureSpec("closest_distance_to_checkpoint", 0, 500),
+
+        # Player data
+        FeatureSpec("distance_from_ground", -64, 64),
+        FeatureSpec("speed", 0, 2),
+        FeatureSpec("player_state", 0, 255),
+
+        FeatureSpec("timer", 0, 1000 * 1000),
+
+        # Joystick
+        FeatureSpec("joystick_l_x"),
+        FeatureSpec("joystick_l_y"),
+        FeatureSpec("joystick_r_x"),
+        FeatureSpec("joystick_r_y"),
+
+        # Face buttons
+        FeatureSpec("action", 0, 0xFFFFFFFF),
+
+        # Collision data, 64 distances and 64 classes
+        *(FeatureSpec(f"collision_distance_{i}", -32, 64) for i in range(64)),
+        *(FeatureSpec(f"collision_class_{i}", -2, 4096) for i in range(64)),
+    ]
+
+    def __init__(self, pid, eval_mode=False, device="cpu", process_class=None, cache_reads=False, batch_writes=False,
+                 frame_waiter=None, memory=None, reuse_buffers=False, profiler=None):
         super().__init__(device=device)
 
-        self.game = RC1Game(pid=pid)
-
-        self.checkpoints_template = [
-            Vector3(226, 143, 49.5),
-            Vector3(213, 141, 57),
-            Vector3(198, 140, 64),
-            Vector3(198, 147, 77.5),
-            Vector3(140, 161, 50.5),
-            Vector3(114, 200, 63),
-            Vector3(142, 197, 70),
-            Vector3(130, 189, 89),
-            Vector3(117, 86, 66),
-            Vector3(136, 114, 70),
-            Vector3(201, 128, 50),
-            Vector3(269.9619445800781, 143.47598266601562, 50.0),
-            Vector3(269.9619445800781, 143.47598266601562, 50.0),
-            Vector3(298.1654052734375, 143.35801696777344, 48.0625),
-            Vector3(301.29742431640625, 178.26695251464844, 45.689918518066406),
-            Vector3(265.7449035644531, 195.6828155517578, 46.0),
-            Vector3(228.53050231933594, 203.75091552734375, 46.25),
-            Vector3(233.90478515625, 239.93067932128906, 36.0),
-            Vector3(293.2232971191406, 244.1248321533203, 34.5),
-            Vector3(320.4754943847656, 240.56504821777344, 42.0),
-            Vector3(339.72320556640625, 243.81422424316406, 60.0),
-            Vector3(329.45880126953125, 282.32977294921875, 47.75),
-            Vector3(308.2227783203125, 302.4566650390625, 75.015625),
-            Vector3(261.9341125488281, 349.85101318359375, 75.203125),
-            Vector3(247.73629760742188, 374.39923095703125, 85.03430938720703),
-            Vector3(262.2768249511719, 375.6791076660156, 87.02777099609375),
-            Vector3(280.4011535644531, 392.7554016113281, 88.98082733154297),
-            Vector3(247.2918243408203, 375.9893493652344, 85.04957580566406),
-            Vector3(264.1728515625, 345.2733154296875, 75.0),
-            Vector3(308.86572265625, 299.5409240722656, 75.015625),
-            Vector3(326.81341552734375, 279.9330749511719, 47.75),
-            Vector3(307.574951171875, 244.40528869628906, 34.0),
-            Vector3(239.2870635986328, 244.0665740966797, 36.0),
-            Vector3(228.46156311035156, 195.80406188964844, 46.0),
-            Vector3(278.11517333984375, 195.728759765625, 45.89271545410156),
-            Vector3(302.5223693847656, 146.34388732910156, 48.0625),
-        ]
+        # Times the phases of every step if set, see StepProfiler
+        self.profiler = profiler
+
+        self.game = RC1Game(pid=pid, process_class=process_class, cache_reads=cache_reads, batch_writes=batch_writes,
+                            frame_waiter=frame_waiter, memory=memory, reuse_buffers=reuse_buffers)
+
+        # Vectors that step reads the player and camera into, so it doesn't create new ones every step
+        self.pre_player_position = Vector3()
+        self.pre_player_rotation = Vector3()
+        self.player_and_camera = (Vector3(), Vector3(), Vector3(), Vector3())
+
+        # What begin_step leaves for finish_step
+        self.step_context = None
+
+        self.observation = ObservationBuilder(self.observation_features, device=device)
+        self.collisions_slice = self.observation.slice("collision_distance_0", 128)
 
         self.more_checkpoints = [
 
@@ -98,6 +162,9 @@ class FitnessCourseEnvironment(RatchetEnvironment):
 
             time.sleep(1)
 
+            # We're not advancing frames while we wait, so don't keep serving the level from the read cache
+            self.game.invalidate_read_cache()
+
         while self.game.get_death_count() <= 0:
             self.game.set_player_position(Vector3(0, 0, -10000))
             self.game.frame_advance(4)
@@ -155,12 +222,30 @@ class FitnessCourseEnvironment(RatchetEnvironment):
 
         self.distance_from_checkpoint_per_step = []
 
-        # Step once to get the first observation
-        return self.step([0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+        # Step once to get the first observation, without profiling it as a step
+        profiler, self.profiler = self.profiler, None
+        try:
+            return self.step([0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+        finally:
+            self.profiler = profiler
 
     def step(self, actions):
-        state, reward, terminal = None, 0.0, False
+        self.begin_step(actions)
+
+        advanced = self.game.finish_frame_advance()
+        self.lap("frame_wait")
 
+        return self.finish_step(advanced)
+
+    def lap(self, phase):
+        if self.profiler is not None:
+            self.profiler.lap(phase)
+
+    def begin_step(self, actions):
+        """
+        First half of a step: sends the actions to the game and lets it run without waiting for it. Call finish_step
+            with the result of `game.finish_frame_advance()` once the game is done, see VecFitnessCourseEnvironment.
+        """
         self.timer += 1
 
         action = 0
@@ -193,8 +278,8 @@ class FitnessCourseEnvironment(RatchetEnvironment):
 
         # Get current player position and distance to checkpoint before advancing to next frame so we can calculate
         #   how much the agent has moved towards the goal given the input it provided.
-        pre_player_position = self.game.get_player_position()
-        pre_player_rotation = self.game.get_player_rotation()
+        pre_player_position = self.game.get_player_position(out=self.pre_player_position)
+        pre_player_rotation = self.game.get_player_rotation(out=self.pre_player_rotation)
 
         checkpoint_position = self.checkpoints[self.checkpoint]
 
@@ -210,7 +295,27 @@ class FitnessCourseEnvironment(RatchetEnvironment):
         pre_angle = np.arctan2(checkpoint_position.y - pre_player_position.y, checkpoint_position.x - pre_player_position.x) - pre_player_rotation.z
 
         # Frame advance the game
-        if not self.game.frame_advance(frameskip=2):
+        self.game.begin_frame_advance(frameskip=2)
+
+        # Everything finish_step needs from before the frame advance
+        self.step_context = (action, death_count, checkpoint_position, pre_distance_from_checkpoint,
+                             pre_check_delta_x, pre_check_delta_y, pre_check_delta_z)
+
+        self.lap("write")
+
+    def finish_step(self, advanced):
+        """
+        Second half of a step: reads the game after the frame advance started by begin_step, which `advanced` tells
+            whether the game finished. Returns the observation, reward and whether the episode is over.
+        """
+        state, reward, terminal = None, 0.0, False
+
+        (action, death_count, checkpoint_position, pre_distance_from_checkpoint,
+         pre_check_delta_x, pre_check_delta_y, pre_check_delta_z) = self.step_context
+
+        pre_player_position = self.pre_player_position
+
+        if not advanced:
             # If we can't frame advance, the game has probably crashed
             terminal = True
             reward += self.reward("crash_penalty", -1.0)
@@ -220,12 +325,13 @@ class FitnessCourseEnvironment(RatchetEnvironment):
             reward += self.reward("death_penalty", -1.5)
 
         # Get updated player info
-        looking_at_checkpoint = self.game.get_camera_position().is_looking_at(self.game.get_camera_rotation(), checkpoint_position)
-        position = self.game.get_player_position()
-        player_rotation = self.game.get_player_rotation()
+        position, player_rotation, camera_pos, camera_rot = self.game.get_player_and_camera(out=self.player_and_camera)
+        looking_at_checkpoint = camera_pos.is_looking_at(camera_rot, checkpoint_position)
         distance_from_ground = self.game.get_distance_from_ground()
         speed = self.game.get_player_speed()
         player_state = self.game.get_player_state()
+        self.lap("read")
+
         distance_delta = position.distance_to_2d(pre_player_position)
 
         # Give reward for looking towards the checkpoint
@@ -249,7 +355,7 @@ class FitnessCourseEnvironment(RatchetEnvironment):
             max(-1, min(1, check_delta_x)), max(-1, min(1, check_delta_y)), max(-1, min(1, check_delta_z))
         )
 
-        distance_from_checkpoint = self.game.get_player_position().distance_to(checkpoint_position)
+        distance_from_checkpoint = position.distance_to(checkpoint_position)
 
         # Check that the player is within the bounds of the level
         # if position.x < self.bounds[0][0] or position.y > self.bounds[0][1] or \
@@ -297,7 +403,7 @@ class FitnessCourseEnvironment(RatchetEnvironment):
             reward += self.reward("reached_checkpoint_reward", 5.0)
 
             checkpoint_position = self.checkpoints[self.checkpoint]
-            distance_from_checkpoint = self.game.get_player_position().distance_to(checkpoint_position)
+            distance_from_checkpoint = position.distance_to(checkpoint_position)
 
             self.closest_distance_to_checkpoint = distance_from_checkpoint
 
@@ -352,57 +458,34 @@ class FitnessCourseEnvironment(RatchetEnvironment):
         self.distance_from_checkpoint_per_step.append(distance_from_checkpoint)
 
         # Penalize various collisions
-        camera_pos = self.game.get_camera_position()
-        camera_rot = self.game.get_camera_rotation()
-
         camera_to_checkpoint_angle = np.arctan2(checkpoint_position.y - camera_pos.y, checkpoint_position.x - camera_pos.x) - camera_rot.z
 
-        # Build observation state
-        state = [
-            # Position
-            np.interp(position.x, (0, 500), (-1, 1)),  # 0
-            np.interp(position.y, (0, 500), (-1, 1)),  # 1
-            np.interp(position.z, (-150, 150), (-1, 1)),  # 2
-            np.interp(player_rotation.z, (-4, 4), (-1, 1)),  # 3
-
-            np.interp(camera_pos.x, (0, 500), (-1, 1)),  # 4
-            np.interp(camera_pos.y, (0, 500), (-1, 1)),  # 5
-            np.interp(camera_pos.z, (-150, 150), (-1, 1)),  # 6
-            np.interp(camera_rot.z, (-4, 4), (-1, 1)),  # 7
-
-            np.interp(camera_to_checkpoint_angle, (-4, 4), (-1, 1)),  # 8
-
-            # Checkpoints
-            np.interp(checkpoint_position.x, (0, 500), (-1, 1)),  # 8
-            np.interp(checkpoint_position.y, (0, 500), (-1, 1)),  # 9
-            np.interp(checkpoint_position.z, (-150, 150), (-1, 1)),  # 10
-            check_diff_x,  # 11
-            check_diff_y,  # 12
-            check_diff_z,  # 13
-
-            np.interp(pre_distance_from_checkpoint, (0, 500), (-1, 1)),  # 14
-            np.interp(distance_from_checkpoint, (0, 500), (-1, 1)),  # 15
-            np.interp(self.closest_distance_to_checkpoint, (0, 500), (-1, 1)),  # 16
-
-            # Player data
-            np.interp(distance_from_ground, (-64, 64), (-1, 1)),  # 17
-            np.interp(speed, (0, 2), (-1, 1)),  # 18
-            np.interp(player_state, (0, 255), (-1, 1)),  # 19
-
-            np.interp(self.timer, (0, 1000 * 1000), (-1, 1)),  # 20
-
-            # Joystick
-            self.game.joystick_l_x,  # 21
-            self.game.joystick_l_y,  # 22
-            self.game.joystick_r_x,  # 23
-            self.game.joystick_r_y,  # 24
-
-            # Face buttons
-            np.interp(action, (0, 0xFFFFFFFF), (-1, 1)),  # 25
-
-            # Collision data
-            *self.game.get_collisions()  # 64 collisions + 64 classes + 64*3 normals
-        ]
+        # Build observation state, see observation_features
+        raw = self.observation.raw
+        raw[:self.collisions_slice.start] = (
+            position.x, position.y, position.z, player_rotation.z,
+            camera_pos.x, camera_pos.y, camera_pos.z, camera_rot.z,
+            camera_to_checkpoint_angle,
+
+            checkpoint_position.x, checkpoint_position.y, checkpoint_position.z,
+            check_diff_x, check_diff_y, check_diff_z,
+
+            pre_distance_from_checkpoint, distance_from_checkpoint, self.closest_distance_to_checkpoint,
+
+            distance_from_ground, speed, player_state,
+
+            self.timer,
+
+            self.game.joystick_l_x, self.game.joystick_l_y, self.game.joystick_r_x, self.game.joystick_r_y,
+
+            action,
+        )
+        self.lap("compute")
+
+        self.game.read_collisions_into(raw[self.collisions_slice])
+        self.lap("read")
+
+        state = self.observation.build()
 
         # state = [
         #     # Position
@@ -460,7 +543,10 @@ class FitnessCourseEnvironment(RatchetEnvironment):
         #         print(f"Danger! State out of bounds: {s}. Value: {state_value}")
         #         exit(0)
 
-        return torch.tensor(state, dtype=torch.bfloat16, device=self.device), reward, terminal
+        self.lap("compute")
+
+        # The state is overwritten by the next step, so copy it if you need to keep it around
+        return state, reward, terminal
 
 
 # Just used for various tests of the environment
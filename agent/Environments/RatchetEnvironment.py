@@ -5,6 +5,10 @@ class RatchetEnvironment:
     def __init__(self, device="cpu"):
         self.reward_counters = {}
 
+        # Counter keys by reward and stat name, so we don't build the same strings every step
+        self.reward_keys = {}
+        self.stat_keys = {}
+
         self.stats = {}
 
         self.device = device
@@ -20,7 +24,9 @@ class RatchetEnvironment:
         self.game.close_process()
 
     def reward(self, name: str, value: float):
-        key = f"rewards/{name}"
+        key = self.reward_keys.get(name)
+        if key is None:
+            key = self.reward_keys[name] = f"rewards/{name}"
 
         if key not in self.reward_counters:
             self.reward_counters[key] = value
@@ -31,7 +37,9 @@ class RatchetEnvironment:
         return value
 
     def stat(self, name: str, value: {}) -> {}:
-        key = f"stats/{name}"
+        key = self.stat_keys.get(name)
+        if key is None:
+            key = self.stat_keys[name] = f"stats/{name}"
 
         if key not in self.stats:
             self.stats[key] = value
@@ -0,0 +1,161 @@
+import time
+
+import numpy as np
+import torch
+
+from Game.FrameWaiter import sched_yield
+from SequenceWindow import SequenceWindow
+from .FitnessCourseEnvironment import FitnessCourseEnvironment
+
+
+class VecFitnessCourseEnvironment:
+    """
+    Steps a FitnessCourseEnvironment for each game in `pids` from one process, and gathers their observation windows
+        into one (N, sequence_length, features) batch so the policy can choose the actions for all of them in a single
+        forward pass.
+
+    Every step sends the actions to the games first and lets them all run at the same time before waiting for any of
+        them. Modes:
+        lockstep: Every step steps all the games and waits for all of them.
+        first_ready: Every step steps the games the last step returned, and returns as soon as at least one game is
+            done, with only the games that are done. A slow or stalled game doesn't hold the others up.
+
+    Environments that are done are reset right away and come back with the first observation of their next episode.
+        `finished_episodes` collects (index, score, checkpoints) for every episode that ended.
+    """
+    modes = ("lockstep", "first_ready")
+
+    def __init__(self, pids, mode="lockstep", sequence_length=30, device="cpu", memories=None, frame_waiters=None,
+                 profiler=None, **kwargs):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown mode {mode}, expected one of {self.modes}")
+
+        self.mode = mode
+        self.n_envs = len(pids)
+        self.profiler = profiler
+
+        memories = memories if memories is not None else [None] * self.n_envs
+        frame_waiters = frame_waiters if frame_waiters is not None else [None] * self.n_envs
+
+        self.envs = [
+            FitnessCourseEnvironment(pid=pid, device=device, memory=memory, frame_waiter=frame_waiter,
+                                     profiler=profiler, **kwargs)
+            for pid, memory, frame_waiter in zip(pids, memories, frame_waiters)
+        ]
+
+        features = len(FitnessCourseEnvironment.observation_features)
+        self.windows = [SequenceWindow(sequence_length, features, device=device) for _ in self.envs]
+
+        # The batch we gather the windows into, the first len(indices) rows are the ones returned by the last step
+        self.observations = torch.zeros((self.n_envs, sequence_length, features), dtype=torch.bfloat16, device=device)
+
+        # Environments we've sent actions to that haven't finished their step yet
+        self.pending = []
+
+        self.scores = np.zeros(self.n_envs)
+        self.finished_episodes = []
+
+    def start(self):
+        for env in self.envs:
+            env.start()
+
+    def stop(self):
+        for env in self.envs:
+            env.stop()
+
+    def reset_env(self, index):
+        state, _, _ = self.envs[index].reset()
+
+        self.windows[index].reset(state)
+        self.scores[index] = 0.0
+
+    def reset(self):
+        """
+        Resets all the environments. Returns the indices of all of them and their observations.
+        """
+        for index in range(self.n_envs):
+            self.reset_env(index)
+
+        indices = np.arange(self.n_envs)
+
+        return indices, self.gather(indices)
+
+    def gather(self, indices):
+        """
+        Gathers the windows of the environments in `indices` into a (len(indices), sequence_length, features) view of
+            our batch, which is overwritten by the next step.
+        """
+        observations = self.observations[:len(indices)]
+        torch.stack([self.windows[index].sequence for index in indices], out=observations)
+
+        return observations
+
+    def step(self, indices, actions):
+        """
+        Sends `actions[j]` to the environment `indices[j]`, for the environments the last step or reset returned.
+
+        Returns the indices of the environments that finished their step, along with their observations, rewards and
+            whether their episodes are done, in the same order. The observations are overwritten by the next step.
+        """
+        for index, action in zip(indices, actions):
+            self.envs[index].begin_step(action)
+            self.pending.append(index)
+
+        if self.mode == "lockstep":
+            ready = self.pending
+            self.pending = []
+        else:
+            ready = self.wait_first_ready()
+            self.pending = [index for index in self.pending if index not in ready]
+
+            self.lap("frame_wait")
+
+        rewards = np.zeros(len(ready))
+        dones = np.zeros(len(ready), dtype=bool)
+
+        for j, index in enumerate(ready):
+            env = self.envs[index]
+
+            advanced = env.game.finish_frame_advance()
+            self.lap("frame_wait")
+
+            state, rewards[j], dones[j] = env.finish_step(advanced)
+            self.windows[index].append(state)
+
+            self.scores[index] += rewards[j]
+
+            if dones[j]:
+                self.finished_episodes.append((int(index), float(self.scores[index]), env.n_checkpoints))
+                self.reset_env(index)
+                self.lap("reset")
+
+        ready = np.array(ready, dtype=np.int64)
+
+        return ready, self.gather(ready), rewards, dones
+
+    def lap(self, phase):
+        if self.profiler is not None:
+            self.profiler.lap(phase)
+
+    def wait_first_ready(self):
+        """
+        Polls the games we're waiting for until at least one of them is done, or has timed out. Returns those.
+        """
+        while True:
+            ready = [index for index in self.pending if self.envs[index].game.frame_advance_ready()]
+            if ready:
+                return ready
+
+            # finish_frame_advance gives up right away on these, since their timeout counts from begin_step
+            now = time.perf_counter()
+            timed_out = [index for index in self.pending if self.timed_out(index, now)]
+            if timed_out:
+                return timed_out
+
+            sched_yield()
+
+    def timed_out(self, index, now):
+        game = self.envs[index].game
+        timeout = game.frame_waiter.timeout
+
+        return bool(timeout) and now - game.frame_advance_target[3] > timeout
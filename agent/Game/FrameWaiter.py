@@ -0,0 +1,98 @@
+import os
+import time
+
+import numpy as np
+
+# Windows doesn't have sched_yield, but sleep(0) gives up the rest of our time slice there too
+sched_yield = getattr(os, "sched_yield", lambda: time.sleep(0))
+
+
+class FrameWaiter:
+    """
+    Waits for the game's frame counter to reach a target frame.
+
+    Strategies:
+        spin: Poll the frame counter as fast as we can. Lowest latency, but burns a whole core.
+        yield: Spin for `spin_time` seconds, then yield the CPU between polls.
+        adaptive: Sleep for most of the time we expect the frames to take, based on the frame times we've measured so
+            far, then poll like `yield` for the rest.
+
+    Gives up and returns False after `timeout` seconds, so a stalled emulator doesn't hang the worker forever.
+    """
+    strategies = ("spin", "yield", "adaptive")
+
+    def __init__(self, strategy="spin", timeout=10.0, spin_time=0.0002, sleep_fraction=0.8, history=4096):
+        if strategy not in self.strategies:
+            raise ValueError(f"Unknown frame wait strategy {strategy}, expected one of {self.strategies}")
+
+        self.strategy = strategy
+        self.timeout = timeout
+        self.spin_time = spin_time
+        self.sleep_fraction = sleep_fraction
+
+        # Exponential moving average of how long a single frame takes
+        self.frame_time = None
+
+        # Ring buffer of the most recent wait times, in seconds
+        self.wait_times = np.zeros(history, dtype=np.float64)
+        self.waits = 0
+        self.timeouts = 0
+
+    def wait(self, get_frame_count, target_frame, frame_count, frames=1, started=None):
+        """
+        Polls `get_frame_count` until it reaches `target_frame`. Returns the last frame count we saw, or None if we
+            timed out.
+
+        `started` is the time.perf_counter() at which we asked the game for the frames, if that was a while ago, e.g.
+            because we stepped other games in the meantime. The timeout and the wait time we record count from there.
+        """
+        start = started if started is not None else time.perf_counter()
+        deadline = start + self.timeout if self.timeout else None
+
+        if self.strategy == "adaptive" and self.frame_time is not None and frame_count < target_frame:
+            sleep_time = self.frame_time * frames * self.sleep_fraction - (time.perf_counter() - start)
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+                frame_count = get_frame_count()
+
+        while frame_count < target_frame:
+            now = time.perf_counter()
+
+            if deadline is not None and now > deadline:
+                self.timeouts += 1
+                return None
+
+            if self.strategy != "spin" and now - start > self.spin_time:
+                sched_yield()
+
+            frame_count = get_frame_count()
+
+        self.record(time.perf_counter() - start, frames)
+
+        return frame_count
+
+    def record(self, wait_time, frames):
+        self.wait_times[self.waits % len(self.wait_times)] = wait_time
+        self.waits += 1
+
+        frame_time = wait_time / frames
+        self.frame_time = frame_time if self.frame_time is None else 0.9 * self.frame_time + 0.1 * frame_time
+
+    def recent_wait_times(self):
+        return self.wait_times[:min(self.waits, len(self.wait_times))]
+
+    def percentiles(self, q=(50, 90, 99, 99.9)):
+        """
+        Percentiles of the recent wait times, in milliseconds.
+        """
+        wait_times = self.recent_wait_times()
+        if len(wait_times) == 0:
+            return {p: 0.0 for p in q}
+
+        return dict(zip(q, np.percentile(wait_times, q) * 1000))
+
+    def histogram(self, bins=20):
+        """
+        Histogram of the recent wait times, in milliseconds, as (counts, bin_edges).
+        """
+        return np.histogram(self.recent_wait_times() * 1000, bins=bins)
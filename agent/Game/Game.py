@@ -1,6 +1,7 @@
 import os
 import ctypes
 import math
+import struct
 import numpy as np
 
 if os.name == 'nt':
@@ -9,6 +10,27 @@ elif os.name == 'posix':
     from Game.LinuxProcess import Process
 
 
+def affine_interp(x, xp, fp, out=None):
+    """
+    Vectorized equivalent of np.interp(x, xp, fp) for a two point xp and fp, giving bit-for-bit the same results.
+    Writes into `out` when given.
+    """
+    (x0, x1), (y0, y1) = xp, fp
+    slope = (y1 - y0) / (x1 - x0)
+
+    x = np.asarray(x, dtype=np.float64)
+
+    out = np.subtract(x, x0, out=out)
+    np.multiply(out, slope, out=out)
+    np.add(out, y0, out=out)
+
+    # np.interp clamps to the end points outside of xp
+    out[x < x0] = y0
+    out[x >= x1] = y1
+
+    return out
+
+
 # Vector3
 class Vector3(ctypes.Structure):
     _fields_ = [("x", ctypes.c_float),
@@ -32,6 +54,22 @@ class Vector3(ctypes.Structure):
         angle = self.angle_to(other)
         return abs(angle - rotation.z) < angle_threshold
 
+    @classmethod
+    def from_big_endian(cls, buffer, offset=0, out=None):
+        """
+        Decodes three big endian floats at `offset` in `buffer`, as they're stored in the game's memory. Fills in and
+            returns `out` if given instead of creating a new vector.
+        """
+        if out is None:
+            out = cls()
+
+        if buffer:
+            out.x, out.y, out.z = struct.unpack_from('>3f', buffer, offset)
+        else:
+            out.x = out.y = out.z = 0.0
+
+        return out
+
     def numpy(self):
         return np.array([self.x, self.y, self.z])
 
@@ -40,15 +78,25 @@ class Vector3(ctypes.Structure):
 
 
 class Game:
-    def __init__(self, pid):
+    def __init__(self, pid, process_class=None, memory=None):
         self.pid = pid
 
-        self.process = Process(pid, base_offset=self.offset)
+        # Runs against an in-memory `GameMemory` instead of the emulator, which brings its own way to access it
+        if memory is not None and process_class is not None:
+            raise ValueError("Pass either a memory or a process class, a memory brings its own process class")
+
+        # Lets callers swap out how we access the game's memory, e.g. `PreadProcess` instead of the default `Process`
+        self.process_class = process_class if process_class is not None else Process
+
+        if memory is not None:
+            self.process_class = memory.process_class
+
+        self.process = self.process_class(pid, base_offset=self.offset)
         self.last_frame_count = 0
         self.must_restart = False
 
     def open_process(self):
-        self.process = Process(self.pid, base_offset=self.offset)
+        self.process = self.process_class(self.pid, base_offset=self.offset)
         return self.process.open_process()
 
     def close_process(self):
@@ -1,11 +1,96 @@
 import os
 import ctypes
+import errno
 import struct
+from contextlib import contextmanager
 
 import psutil
 
+from Game.WriteBatch import coalesce_writes, overlaps
+
 # Constants
 PROCESS_ALL_ACCESS = os.O_RDWR | os.O_SYNC
+IOV_MAX = 1024
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+libc = ctypes.CDLL(None, use_errno=True)
+
+process_vm_readv = getattr(libc, "process_vm_readv", None)
+if process_vm_readv is not None:
+    process_vm_readv.restype = ctypes.c_ssize_t
+    process_vm_readv.argtypes = [ctypes.c_int, ctypes.POINTER(iovec), ctypes.c_ulong,
+                                 ctypes.POINTER(iovec), ctypes.c_ulong, ctypes.c_ulong]
+
+process_vm_writev = getattr(libc, "process_vm_writev", None)
+if process_vm_writev is not None:
+    process_vm_writev.restype = ctypes.c_ssize_t
+    process_vm_writev.argtypes = [ctypes.c_int, ctypes.POINTER(iovec), ctypes.c_ulong,
+                                  ctypes.POINTER(iovec), ctypes.c_ulong, ctypes.c_ulong]
+
+
+class VectoredRead:
+    """
+    A set of (address, size) regions that are read back to back into one buffer with a single process_vm_readv call,
+        or with one pread per region if process_vm_readv isn't permitted.
+    """
+    def __init__(self, process, regions, buffer=None):
+        self.process = process
+        self.regions = list(regions)
+
+        size = sum(size for _, size in self.regions)
+        self.buffer = buffer if buffer is not None else bytearray(size)
+
+        # (start, end) of each region in the buffer
+        self.spans = []
+
+        buffer_address = ctypes.addressof(ctypes.c_char.from_buffer(memoryview(self.buffer).cast('B')))
+
+        self.chunks = []
+        position = 0
+        for start in range(0, len(self.regions), IOV_MAX):
+            chunk = self.regions[start:start + IOV_MAX]
+
+            local_iov = (iovec * len(chunk))()
+            remote_iov = (iovec * len(chunk))()
+
+            chunk_size = 0
+            for i, (address, region_size) in enumerate(chunk):
+                local_iov[i].iov_base = buffer_address + position
+                local_iov[i].iov_len = region_size
+                remote_iov[i].iov_base = process.base_offset + address
+                remote_iov[i].iov_len = region_size
+
+                self.spans.append((position, position + region_size))
+                position += region_size
+                chunk_size += region_size
+
+            self.chunks.append((local_iov, remote_iov, len(chunk), chunk_size))
+
+    def read(self):
+        if self.process.pending_writes and overlaps(self.process.pending_writes, self.regions):
+            self.process.flush_writes()
+
+        if self.process.vm_readv:
+            for local_iov, remote_iov, count, size in self.chunks:
+                read = process_vm_readv(self.process.pid, local_iov, count, remote_iov, count, 0)
+
+                if read != size:
+                    if read < 0 and ctypes.get_errno() in (errno.EPERM, errno.ENOSYS):
+                        # Not allowed to use process_vm_readv against this process, so don't try again
+                        self.process.vm_readv = False
+                    break
+            else:
+                return self.buffer
+
+        self.process.pread_many_into(self.regions, self.buffer)
+
+        return self.buffer
+
 
 class Process:
     def __init__(self, pid, base_offset=0):
@@ -14,6 +99,14 @@ class Process:
         self.process_handle = None
         self.base_offset = base_offset
 
+        # Cleared if the kernel doesn't let us use process_vm_readv, in which case we fall back to pread
+        self.vm_readv = process_vm_readv is not None
+        self.vm_writev = process_vm_writev is not None
+        self.vectored_reads = {}
+
+        # Writes are queued here instead of written right away while a write batch is open
+        self.pending_writes = None
+
     def open_process(self):
         self.process = None
 
@@ -36,21 +129,171 @@ class Process:
     def close_process(self):
         os.close(self.process_handle)
 
+    def memory_path(self):
+        return f"/proc/{self.pid}/mem"
+
     def read_memory(self, address, size):
-        buffer = ctypes.create_string_buffer(size)
-        with open(f"/proc/{self.process.info['pid']}/mem", 'rb') as mem_file:
+        if self.pending_writes and overlaps(self.pending_writes, ((address, size),)):
+            self.flush_writes()
+
+        with open(self.memory_path(), 'rb') as mem_file:
             mem_file.seek(self.base_offset + address)
-            buffer.raw = mem_file.read(size)
+            return mem_file.read(size)
+
+    def read_memory_into(self, address, buffer):
+        """
+        Reads len(buffer) bytes into a writable buffer instead of allocating a new one.
+        """
+        if self.pending_writes and overlaps(self.pending_writes, ((address, len(buffer)),)):
+            self.flush_writes()
 
-        return buffer.raw
+        if self.process_handle is None:
+            self.pread_many_into(((address, len(buffer)),), buffer)
+        else:
+            os.preadv(self.process_handle, (buffer,), self.base_offset + address)
+
+        return buffer
 
     def write_memory(self, address, data):
-        with open(f"/proc/{self.process.info['pid']}/mem", 'wb') as mem_file:
+        if self.pending_writes is not None:
+            self.pending_writes.append((address, bytes(data)))
+            return True
+
+        with open(self.memory_path(), 'r+b') as mem_file:
             mem_file.seek(self.base_offset + address)
             mem_file.write(data)
 
         return True
 
+    def begin_write_batch(self):
+        """
+        Queues writes from now on instead of writing them right away, until flush_writes() or end_write_batch().
+        """
+        if self.pending_writes is None:
+            self.pending_writes = []
+
+    def end_write_batch(self):
+        self.flush_writes()
+        self.pending_writes = None
+
+    @contextmanager
+    def write_batch(self):
+        self.begin_write_batch()
+        try:
+            yield self
+        finally:
+            self.end_write_batch()
+
+    def flush_writes(self):
+        """
+        Merges the queued writes into contiguous runs and writes them all with one process_vm_writev call, or one
+            pwrite per run if process_vm_writev isn't permitted.
+        """
+        if not self.pending_writes:
+            return True
+
+        runs = coalesce_writes(self.pending_writes)
+        self.pending_writes.clear()
+
+        if self.vm_writev and self._vm_write_runs(runs):
+            return True
+
+        return self.pwrite_runs(runs)
+
+    def _vm_write_runs(self, runs):
+        for start in range(0, len(runs), IOV_MAX):
+            chunk = runs[start:start + IOV_MAX]
+
+            local_iov = (iovec * len(chunk))()
+            remote_iov = (iovec * len(chunk))()
+            buffers = []
+
+            size = 0
+            for i, (address, data) in enumerate(chunk):
+                buffer = (ctypes.c_char * len(data)).from_buffer(data)
+                buffers.append(buffer)
+
+                local_iov[i].iov_base = ctypes.addressof(buffer)
+                local_iov[i].iov_len = len(data)
+                remote_iov[i].iov_base = self.base_offset + address
+                remote_iov[i].iov_len = len(data)
+                size += len(data)
+
+            written = process_vm_writev(self.pid, local_iov, len(chunk), remote_iov, len(chunk), 0)
+
+            if written != size:
+                if written < 0 and ctypes.get_errno() in (errno.EPERM, errno.ENOSYS):
+                    self.vm_writev = False
+
+                # Write everything again with pwrite, the writes are idempotent
+                return False
+
+        return True
+
+    def pwrite_runs(self, runs):
+        fd = self.process_handle
+        if fd is None:
+            fd = os.open(self.memory_path(), os.O_WRONLY)
+
+        try:
+            for address, data in runs:
+                os.pwrite(fd, data, self.base_offset + address)
+        finally:
+            if fd != self.process_handle:
+                os.close(fd)
+
+        return True
+
+    def read_many(self, regions):
+        """
+        Reads many disjoint (address, size) regions with as few syscalls as possible.
+        Returns the bytes for each region, in the same order as `regions`.
+        """
+        read = self.prepare_read(regions)
+        buffer = read.read()
+
+        return [bytes(buffer[start:end]) for start, end in read.spans]
+
+    def read_many_into(self, regions, buffer):
+        """
+        Reads the (address, size) regions back to back into `buffer`, which must be a writable buffer at least as
+            large as the sum of the region sizes.
+        """
+        return self.prepare_read(regions, buffer).read()
+
+    def prepare_read(self, regions, buffer=None):
+        """
+        Returns a `VectoredRead` for the regions. They're cached, so the iovecs are only built the first time a set of
+            regions is read.
+        """
+        key = (tuple(regions), id(buffer))
+
+        read = self.vectored_reads.get(key)
+        if read is None:
+            if len(self.vectored_reads) >= 64:
+                self.vectored_reads.clear()
+
+            read = VectoredRead(self, regions, buffer)
+            self.vectored_reads[key] = read
+
+        return read
+
+    def pread_many_into(self, regions, buffer):
+        view = memoryview(buffer).cast('B')
+
+        fd = self.process_handle
+        if fd is None:
+            fd = os.open(self.memory_path(), os.O_RDONLY)
+
+        try:
+            position = 0
+            for address, size in regions:
+                os.preadv(fd, [view[position:position + size]], self.base_offset + address)
+                position += size
+        finally:
+            if fd != self.process_handle:
+                os.close(fd)
+
     def write_int(self, address, value):
         value_bytes = value.to_bytes(4, byteorder='big')
         if not self.write_memory(address, value_bytes):
@@ -87,4 +330,138 @@ class Process:
         if buffer:
             # There's no float.from_bytes function
             value = ctypes.c_float.from_buffer_copy(buffer).value
-        return value
\ No newline at end of file
+        return value
+
+
+class PreadProcess(Process):
+    """
+    Keeps a single descriptor to the process memory open and uses positioned reads and writes against it, instead of
+        opening /proc/<pid>/mem for every access like `Process` does.
+    """
+    def open_process(self):
+        if not super().open_process():
+            return False
+
+        self.create_time = self.process.create_time()
+
+        return True
+
+    def close_process(self):
+        if self.process_handle is not None:
+            os.close(self.process_handle)
+            self.process_handle = None
+
+    def reopen(self):
+        """
+        Reopens the memory descriptor, e.g. after the process was restarted under the same PID.
+        """
+        self.close_process()
+        self.process_handle = os.open(self.memory_path(), PROCESS_ALL_ACCESS)
+
+        try:
+            self.create_time = psutil.Process(self.pid).create_time()
+        except psutil.NoSuchProcess:
+            pass
+
+    def _restarted(self):
+        try:
+            return psutil.Process(self.pid).create_time() != self.create_time
+        except (psutil.NoSuchProcess, AttributeError):
+            return True
+
+    def _with_handle(self, access):
+        """
+        Calls `access` with our descriptor, and once more with a new one if it failed because the process has been
+            restarted since we opened it.
+        """
+        if self.process_handle is None:
+            self.reopen()
+
+        try:
+            return access(self.process_handle)
+        except OSError:
+            if not self._restarted():
+                raise
+
+        self.reopen()
+        return access(self.process_handle)
+
+    def read_many(self, regions):
+        """
+        Reads each region with its own pread on our descriptor, which is cheaper than building a vectored read for a
+            handful of small regions.
+        """
+        if self.pending_writes and overlaps(self.pending_writes, regions):
+            self.flush_writes()
+
+        def read(fd):
+            return [os.pread(fd, size, self.base_offset + address) for address, size in regions]
+
+        return self._with_handle(read)
+
+    def read_many_into(self, regions, buffer):
+        if self.pending_writes and overlaps(self.pending_writes, regions):
+            self.flush_writes()
+
+        self.pread_many_into(regions, buffer)
+
+        return buffer
+
+    def pread_many_into(self, regions, buffer):
+        view = memoryview(buffer).cast('B')
+
+        def read(fd):
+            position = 0
+            for address, size in regions:
+                view[position:position + size] = os.pread(fd, size, self.base_offset + address)
+                position += size
+
+        self._with_handle(read)
+
+    def pwrite_runs(self, runs):
+        if self.process_handle is None:
+            self.reopen()
+
+        return super().pwrite_runs(runs)
+
+    def read_memory(self, address, size):
+        if self.pending_writes and overlaps(self.pending_writes, ((address, size),)):
+            self.flush_writes()
+
+        if self.process_handle is None:
+            self.reopen()
+
+        try:
+            return os.pread(self.process_handle, size, self.base_offset + address)
+        except OSError:
+            if not self._restarted():
+                raise
+
+        # The process has been restarted since we opened it, so our descriptor is stale
+        self.reopen()
+        return os.pread(self.process_handle, size, self.base_offset + address)
+
+    def read_memory_into(self, address, buffer):
+        if self.pending_writes and overlaps(self.pending_writes, ((address, len(buffer)),)):
+            self.flush_writes()
+
+        self._with_handle(lambda fd: os.preadv(fd, (buffer,), self.base_offset + address))
+
+        return buffer
+
+    def write_memory(self, address, data):
+        if self.pending_writes is not None:
+            self.pending_writes.append((address, bytes(data)))
+            return True
+
+        if self.process_handle is None:
+            self.reopen()
+
+        try:
+            return os.pwrite(self.process_handle, data, self.base_offset + address) == len(data)
+        except OSError:
+            if not self._restarted():
+                raise
+
+        self.reopen()
+        return os.pwrite(self.process_handle, data, self.base_offset + address) == len(data)
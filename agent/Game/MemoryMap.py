@@ -0,0 +1,168 @@
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+
+MemoryField = namedtuple('MemoryField', ('name', 'address', 'type', 'count'))
+
+# Big endian NumPy types for the C types used in the PRX sources
+c_types = {
+    'int': np.dtype('>i4'),
+    'int32_t': np.dtype('>i4'),
+    'uint32_t': np.dtype('>u4'),
+    'u32': np.dtype('>u4'),
+    'float': np.dtype('>f4'),
+    'char': np.dtype('>i1'),
+    'u8': np.dtype('>u1'),
+    'bool': np.dtype('>u1'),
+    'GameState': np.dtype('>i4'),
+    'Vec4': np.dtype(('>f4', (4,))),
+}
+
+# `#define name *((type*)0xADDRESS)` for scalars, `#define name ((type*)0xADDRESS)` for arrays
+define_pattern = re.compile(r'^#define\s+(\w+)\s+(\*?)\(\((\w+)\s*(\**)\)\s*(0x[0-9a-fA-F]+)\)')
+
+# `name = 0xADDRESS;` in globals.ld
+symbol_pattern = re.compile(r'^\s*(\w+)\s*=\s*(0x[0-9a-fA-F]+)\s*;')
+
+# `extern type name;` or `extern type name[];` in the game's header
+extern_pattern = re.compile(r'^\s*extern\s+(?:enum\s+)?(\w+)\s*(\**)\s*(\w+)\s*(\[\])?\s*;')
+
+
+def c_type(name, pointers):
+    # Pointers are 32 bits on the PS3
+    if pointers:
+        return np.dtype('>u4')
+
+    return c_types.get(name)
+
+
+def parse_defines(path):
+    """
+    Parses the memory mapped `#define`s in a PRX source file into MemoryFields.
+    """
+    fields = {}
+
+    with open(path, 'r') as source:
+        for line in source:
+            match = define_pattern.match(line)
+            if match is None:
+                continue
+
+            name, dereference, type_name, pointers, address = match.groups()
+
+            # The pointer in the cast is the one we dereference, anything beyond that is the element type
+            field_type = c_type(type_name, pointers[1:])
+            if field_type is None:
+                continue
+
+            fields[name] = MemoryField(name, int(address, 16), field_type, 1)
+
+    return fields
+
+
+def parse_symbols(linker_script, header):
+    """
+    Parses the game's global symbols from the linker script, with their types from the `extern` declarations in the
+        header.
+    """
+    types = {}
+    with open(header, 'r') as source:
+        for line in source:
+            match = extern_pattern.match(line)
+            if match is not None:
+                type_name, pointers, name, _ = match.groups()
+                types[name] = c_type(type_name, pointers)
+
+    fields = {}
+    with open(linker_script, 'r') as source:
+        for line in source:
+            match = symbol_pattern.match(line)
+            if match is None:
+                continue
+
+            name, address = match.groups()
+            if types.get(name) is not None:
+                fields[name] = MemoryField(name, int(address, 16), types[name], 1)
+
+    return fields
+
+
+def parse_prx_sources(directory):
+    """
+    Collects every memory mapped field in a game's PRX sources: the `#define`s in its sources and headers and the
+        globals from `globals.ld`.
+    """
+    fields = {}
+
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(('.c', '.cpp', '.h')):
+            fields.update(parse_defines(os.path.join(directory, filename)))
+
+    linker_script = os.path.join(directory, 'globals.ld')
+    header = os.path.join(directory, f'{os.path.basename(os.path.normpath(directory))}.h')
+    if os.path.exists(linker_script) and os.path.exists(header):
+        fields.update(parse_symbols(linker_script, header))
+
+    return fields
+
+
+class MemoryMap:
+    """
+    Compiles a set of MemoryFields into a structured big endian dtype over one buffer and the contiguous (address,
+        size) ranges that fill it, so a single vectored read decodes every field without any per-field work.
+    """
+    def __init__(self, fields, max_gap=256):
+        self.fields = sorted(fields, key=lambda field: field.address)
+
+        # Merge fields into ranges, reading over gaps of up to max_gap bytes to have fewer iovecs
+        self.regions = []
+        offsets = []
+        buffer_size = 0
+        for field in self.fields:
+            field_type = np.dtype((field.type, (field.count,))) if field.count > 1 else np.dtype(field.type)
+            end = field.address + field_type.itemsize
+
+            if self.regions and field.address - (self.regions[-1][0] + self.regions[-1][1]) <= max_gap:
+                start, size = self.regions[-1]
+                buffer_start = buffer_size - size
+                if end > start + size:
+                    buffer_size += end - (start + size)
+                    self.regions[-1] = (start, end - start)
+            else:
+                start = field.address
+                buffer_start = buffer_size
+                buffer_size += end - start
+                self.regions.append((start, end - start))
+
+            offsets.append((field.name, field_type, buffer_start + field.address - start))
+
+        self.dtype = np.dtype({
+            'names': [name for name, _, _ in offsets],
+            'formats': [field_type for _, field_type, _ in offsets],
+            'offsets': [offset for _, _, offset in offsets],
+            'itemsize': buffer_size,
+        })
+
+        self.buffer = bytearray(buffer_size)
+        self.records = np.frombuffer(self.buffer, dtype=self.dtype)
+
+    @classmethod
+    def from_symbols(cls, symbols, names, extra_fields=(), max_gap=256):
+        """
+        Builds a map from fields parsed out of the PRX sources. `names` maps each symbol to its element count.
+        """
+        fields = [symbols[name]._replace(count=count) for name, count in names.items()]
+
+        return cls([*fields, *extra_fields], max_gap=max_gap)
+
+    def read(self, process):
+        """
+        Reads all the fields from the process and returns a record view over the buffer. The record is overwritten by
+            the next read.
+        """
+        process.read_many_into(self.regions, self.buffer)
+
+        return self.records[0]
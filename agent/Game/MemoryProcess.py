@@ -0,0 +1,233 @@
+import errno
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+
+from Game.WriteBatch import coalesce_writes, overlaps
+
+# Enough to cover RC1's game state and the PRX's mailbox at 0xB00000
+DEFAULT_MEMORY_SIZE = 0x1000000
+
+
+class GameMemory:
+    """
+    Stand-in for the emulator's memory, laid out like the PS3 address space that the games' `offset` points at, so
+        address N in the game is byte N here.
+
+    It's backed by a bytearray, a memory mapped file when `path` is given, or any writable buffer, e.g. a
+        `multiprocessing.shared_memory.SharedMemory`'s `buf`. Harnesses can watch addresses to react to what the
+        agent writes, like `advance_frames_on_write` standing in for the PRX's frame stepping.
+    """
+    def __init__(self, size=DEFAULT_MEMORY_SIZE, path=None, buffer=None):
+        self.file = None
+        self.mmap = None
+
+        if buffer is not None:
+            self.buffer = buffer
+        elif path is not None:
+            self.file = open(path, 'a+b')
+            if os.fstat(self.file.fileno()).st_size < size:
+                os.ftruncate(self.file.fileno(), size)
+
+            self.mmap = mmap.mmap(self.file.fileno(), size)
+            self.buffer = self.mmap
+        else:
+            self.buffer = bytearray(size)
+
+        self.view = memoryview(self.buffer).cast('B')
+        self.size = len(self.view)
+
+        # (address, size, callback) for each watched range, called after every write that touches it
+        self.watches = []
+
+    def close(self):
+        self.view.release()
+
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def check_range(self, address, size):
+        if address < 0 or address + size > self.size:
+            raise OSError(errno.EFAULT, f"Address range 0x{address:x}-0x{address + size:x} is outside of the "
+                                        f"0x{self.size:x} bytes of game memory")
+
+    def read(self, address, size):
+        self.check_range(address, size)
+
+        return bytes(self.view[address:address + size])
+
+    def read_into(self, address, destination):
+        self.check_range(address, len(destination))
+
+        destination[:] = self.view[address:address + len(destination)]
+
+    def write(self, address, data):
+        self.check_range(address, len(data))
+
+        self.view[address:address + len(data)] = data
+
+        for watch_address, watch_size, callback in self.watches:
+            if address < watch_address + watch_size and watch_address < address + len(data):
+                callback(self, address, data)
+
+    def on_write(self, address, callback, size=4):
+        """
+        Calls `callback(memory, address, data)` after every write that touches `size` bytes at `address`.
+        """
+        self.watches.append((address, size, callback))
+
+    def read_uint(self, address):
+        return struct.unpack_from('>I', self.view, address)[0]
+
+    def write_uint(self, address, value):
+        self.write(address, struct.pack('>I', value))
+
+    def read_float(self, address):
+        return struct.unpack_from('>f', self.view, address)[0]
+
+    def advance_frames_on_write(self, frame_count_address, frame_progress_address, step=None):
+        """
+        Does what the PRX does for frame stepping: when the frame progress is bumped past the frame count, run `step`
+            once per frame if given, and then bump the frame count to match.
+        """
+        def advance(memory, address, data):
+            target_frame = memory.read_uint(frame_progress_address)
+            frame_count = memory.read_uint(frame_count_address)
+
+            while frame_count < target_frame:
+                if step is not None:
+                    step(memory)
+
+                frame_count += 1
+
+            memory.write_uint(frame_count_address, frame_count)
+
+        self.on_write(frame_progress_address, advance)
+
+    def process_class(self, pid, base_offset=0):
+        """
+        Can be passed as a game's `process_class`, so every process it opens shares this memory.
+        """
+        return MemoryProcess(pid, base_offset=base_offset, memory=self)
+
+
+class MemoryProcess:
+    """
+    `Process` that reads and writes a `GameMemory` instead of the emulator, for benchmarks and runs without RPCS3.
+    """
+    def __init__(self, pid, base_offset=0, memory=None):
+        self.pid = pid
+        self.process = None
+        self.process_handle = None
+
+        # Addresses are relative to the game's offset in the emulator, which is where GameMemory starts
+        self.base_offset = base_offset
+
+        self.memory = memory if memory is not None else GameMemory()
+
+        # Writes are queued here instead of written right away while a write batch is open
+        self.pending_writes = None
+
+    def open_process(self):
+        self.process_handle = self.memory
+        return True
+
+    def close_process(self):
+        self.process_handle = None
+
+    def read_memory(self, address, size):
+        if self.pending_writes and overlaps(self.pending_writes, ((address, size),)):
+            self.flush_writes()
+
+        return self.memory.read(address, size)
+
+    def read_memory_into(self, address, buffer):
+        if self.pending_writes and overlaps(self.pending_writes, ((address, len(buffer)),)):
+            self.flush_writes()
+
+        self.memory.read_into(address, buffer)
+
+        return buffer
+
+    def write_memory(self, address, data):
+        if self.pending_writes is not None:
+            self.pending_writes.append((address, bytes(data)))
+            return True
+
+        self.memory.write(address, data)
+
+        return True
+
+    def begin_write_batch(self):
+        if self.pending_writes is None:
+            self.pending_writes = []
+
+    def end_write_batch(self):
+        self.flush_writes()
+        self.pending_writes = None
+
+    @contextmanager
+    def write_batch(self):
+        self.begin_write_batch()
+        try:
+            yield self
+        finally:
+            self.end_write_batch()
+
+    def flush_writes(self):
+        if not self.pending_writes:
+            return True
+
+        runs = coalesce_writes(self.pending_writes)
+        self.pending_writes.clear()
+
+        for address, data in runs:
+            self.memory.write(address, data)
+
+        return True
+
+    def read_many(self, regions):
+        if self.pending_writes and overlaps(self.pending_writes, regions):
+            self.flush_writes()
+
+        return [self.memory.read(address, size) for address, size in regions]
+
+    def read_many_into(self, regions, buffer):
+        if self.pending_writes and overlaps(self.pending_writes, regions):
+            self.flush_writes()
+
+        view = memoryview(buffer).cast('B')
+
+        position = 0
+        for address, size in regions:
+            self.memory.read_into(address, view[position:position + size])
+            position += size
+
+        return buffer
+
+    def write_int(self, address, value):
+        value_bytes = value.to_bytes(4, byteorder='big')
+        if not self.write_memory(address, value_bytes):
+            print("Failed to write memory.")
+
+    def write_byte(self, address, value):
+        value_bytes = value.to_bytes(1, byteorder='big')
+        if not self.write_memory(address, value_bytes):
+            print("Failed to write memory.")
+
+    def write_float(self, address, value):
+        value = struct.pack('>f', value)
+        if not self.write_memory(address, value):
+            print("Failed to write memory.")
+
+    def read_int(self, address):
+        return int.from_bytes(self.read_memory(address, 4), byteorder='big', signed=False)
+
+    def read_float(self, address):
+        return struct.unpack('>f', self.read_memory(address, 4))[0]
@@ -0,0 +1,325 @@
+import struct
+import zlib
+
+import numpy as np
+
+from Game.MemoryProcess import GameMemory, MemoryProcess
+
+# File header: magic, version, frame count address, frame progress address, frames per chunk, number of regions,
+#   followed by an (address, size) pair for each region
+header_format = '<8sIQQII'
+region_format = '<QI'
+
+# Each chunk: compressed size, number of frames
+chunk_format = '<II'
+
+# Each recorded write: address, size, followed by the data
+write_format = '<QI'
+
+
+class TraceWriter:
+    """
+    Writes a memory trace: a snapshot of the traced regions after every frame advance, plus everything the agent wrote
+        to the game's memory before the next one.
+
+    Frames are stored in zlib compressed chunks. The first frame of every chunk is stored as is and the rest as the XOR
+        against the frame before them, which is mostly zeros because little changes between frames.
+    """
+    magic = b'RC1TRACE'
+    version = 1
+
+    def __init__(self, path, regions, frame_count_address, frame_progress_address, chunk_frames=256, level=6):
+        self.regions = list(regions)
+        self.frame_count_address = frame_count_address
+        self.frame_progress_address = frame_progress_address
+        self.chunk_frames = chunk_frames
+        self.level = level
+
+        self.frame_size = sum(size for _, size in self.regions)
+
+        self.file = open(path, 'wb')
+        self.file.write(struct.pack(header_format, self.magic, self.version, frame_count_address,
+                                    frame_progress_address, chunk_frames, len(self.regions)))
+        for address, size in self.regions:
+            self.file.write(struct.pack(region_format, address, size))
+
+        self.snapshots = np.zeros((chunk_frames, self.frame_size), dtype=np.uint8)
+        self.writes = []
+        self.frames = 0
+
+    @classmethod
+    def for_game(cls, path, game_class, **kwargs):
+        """
+        Traces the regions in the game class's `trace_regions`, e.g. `TraceWriter.for_game(path, RC1Game)`.
+        """
+        return cls(path, game_class.trace_regions, game_class.frame_count_address,
+                   game_class.frame_progress_address, **kwargs)
+
+    def add_frame(self, snapshot, writes):
+        self.snapshots[len(self.writes)] = np.frombuffer(snapshot, dtype=np.uint8)
+        self.writes.append(writes)
+        self.frames += 1
+
+        if len(self.writes) == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        frames = len(self.writes)
+        if frames == 0:
+            return
+
+        deltas = self.snapshots[:frames].copy()
+        np.bitwise_xor(deltas[1:], self.snapshots[:frames - 1], out=deltas[1:])
+
+        payload = [deltas.tobytes()]
+        for writes in self.writes:
+            payload.append(struct.pack('<I', len(writes)))
+            for address, data in writes:
+                payload.append(struct.pack(write_format, address, len(data)))
+                payload.append(data)
+
+        compressed = zlib.compress(b''.join(payload), self.level)
+
+        self.file.write(struct.pack(chunk_format, len(compressed), frames))
+        self.file.write(compressed)
+        self.file.flush()
+
+        self.writes = []
+
+    def close(self):
+        if self.file is None:
+            return
+
+        self.flush()
+        self.file.close()
+        self.file = None
+
+    def process_class(self, process_class):
+        """
+        Returns a `process_class` for a game that records everything through `process_class` processes into this
+            trace, e.g. `RC1Game(pid, process_class=writer.process_class(PreadProcess))`.
+        """
+        def open_recorder(pid, base_offset=0):
+            return TraceRecorder(process_class(pid, base_offset=base_offset), self)
+
+        return open_recorder
+
+
+class TraceRecorder:
+    """
+    Wraps a `Process` and records a frame into a `TraceWriter` every time the game's frame counter reaches the frame
+        progress we last wrote, along with every write made in between.
+    """
+    def __init__(self, process, writer):
+        self.process = process
+        self.writer = writer
+
+        self.snapshot = bytearray(writer.frame_size)
+        self.writes = []
+        self.target_frame = None
+        self.recording = False
+
+    def __getattr__(self, name):
+        # Everything we don't record goes straight to the wrapped process
+        return getattr(self.process, name)
+
+    def open_process(self):
+        opened = self.process.open_process()
+
+        if opened:
+            self.capture()
+
+        return opened
+
+    def close_process(self):
+        self.finish_frame()
+        self.recording = False
+
+        self.process.close_process()
+
+    def capture(self):
+        self.process.read_many_into(self.writer.regions, self.snapshot)
+        self.recording = True
+
+    def finish_frame(self):
+        if self.recording:
+            self.writer.add_frame(self.snapshot, self.writes)
+
+        self.writes = []
+
+    def read_memory(self, address, size):
+        data = self.process.read_memory(address, size)
+        self.check_frame(address, data)
+
+        return data
+
+    def read_memory_into(self, address, buffer):
+        self.process.read_memory_into(address, buffer)
+        self.check_frame(address, buffer)
+
+        return buffer
+
+    def check_frame(self, address, data):
+        if address == self.writer.frame_count_address and self.target_frame is not None and \
+                int.from_bytes(data[:4], byteorder='big') >= self.target_frame:
+            # The frame we asked for is done, so everything we traced is final for this frame
+            self.target_frame = None
+            self.finish_frame()
+            self.capture()
+
+    def write_memory(self, address, data):
+        self.writes.append((address, bytes(data)))
+
+        if address == self.writer.frame_progress_address:
+            self.target_frame = int.from_bytes(data, byteorder='big')
+
+        return self.process.write_memory(address, data)
+
+    def write_int(self, address, value):
+        value_bytes = value.to_bytes(4, byteorder='big')
+        if not self.write_memory(address, value_bytes):
+            print("Failed to write memory.")
+
+    def write_byte(self, address, value):
+        value_bytes = value.to_bytes(1, byteorder='big')
+        if not self.write_memory(address, value_bytes):
+            print("Failed to write memory.")
+
+    def write_float(self, address, value):
+        value = struct.pack('>f', value)
+        if not self.write_memory(address, value):
+            print("Failed to write memory.")
+
+    def read_int(self, address):
+        return int.from_bytes(self.read_memory(address, 4), byteorder='big', signed=False)
+
+
+class TraceReader:
+    """
+    Reads a trace written by `TraceWriter`. Chunks are decompressed the first time one of their frames is needed.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        magic, version, self.frame_count_address, self.frame_progress_address, self.chunk_frames, n_regions = \
+            struct.unpack_from(header_format, data)
+
+        if magic != TraceWriter.magic or version != TraceWriter.version:
+            raise ValueError(f"{path} is not a version {TraceWriter.version} memory trace")
+
+        position = struct.calcsize(header_format)
+
+        self.regions = []
+        for _ in range(n_regions):
+            self.regions.append(struct.unpack_from(region_format, data, position))
+            position += struct.calcsize(region_format)
+
+        self.frame_size = sum(size for _, size in self.regions)
+
+        # (start, end, frames) of each compressed chunk in the file
+        self.chunks = []
+        while position < len(data):
+            size, frames = struct.unpack_from(chunk_format, data, position)
+            position += struct.calcsize(chunk_format)
+
+            self.chunks.append((position, position + size, frames))
+            position += size
+
+        self.data = data
+        self.frames = sum(frames for _, _, frames in self.chunks)
+
+        self.chunk_index = None
+        self.chunk_snapshots = None
+        self.chunk_writes = None
+
+    def load_chunk(self, index):
+        start, end, frames = self.chunks[index]
+        payload = zlib.decompress(self.data[start:end])
+
+        deltas = np.frombuffer(payload, dtype=np.uint8, count=frames * self.frame_size).reshape(frames, self.frame_size)
+        self.chunk_snapshots = np.bitwise_xor.accumulate(deltas, axis=0)
+
+        self.chunk_writes = []
+        position = frames * self.frame_size
+        for _ in range(frames):
+            n_writes, = struct.unpack_from('<I', payload, position)
+            position += 4
+
+            writes = []
+            for _ in range(n_writes):
+                address, size = struct.unpack_from(write_format, payload, position)
+                position += struct.calcsize(write_format)
+
+                writes.append((address, payload[position:position + size]))
+                position += size
+
+            self.chunk_writes.append(writes)
+
+        self.chunk_index = index
+
+    def frame(self, index):
+        """
+        Returns the snapshot of the traced regions for a frame, as a uint8 array, and the writes made after it.
+        """
+        chunk, offset = divmod(index, self.chunk_frames)
+        if chunk != self.chunk_index:
+            self.load_chunk(chunk)
+
+        return self.chunk_snapshots[offset], self.chunk_writes[offset]
+
+    def process_class(self, pid, base_offset=0):
+        """
+        Can be passed as a game's `process_class` to replay this trace.
+        """
+        return ReplayProcess(pid, base_offset=base_offset, trace=self)
+
+
+class ReplayProcess(MemoryProcess):
+    """
+    `Process` that plays a trace back: reads see the traced regions as they were at the current frame, and every time
+        the frame progress is bumped we move on to the next frame. Writes land in memory like they would in the game,
+        until the next frame overwrites them. Loops back to the start at the end of the trace if `loop` is set.
+    """
+    def __init__(self, pid, base_offset=0, trace=None, loop=True):
+        size = max(address + size for address, size in trace.regions)
+        super().__init__(pid, base_offset=base_offset, memory=GameMemory(size=size))
+
+        self.trace = trace
+        self.loop = loop
+        self.finished = False
+
+        self.frame = 0
+        self.load_frame(0)
+
+        self.memory.on_write(trace.frame_progress_address, self.advance)
+
+    def load_frame(self, index):
+        snapshot, _ = self.trace.frame(index)
+
+        position = 0
+        for address, size in self.trace.regions:
+            self.memory.view[address:address + size] = snapshot[position:position + size]
+            position += size
+
+    def advance(self, memory, address, data):
+        if self.frame + 1 < self.trace.frames:
+            self.frame += 1
+        elif self.loop:
+            self.frame = 0
+        else:
+            self.finished = True
+            return
+
+        target_frame = memory.read_uint(self.trace.frame_progress_address)
+
+        self.load_frame(self.frame)
+
+        # The traced frame counter won't line up with ours after looping around, so always land where we were asked to
+        memory.write_uint(self.trace.frame_count_address, target_frame)
+
+    def recorded_writes(self):
+        """
+        The writes that were made after the current frame when the trace was recorded.
+        """
+        return self.trace.frame(self.frame)[1]
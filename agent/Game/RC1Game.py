@@ -1,9 +1,73 @@
 import ctypes
+import functools
+import os
 import struct
+import time
 
 import numpy as np
 
-from Game.Game import Game, Vector3
+from Game.FrameWaiter import FrameWaiter
+from Game.Game import Game, Vector3, affine_interp
+from Game.MemoryMap import MemoryMap, MemoryField, parse_prx_sources
+
+
+def copy_into(out, value):
+    """
+    Copies a ctypes structure, or a tuple of them, into the caller's `out`.
+    """
+    if isinstance(out, tuple):
+        for out_value, cached_value in zip(out, value):
+            ctypes.pointer(out_value)[0] = cached_value
+    else:
+        ctypes.pointer(out)[0] = value
+
+    return out
+
+
+def frame_cached(getter):
+    """
+    Serves repeated calls to a getter from the read cache until the next frame advance or write, if the game was
+        created with cache_reads. Cached values are shared between callers, so they must not be modified.
+
+    Getters that take an `out` argument fill it in instead of returning new values. Cache hits are copied into it.
+    """
+    @functools.wraps(getter)
+    def wrapper(self, *args, **kwargs):
+        if not self.cache_reads:
+            return getter(self, *args, **kwargs)
+
+        out = kwargs.pop("out", None)
+
+        key = (getter.__name__, args, frozenset(kwargs.items())) if kwargs else (getter.__name__, args)
+
+        cached = self.read_cache.get(key)
+        if cached is not None and cached[0] == self.cache_frame:
+            self.cache_hits += 1
+            return cached[1] if out is None else copy_into(out, cached[1])
+
+        self.cache_misses += 1
+
+        value = getter(self, *args, **kwargs)
+        self.read_cache[key] = (self.cache_frame, value)
+
+        return value if out is None else copy_into(out, value)
+
+    return wrapper
+
+
+def invalidates_read_cache(setter):
+    """
+    Drops everything in the read cache after a setter has written to the game's memory.
+    """
+    @functools.wraps(setter)
+    def wrapper(self, *args, **kwargs):
+        result = setter(self, *args, **kwargs)
+
+        self.invalidate_read_cache()
+
+        return result
+
+    return wrapper
 
 
 class RC1Game(Game):
@@ -64,17 +128,88 @@ class RC1Game(Game):
     joystick_r_x = 0.0
     joystick_r_y = 0.0
 
-    def __init__(self, pid):
-        super().__init__(pid)
+    player_and_camera_regions = [
+        (player_position_address, 12),
+        (player_rotation_address, 12),
+        (camera_position_address, 12),
+        (camera_rotation_address, 12),
+    ]
+
+    # Regions that memory traces capture every frame: the PRX's mailbox (frame counters, inputs, raycasts, checkpoint
+    #   and death count), the player struct, the player state and nanotech, and the camera
+    trace_regions = [
+        (0xB00000, 0xB00B00 - 0xB00000),
+        (current_planet_address, dist_from_ground_address + 4 - current_planet_address),
+        (player_state_address, 4),
+        (nanotech_address, 1),
+        (camera_forward_address, camera_rotation_address + 12 - camera_forward_address),
+    ]
+
+    prx_source_directory = os.path.join(os.path.dirname(__file__), "..", "..", "games", "rc1", "prx", "rc1")
+    prx_symbols = None
+
+    # Fields that read_state() decodes, by their names in the PRX sources, and how many elements each of them has
+    state_symbols = {
+        "custom_frame_count": 1,
+        "death_count": 1,
+        "oscillation_offset_x": 1,
+        "oscillation_offset_y": 1,
+        "collisions_distance": 64,
+        "collisions_class": 64,
+        "checkpoint_position": 1,
+        "current_planet": 1,
+        "player_pos": 1,
+        "player_rot": 1,
+        "player_neutral": 1,
+        "player_state": 1,
+        "camera_pos": 1,
+        "camera_rot": 1,
+    }
+
+    def __init__(self, pid, process_class=None, cache_reads=False, batch_writes=False, frame_waiter=None,
+                 memory=None, reuse_buffers=False):
+        super().__init__(pid, process_class=process_class, memory=memory)
+
+        # Read into buffers that are allocated once per (address, size) instead of allocating new bytes for every read
+        self.reuse_buffers = reuse_buffers
+        self.read_buffers = {}
+        self.player_and_camera_buffer = bytearray(4 * 12)
+
+        # Decides how we wait for the game in frame_advance, and keeps track of how long we wait
+        self.frame_waiter = frame_waiter if frame_waiter is not None else FrameWaiter()
+
+        # (frame count, target frame, frameskip, time) of the frame advance in progress, see begin_frame_advance
+        self.frame_advance_target = None
+
+        # Queue up writes between frames and flush them all at once right before we advance the next frame
+        self.batch_writes = batch_writes
+        if self.batch_writes:
+            self.process.begin_write_batch()
+
+        self.state_map = None
+
+        # Values read within the same frame are cached and tagged with the frame count they were read at
+        self.cache_reads = cache_reads
+        self.read_cache = {}
+        self.cache_frame = None
+        self.cache_hits = 0
+        self.cache_misses = 0
 
         self.game_key = "rc1"
 
+        # Buffer and big endian views for reading the raycasts without allocating, see read_collisions_into
+        self.collisions_buffer = bytearray(2 * 64 * 4)
+        self.collisions_regions = [(self.collisions_address, 64 * 4), (self.collisions_class_address, 64 * 4)]
+        self.collisions_distances = np.frombuffer(self.collisions_buffer, dtype='>f4', count=64)
+        self.collisions_classes = np.frombuffer(self.collisions_buffer, dtype='>u4', count=64, offset=64 * 4)
+
         self.collisions_render = np.zeros((8*4, 8*4))
 
         # Init mobys_render as -1
         self.mobys_render = np.zeros((8*4, 8*4))
         self.mobys_render.fill(-1)
 
+    @invalidates_read_cache
     def set_controller_input(self, controller_input, left_joy_x, left_joy_y, right_joy_x, right_joy_y):
         self.process.write_int(self.input_address, controller_input)
 
@@ -103,46 +238,108 @@ class RC1Game(Game):
 
         self.process.write_int(self.joystick_address, joystick)
 
+    @invalidates_read_cache
     def set_item_unlocked(self, item_id):
         self.process.write_byte(self.items_address + item_id, 1)
 
-    def get_current_frame_count(self):
-        frames_buffer = self.process.read_memory(self.frame_count_address, 4)
-        frame_count = 0
-        if frames_buffer:
-            frame_count = int.from_bytes(frames_buffer, byteorder='big', signed=False)
+    def open_process(self):
+        # Never cached, it replaces the process every time
+        opened = super().open_process()
 
-        return frame_count
+        if self.batch_writes:
+            self.process.begin_write_batch()
 
-    def get_player_state(self):
-        player_state_buffer = self.process.read_memory(self.player_state_address, 4)
-        player_state = 0
-        if player_state_buffer:
-            player_state = int.from_bytes(player_state_buffer, byteorder='big', signed=False)
+        # Whatever we read before was from the old process
+        self.invalidate_read_cache()
+
+        return opened
 
-        return player_state
+    def invalidate_read_cache(self):
+        """
+        Drops all cached reads, for when something outside of this class changes the game's memory or we wait for the
+            game without advancing frames.
+        """
+        self.read_cache.clear()
 
+    @frame_cached
+    def read_state(self):
+        """
+        Reads every field in `state_symbols` with one vectored read and returns them as a structured record, e.g.
+            `state["player_pos"]` or `state["collisions_distance"]`. The record is overwritten by the next call.
+        """
+        if self.state_map is None:
+            if RC1Game.prx_symbols is None:
+                RC1Game.prx_symbols = parse_prx_sources(self.prx_source_directory)
+
+            self.state_map = MemoryMap.from_symbols(RC1Game.prx_symbols, self.state_symbols, extra_fields=[
+                # Not declared anywhere in the PRX
+                MemoryField("dist_from_ground", self.dist_from_ground_address, ">f4", 1),
+            ])
+
+        return self.state_map.read(self.process)
+
+    def read_bytes(self, address, size):
+        """
+        Reads from the game's memory, into a buffer we reuse for every read of this address if the game was created
+            with reuse_buffers. That buffer is overwritten by the next read of the address, so decode it right away.
+        """
+        if not self.reuse_buffers:
+            return self.process.read_memory(address, size)
+
+        buffer = self.read_buffers.get((address, size))
+        if buffer is None:
+            buffer = self.read_buffers[(address, size)] = bytearray(size)
+
+        return self.process.read_memory_into(address, buffer)
+
+    def read_uint(self, address):
+        buffer = self.read_bytes(address, 4)
+        if not buffer:
+            return 0
+
+        return int.from_bytes(buffer, byteorder='big', signed=False)
+
+    def read_float(self, address):
+        buffer = self.read_bytes(address, 4)
+        if not buffer:
+            return 0.0
+
+        return struct.unpack('>f', buffer)[0]
+
+    def get_current_frame_count(self):
+        return self.read_uint(self.frame_count_address)
+
+    @frame_cached
+    def get_player_state(self):
+        return self.read_uint(self.player_state_address)
+
+    @invalidates_read_cache
     def set_nanotech(self, nanotech):
         """
         Nanotech is health in Ratchet & Clank.
         """
         self.process.write_byte(self.nanotech_address, nanotech)
 
+    @invalidates_read_cache
     def set_player_state(self, state):
         self.process.write_int(self.player_state_address, state)
 
 
+    @frame_cached
     def get_distance_from_ground(self):
-        return self.process.read_float(self.dist_from_ground_address)
+        return self.read_float(self.dist_from_ground_address)
 
+    @invalidates_read_cache
     def set_player_speed(self, speed):
         self.process.write_float(self.player_speed_address, speed)
 
+    @frame_cached
     def get_player_speed(self):
-        return self.process.read_float(self.player_speed_address)
+        return self.read_float(self.player_speed_address)
 
+    @frame_cached
     def get_current_level(self):
-        return self.process.read_int(self.current_planet_address)
+        return self.read_uint(self.current_planet_address)
 
     def get_skid_position(self) -> Vector3:
         if self.skid_address == 0:
@@ -165,97 +362,62 @@ class RC1Game(Game):
 
         return skid_position
 
+    @invalidates_read_cache
     def set_player_position(self, position: Vector3):
-        position_x = struct.pack('>f', position.x)
-        position_y = struct.pack('>f', position.y)
-        position_z = struct.pack('>f', position.z)
-
-        self.process.write_memory(self.player_position_address, position_x)
-        self.process.write_memory(self.player_position_address + 4, position_y)
-        self.process.write_memory(self.player_position_address + 8, position_z)
+        self.process.write_memory(self.player_position_address, struct.pack('>3f', position.x, position.y, position.z))
 
+    @invalidates_read_cache
     def set_player_rotation(self, rotation: Vector3):
-        rotation_x = struct.pack('>f', rotation.x)
-        rotation_y = struct.pack('>f', rotation.y)
-        rotation_z = struct.pack('>f', rotation.z)
+        self.process.write_memory(self.player_rotation_address, struct.pack('>3f', rotation.x, rotation.y, rotation.z))
 
-        self.process.write_memory(self.player_rotation_address, rotation_x)
-        self.process.write_memory(self.player_rotation_address + 4, rotation_y)
-        self.process.write_memory(self.player_rotation_address + 8, rotation_z)
-
-    def get_player_position(self) -> Vector3:
+    @frame_cached
+    def get_player_position(self, out=None) -> Vector3:
         """Player position is stored in big endian, so we need to convert it to little endian."""
-        player_position_buffer = self.process.read_memory(self.player_position_address, 12)
-
-        if player_position_buffer is None:
-            return Vector3()
-
-        # Flip each 4 bytes to convert from big endian to little endian
-        player_position_buffer = (player_position_buffer[3::-1] +
-                                  player_position_buffer[7:3:-1] +
-                                  player_position_buffer[11:7:-1])
-
-        player_position = Vector3()
-        ctypes.memmove(ctypes.byref(player_position), player_position_buffer, ctypes.sizeof(player_position))
+        return Vector3.from_big_endian(self.read_bytes(self.player_position_address, 12), out=out)
 
-        return player_position
-
-    def get_player_rotation(self) -> Vector3:
+    @frame_cached
+    def get_player_rotation(self, out=None) -> Vector3:
         """Player rotation is stored in big endian, so we need to convert it to little endian."""
-        player_rotation_buffer = self.process.read_memory(self.player_rotation_address, 12)
-
-        if player_rotation_buffer is None:
-            return Vector3()
-
-        # Flip each 4 bytes to convert from big endian to little endian
-        player_rotation_buffer = (player_rotation_buffer[3::-1] +
-                                  player_rotation_buffer[7:3:-1] +
-                                  player_rotation_buffer[11:7:-1])
-
-        player_rotation = Vector3()
-        ctypes.memmove(ctypes.byref(player_rotation), player_rotation_buffer, ctypes.sizeof(player_rotation))
-
-        return player_rotation
-
-    def get_camera_position(self) -> Vector3:
-        camera_position_buffer = self.process.read_memory(self.camera_position_address, 12)
-
-        if camera_position_buffer is None:
-            return Vector3()
-
-        # Flip each 4 bytes to convert from big endian to little endian
-        camera_position_buffer = (camera_position_buffer[3::-1] +
-                                  camera_position_buffer[7:3:-1] +
-                                  camera_position_buffer[11:7:-1])
-
-        camera_position = Vector3()
-        ctypes.memmove(ctypes.byref(camera_position), camera_position_buffer, ctypes.sizeof(camera_position))
+        return Vector3.from_big_endian(self.read_bytes(self.player_rotation_address, 12), out=out)
 
-        return camera_position
+    @frame_cached
+    def get_camera_position(self, out=None) -> Vector3:
+        return Vector3.from_big_endian(self.read_bytes(self.camera_position_address, 12), out=out)
 
-    def get_camera_rotation(self) -> Vector3:
-        camera_rotation_buffer = self.process.read_memory(self.camera_rotation_address, 12)
+    @frame_cached
+    def get_camera_rotation(self, out=None) -> Vector3:
+        return Vector3.from_big_endian(self.read_bytes(self.camera_rotation_address, 12), out=out)
 
-        if camera_rotation_buffer is None:
-            return Vector3()
+    @frame_cached
+    def get_player_and_camera(self, out=None):
+        """
+        Gets the player position and rotation and the camera position and rotation with a single vectored read.
+        Fills in the four vectors in `out` if given.
+        """
+        if out is None:
+            out = (Vector3(), Vector3(), Vector3(), Vector3())
 
-        # Flip each 4 bytes to convert from big endian to little endian
-        camera_rotation_buffer = (camera_rotation_buffer[3::-1] +
-                                  camera_rotation_buffer[7:3:-1] +
-                                  camera_rotation_buffer[11:7:-1])
+        if self.reuse_buffers:
+            buffer = self.process.read_many_into(self.player_and_camera_regions, self.player_and_camera_buffer)
 
-        camera_rotation = Vector3()
-        ctypes.memmove(ctypes.byref(camera_rotation), camera_rotation_buffer, ctypes.sizeof(camera_rotation))
+            for i, vector in enumerate(out):
+                Vector3.from_big_endian(buffer, offset=i * 12, out=vector)
+        else:
+            for buffer, vector in zip(self.process.read_many(self.player_and_camera_regions), out):
+                Vector3.from_big_endian(buffer, out=vector)
 
-        return camera_rotation
+        return out
 
+    @frame_cached
     def get_camera_vectors(self):
         """
         Gets and returns the forward, right, and up vectors of the camera.
         """
-        camera_forward_buffer = self.process.read_memory(self.camera_forward_address, 12)
-        camera_right_buffer = self.process.read_memory(self.camera_right_address, 12)
-        camera_up_buffer = self.process.read_memory(self.camera_up_address, 12)
+        camera_forward_buffer, camera_right_buffer, camera_up_buffer = self.process.read_many([
+            (self.camera_forward_address, 12),
+            (self.camera_right_address, 12),
+            (self.camera_up_address, 12),
+        ])
 
         if camera_forward_buffer is None or camera_right_buffer is None or camera_up_buffer is None:
             return Vector3(), Vector3(), Vector3()
@@ -283,95 +445,90 @@ class RC1Game(Game):
 
         return camera_forward, camera_right, camera_up
 
+    @frame_cached
     def get_collisions(self, normalized=True):
-        collisions = []
-        classes = []
+        """
+        Reads the 8x8 raycast grid and returns the 64 distances followed by the 64 classes as one flat array.
+        """
+        distances_buffer, classes_buffer = self.process.read_many([
+            (self.collisions_address, 64 * 4),
+            (self.collisions_class_address, 64 * 4),
+        ])
 
-        # 8 rows, 8 columns
-        for i in range(8):
-            for j in range(8):
-                offset = 4 * (i * 8 + j)
+        distances = np.frombuffer(distances_buffer, dtype='>f4')
 
-                collision_address = self.collisions_address + offset
-                collision_value = self.process.read_float(collision_address)
+        # Classes are read unsigned like read_int does, so "no hit" (-1 and -2) are large numbers here
+        classes = np.frombuffer(classes_buffer, dtype='>u4')
 
-                class_address = self.collisions_class_address + offset
-                class_value = self.process.read_int(class_address)
+        collisions = np.empty(128, dtype=np.float64)
+        if normalized:
+            affine_interp(distances, [-32, 64], [-1, 1], out=collisions[:64])
+            affine_interp(classes, [-2, 4096], [-1, 1], out=collisions[64:])
+        else:
+            collisions[:64] = distances
+            collisions[64:] = classes
 
-                if normalized:
-                    collision_value = np.interp(collision_value, [-32, 64], [-1, 1])
-                    class_value = np.interp(class_value, [-2, 4096], [-1, 1])
+        return collisions
 
-                collisions.append(collision_value)
-                classes.append(class_value)
+    def read_collisions_into(self, out):
+        """
+        Reads the raw raycast distances into out[:64] and the classes into out[64:128], like
+            get_collisions(normalized=False) but into a buffer the caller owns.
+        """
+        self.process.read_many_into(self.collisions_regions, self.collisions_buffer)
 
-        return [*collisions, *classes]
+        np.copyto(out[:64], self.collisions_distances)
+        np.copyto(out[64:128], self.collisions_classes)
 
-    def get_collisions_oscillated(self, normalized=True):
-        collisions = []
-        classes = []
+        return out
 
-        # 8 rows, 8 columns
-        for i in range(8):
-            for j in range(8):
-                offset = 4 * (i * 8 + j)
+    @frame_cached
+    def get_collision_grids(self, *grids):
+        """
+        Reads 8x8 raycast grids, given as (address, dtype) pairs, with a single vectored read.
+        Returns a native endian (8, 8) array for each grid.
+        """
+        buffers = self.process.read_many([(address, 64 * 4) for address, _ in grids])
 
-                collision_address = self.collisions_address + offset
-                collision_value = self.process.read_float(collision_address)
+        return tuple(np.frombuffer(buffer, dtype=dtype).reshape(8, 8).astype(np.dtype(dtype).newbyteorder('='))
+                     for buffer, (_, dtype) in zip(buffers, grids))
 
-                class_address = self.collisions_class_address + offset
-                class_value = self.process.read_int(class_address)
+    def get_collisions_oscillated(self, normalized=True):
+        collisions, classes = self.get_collision_grids(
+            (self.collisions_address, '>f4'),
+            (self.collisions_class_address, '>u4'),
+        )
 
-                if normalized:
-                    collision_value = np.interp(collision_value, [-32, 64], [-1, 1])
-                    class_value = np.interp(class_value, [-2, 4096], [-1, 1])
+        if normalized:
+            collisions = affine_interp(collisions, [-32, 64], [-1, 1])
+            classes = affine_interp(classes, [-2, 4096], [-1, 1])
 
-                (oscillation_offset_x, oscillation_offset_y) = self.get_oscillation_offset()
+        (oscillation_offset_x, oscillation_offset_y) = self.get_oscillation_offset()
 
-                x_index = int(i * 4 + oscillation_offset_x)
-                y_index = int(j * 4 + oscillation_offset_y)
+        # Each of the 8x8 cells lands in a 4x4 block of the render grids, offset by the current oscillation
+        x_indices = (np.arange(8) * 4 + oscillation_offset_x).astype(int)
+        y_indices = (np.arange(8) * 4 + oscillation_offset_y).astype(int)
 
-                self.collisions_render[x_index, y_index] = collision_value
-                self.mobys_render[x_index, y_index] = class_value
+        self.collisions_render[x_indices[:, None], y_indices] = collisions
+        self.mobys_render[x_indices[:, None], y_indices] = classes
 
         # Flatten and return self.collisions_render and self.mobys_render
-        return [*self.collisions_render.copy().flatten(), *self.mobys_render.copy().flatten()]
+        return np.concatenate((self.collisions_render.ravel(), self.mobys_render.ravel()))
 
+    @frame_cached
     def get_collisions_with_normals(self):
-        collisions = []
-        normals_x = []
-        normals_y = []
-        normals_z = []
-        classes = []
-
-        # 8 rows, 8 columns
-        for i in range(8):
-            for j in range(8):
-                offset = 4 * (i * 8 + j)
-
-                collision_address = self.collisions_address + offset
-                collision_value = self.process.read_float(collision_address)
-
-                normal_x_address = self.collisions_normals_x + offset
-                normal_x = self.process.read_float(normal_x_address)
-
-                normal_y_address = self.collisions_normals_y + offset
-                normal_y = self.process.read_float(normal_y_address)
-
-                normal_z_address = self.collisions_normals_z + offset
-                normal_z = self.process.read_float(normal_z_address)
-
-                class_address = self.collisions_class_address + offset
-                class_value = self.process.read_int(class_address)
-
-                collisions.append(collision_value)
-                normals_x.append(normal_x)
-                normals_y.append(normal_y)
-                normals_z.append(normal_z)
-                classes.append(class_value)
-
-        return (collisions, classes, normals_x, normals_y, normals_z)
-
+        """
+        Returns the raycast distances, classes and the X, Y and Z components of the hit normals as (8, 8) arrays.
+        """
+        return self.get_collision_grids(
+            (self.collisions_address, '>f4'),
+            (self.collisions_class_address, '>u4'),
+            (self.collisions_normals_x, '>f4'),
+            (self.collisions_normals_y, '>f4'),
+            (self.collisions_normals_z, '>f4'),
+        )
+
+    @frame_cached
     def get_oscillation_offset(self):
         return (int(self.process.read_float(self.oscillation_offset_x_address)),
                 (self.process.read_float(self.oscillation_offset_y_address)))
@@ -392,9 +549,11 @@ class RC1Game(Game):
         return (coll_forward, coll_up, coll_down, coll_left, coll_right,
                 coll_class_forward, coll_class_up, coll_class_down, coll_class_left, coll_class_right)
 
+    @frame_cached
     def get_death_count(self):
-        return self.process.read_int(self.death_count_address)
+        return self.read_uint(self.death_count_address)
 
+    @invalidates_read_cache
     def start_hoverboard_race(self):
         """
         To start the hoverboard race, we have to find a specific NPC in the game and set two of its properties to 3.
@@ -404,25 +563,61 @@ class RC1Game(Game):
         self.process.write_byte(hoverboard_lady_ptr + 0x20, 3)
         self.process.write_byte(hoverboard_lady_ptr + 0xbc, 3)
 
+    @invalidates_read_cache
     def set_checkpoint_position(self, position: Vector3):
-        position_x = struct.pack('>f', position.x)
-        position_y = struct.pack('>f', position.y)
-        position_z = struct.pack('>f', position.z)
+        position = struct.pack('>3f', position.x, position.y, position.z)
 
-        self.process.write_memory(self.checkpoint_position_address, position_x)
-        self.process.write_memory(self.checkpoint_position_address + 4, position_y)
-        self.process.write_memory(self.checkpoint_position_address + 8, position_z)
+        self.process.write_memory(self.checkpoint_position_address, position)
 
+    @invalidates_read_cache
     def set_should_render(self, should_render):
         self.process.write_int(self.should_render_address, 1 if should_render else 0)
 
     def frame_advance(self, frameskip=1):
+        self.begin_frame_advance(frameskip)
+
+        return self.finish_frame_advance()
+
+    def begin_frame_advance(self, frameskip=1):
+        """
+        Lets the game run `frameskip` frames without waiting for them, so we can do something else, like stepping other
+            games, until we call finish_frame_advance.
+        """
         frame_count = self.get_current_frame_count()
         target_frame = frame_count + frameskip
 
-        self.process.write_int(self.frame_progress_address, target_frame)
+        if self.batch_writes:
+            # Everything we've queued up for this frame has to land before we let the game run, so the frame progress
+            #   is written on its own after the batch
+            self.process.end_write_batch()
+            self.process.write_int(self.frame_progress_address, target_frame)
+            self.process.begin_write_batch()
+        else:
+            self.process.write_int(self.frame_progress_address, target_frame)
+
+        self.frame_advance_target = (frame_count, target_frame, frameskip, time.perf_counter())
+
+    def frame_advance_ready(self):
+        """
+        Whether the game is done with the frames we asked for in begin_frame_advance, without waiting for them.
+        """
+        return self.get_current_frame_count() >= self.frame_advance_target[1]
+
+    def finish_frame_advance(self):
+        """
+        Waits for the game to finish the frames we asked for in begin_frame_advance. Returns False if it never did.
+        """
+        frame_count, target_frame, frameskip, started = self.frame_advance_target
+
+        frame_count = self.frame_waiter.wait(self.get_current_frame_count, target_frame, frame_count, frameskip,
+                                             started=started)
+
+        if frame_count is None:
+            # The game hasn't advanced in a long time, it has most likely crashed or stalled
+            self.must_restart = True
+            return False
 
-        while frame_count < target_frame:
-            frame_count = self.get_current_frame_count()
+        # Everything in the read cache is from an older frame now
+        self.cache_frame = frame_count
 
         return True
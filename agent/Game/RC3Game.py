@@ -1,9 +1,11 @@
 import ctypes
+import os
 
 import numpy as np
 
 from .WindowsProcess import Process
 from .Game import Game, Vector3
+from .MemoryMap import MemoryMap, MemoryField, parse_prx_sources
 
 
 class RC3Game(Game):
@@ -32,11 +34,45 @@ class RC3Game(Game):
 
     vidcomic_state_address = 0xda5122
 
+    prx_source_directory = os.path.join(os.path.dirname(__file__), "..", "..", "games", "rc3", "prx", "rc3")
+    prx_symbols = None
+
+    # Fields that read_state() decodes, by their names in the PRX sources, and how many elements each of them has
+    state_symbols = {
+        "custom_frame_count": 1,
+        "current_level": 1,
+        "game_state": 1,
+    }
+
     def __init__(self, process_name="rpcs3.exe"):
         super().__init__(process_name)
 
         self.game_key = "rc3"
 
+        self.state_map = None
+
+    def read_state(self):
+        """
+        Reads every field in `state_symbols`, plus the hero and collision info, with one vectored read and returns
+            them as a structured record. The record is overwritten by the next call.
+        """
+        if self.state_map is None:
+            if RC3Game.prx_symbols is None:
+                RC3Game.prx_symbols = parse_prx_sources(self.prx_source_directory)
+
+            self.state_map = MemoryMap.from_symbols(RC3Game.prx_symbols, self.state_symbols, extra_fields=[
+                # The PRX interleaves the distance and type of each of the 16 rays
+                MemoryField("collision_info", self.collision_info_address,
+                            np.dtype([("distance", ">f4"), ("type", ">i4")]), 16),
+                MemoryField("hero_position", self.hero_position_address, ">f4", 3),
+                MemoryField("hero_rotation", self.hero_rotation_address, ">f4", 3),
+                MemoryField("hero_state", self.hero_state_address, ">i4", 1),
+                MemoryField("health", self.health_address, ">i4", 1),
+                MemoryField("ammo", self.ammo_address, ">i4", 1),
+            ])
+
+        return self.state_map.read(self.process)
+
     def get_hero_position(self) -> Vector3:
         """Player position is stored in big endian, so we need to convert it to little endian."""
         hero_position_buffer = self.process.read_memory(self.hero_position_address, 12)
@@ -1,9 +1,12 @@
 import ctypes
 import ctypes.wintypes as wintypes
 import struct
+from contextlib import contextmanager
 
 import psutil
 
+from Game.WriteBatch import coalesce_writes, overlaps
+
 # Windows API functions
 OpenProcess = ctypes.windll.kernel32.OpenProcess
 ReadProcessMemory = ctypes.windll.kernel32.ReadProcessMemory
@@ -21,6 +24,9 @@ class Process:
         self.process_handle = None
         self.base_offset = base_offset
 
+        # Writes are queued here instead of written right away while a write batch is open
+        self.pending_writes = None
+
     def open_process(self):
         self.process = None
 
@@ -44,6 +50,9 @@ class Process:
         CloseHandle(self.process_handle)
 
     def read_memory(self, address, size):
+        if self.pending_writes and overlaps(self.pending_writes, ((address, size),)):
+            self.flush_writes()
+
         buffer = ctypes.create_string_buffer(size)
         bytes_read = ctypes.c_size_t()
         address = ctypes.c_void_p(self.base_offset + address)
@@ -53,7 +62,26 @@ class Process:
         else:
             return None
 
+    def read_memory_into(self, address, buffer):
+        """
+        Reads len(buffer) bytes into a writable buffer instead of allocating a new one.
+        """
+        if self.pending_writes and overlaps(self.pending_writes, ((address, len(buffer)),)):
+            self.flush_writes()
+
+        destination = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+        address = ctypes.c_void_p(self.base_offset + address)
+
+        if ReadProcessMemory(self.process_handle, address, destination, len(buffer), None):
+            return buffer
+        else:
+            return None
+
     def write_memory(self, address, data):
+        if self.pending_writes is not None:
+            self.pending_writes.append((address, bytes(data)))
+            return True
+
         size = len(data)
         c_data = ctypes.create_string_buffer(data)
         bytes_written = ctypes.c_size_t()
@@ -63,6 +91,67 @@ class Process:
 
         return result
 
+    def begin_write_batch(self):
+        """
+        Queues writes from now on instead of writing them right away, until flush_writes() or end_write_batch().
+        """
+        if self.pending_writes is None:
+            self.pending_writes = []
+
+    def end_write_batch(self):
+        self.flush_writes()
+        self.pending_writes = None
+
+    @contextmanager
+    def write_batch(self):
+        self.begin_write_batch()
+        try:
+            yield self
+        finally:
+            self.end_write_batch()
+
+    def flush_writes(self):
+        """
+        Merges the queued writes into contiguous runs and writes them with one WriteProcessMemory call per run.
+        """
+        if not self.pending_writes:
+            return True
+
+        runs = coalesce_writes(self.pending_writes)
+        self.pending_writes = []
+
+        result = True
+        for address, data in runs:
+            c_data = ctypes.create_string_buffer(bytes(data), len(data))
+            bytes_written = ctypes.c_size_t()
+            remote_address = ctypes.c_void_p(self.base_offset + address)
+
+            result = WriteProcessMemory(self.process_handle, remote_address, c_data, len(data),
+                                        ctypes.byref(bytes_written)) and result
+
+        return result
+
+    def read_many(self, regions):
+        """
+        Reads many (address, size) regions. Windows has no vectored ReadProcessMemory, so this is one call per region.
+        """
+        if self.pending_writes and overlaps(self.pending_writes, regions):
+            self.flush_writes()
+
+        return [self.read_memory(address, size) for address, size in regions]
+
+    def read_many_into(self, regions, buffer):
+        view = memoryview(buffer).cast('B')
+
+        position = 0
+        for address, size in regions:
+            data = self.read_memory(address, size)
+            if data is not None:
+                view[position:position + size] = data
+            position += size
+
+        return buffer
+
     def write_int(self, address, value):
         value_bytes = value.to_bytes(4, byteorder='big')
         if not self.write_memory(address, value_bytes):
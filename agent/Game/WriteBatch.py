@@ -0,0 +1,39 @@
+import bisect
+
+
+def coalesce_writes(writes):
+    """
+    Merges queued (address, data) writes into as few contiguous (address, bytearray) runs as possible. Adjacent and
+        overlapping writes end up in the same run, and where writes overlap the one queued last wins.
+    """
+    runs = []
+    for address, data in sorted(writes, key=lambda write: write[0]):
+        end = address + len(data)
+
+        if runs and address <= runs[-1][1]:
+            runs[-1][1] = max(runs[-1][1], end)
+        else:
+            runs.append([address, end])
+
+    starts = [start for start, _ in runs]
+    buffers = [bytearray(end - start) for start, end in runs]
+
+    # Apply the writes in the order they were queued so later writes overwrite earlier ones
+    for address, data in writes:
+        run = bisect.bisect_right(starts, address) - 1
+        offset = address - starts[run]
+        buffers[run][offset:offset + len(data)] = data
+
+    return list(zip(starts, buffers))
+
+
+def overlaps(writes, regions):
+    """
+    Whether any of the queued (address, data) writes touches any of the (address, size) regions.
+    """
+    for address, data in writes:
+        for region_address, size in regions:
+            if address < region_address + size and region_address < address + len(data):
+                return True
+
+    return False
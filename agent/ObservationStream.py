@@ -0,0 +1,114 @@
+import torch
+
+
+class ObservationStream:
+    """
+    The observations of one worker, one row per step, from which we build the (sequence_length, features) window the
+        worker saw at any step, so workers only have to send the newest observation of every step.
+
+    Rows are appended in the order the worker steps. Every time the stream isn't continuous, at the start of an
+        episode or after rows we never got, we first append `sequence_length - 1` zero rows. The window that ends at any
+        row is then the `sequence_length` rows up to it, zero-padded at the start of the episode like the worker's
+        SequenceWindow, and `windows` can be a strided view of all of them at once.
+    """
+    def __init__(self, sequence_length, features, capacity=1024, dtype=torch.bfloat16, device="cpu"):
+        self.sequence_length = sequence_length
+        self.features = features
+
+        self.rows = torch.zeros((max(capacity, sequence_length), features), dtype=dtype, device=device)
+        self.length = 0
+
+        # (episode, step) of the last row
+        self.last = None
+
+    def __len__(self):
+        return self.length
+
+    def reserve(self, rows):
+        if self.length + rows <= len(self.rows):
+            return
+
+        capacity = len(self.rows)
+        while capacity < self.length + rows:
+            capacity *= 2
+
+        grown = torch.zeros((capacity, self.features), dtype=self.rows.dtype, device=self.rows.device)
+        grown[:self.length] = self.rows[:self.length]
+
+        self.rows = grown
+
+    def extend(self, states, episode, step):
+        """
+        Appends the observations of consecutive steps of an episode, starting at `step`, and returns the index of the
+            first one.
+        """
+        padding = 0 if self.last == (episode, step - 1) else self.sequence_length - 1
+
+        self.reserve(padding + len(states))
+
+        self.rows[self.length:self.length + padding].zero_()
+        self.length += padding
+
+        index = self.length
+        self.rows[index:index + len(states)] = states
+        self.length += len(states)
+
+        self.last = (episode, step + len(states) - 1)
+
+        return index
+
+    def append(self, state, episode, step):
+        """
+        Appends the observation of `step` of `episode` and returns its index.
+        """
+        return self.extend(state.unsqueeze(dim=0), episode, step)
+
+    def append_many(self, states, episodes, steps):
+        """
+        Appends observations with the episode and step of each, which can span episodes and gaps, and returns the index
+            of each.
+        """
+        episodes = torch.as_tensor(episodes).tolist()
+        steps = torch.as_tensor(steps).tolist()
+
+        indices = []
+
+        # Extend by each run of consecutive steps
+        start = 0
+        for end in range(1, len(steps) + 1):
+            if end < len(steps) and episodes[end] == episodes[start] and steps[end] == steps[end - 1] + 1:
+                continue
+
+            index = self.extend(states[start:end], episodes[start], steps[start])
+            indices.extend(range(index, index + end - start))
+
+            start = end
+
+        return indices
+
+    @property
+    def windows(self):
+        """
+        (len(self) - sequence_length + 1, sequence_length, features) view of every window in the stream. The window
+            that ends at row `index` is windows[index - sequence_length + 1].
+        """
+        return self.rows.as_strided((max(self.length - self.sequence_length + 1, 0), self.sequence_length,
+                                     self.features), (self.features, self.features, 1))
+
+    def gather(self, indices):
+        """
+        Copies the windows that end at each of the rows in `indices` into a (len(indices), sequence_length, features)
+            batch.
+        """
+        indices = torch.as_tensor(indices, dtype=torch.int64, device=self.rows.device)
+
+        return self.windows[indices - (self.sequence_length - 1)]
+
+    def trim(self):
+        """
+        Drops all but the rows the next window could still need, which moves them to the start of the stream.
+        """
+        keep = min(self.length, self.sequence_length - 1)
+
+        self.rows[:keep] = self.rows[self.length - keep:self.length].clone()
+        self.length = keep
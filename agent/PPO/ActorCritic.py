@@ -3,6 +3,30 @@ import torch.nn as nn
 from torch.distributions import Normal
 import torch.nn.functional as F
 
+from PPO.RecurrentStateStore import RecurrentState
+
+
+def run_lstm(lstm, x, hidden_state, cell_state):
+    """
+    Runs `x` through `lstm` like `lstm(x, (hidden_state, cell_state))`. A single step goes through torch.lstm_cell one
+        layer at a time instead, which skips most of nn.LSTM's per call overhead on the CPU. The results can differ from
+        nn.LSTM's in the last bit of bfloat16.
+    """
+    if x.shape[1] != 1 or lstm.training:
+        return lstm(x, (hidden_state, cell_state))
+
+    x = x[:, 0, :]
+    hidden_states, cell_states = [], []
+
+    for layer in range(lstm.num_layers):
+        x, cell = torch.lstm_cell(x, (hidden_state[layer], cell_state[layer]),
+                                  getattr(lstm, f"weight_ih_l{layer}"), getattr(lstm, f"weight_hh_l{layer}"),
+                                  getattr(lstm, f"bias_ih_l{layer}"), getattr(lstm, f"bias_hh_l{layer}"))
+        hidden_states.append(x)
+        cell_states.append(cell)
+
+    return x.unsqueeze(dim=1), (torch.stack(hidden_states), torch.stack(cell_states))
+
 
 class ActorCritic(nn.Module):
     def __init__(self, state_dim, action_dim, log_std, device='cpu'):
@@ -17,24 +41,59 @@ class ActorCritic(nn.Module):
     def forward(self):
         raise NotImplementedError
 
-    def act(self, state, mask=None, hidden_state=None, cell_state=None):
-        if cell_state is None or hidden_state is None:
-            hidden_state = self.actor.hidden_state
-            cell_state = self.actor.cell_state
+    def initial_state(self, batch_size=1):
+        """
+        The recurrent state at the start of an episode, for a batch of `batch_size`.
+        """
+        return RecurrentState(*(torch.zeros(self.actor.num_layers, batch_size, self.actor.hidden_dims,
+                                            dtype=torch.bfloat16, device=self.device) for _ in RecurrentState._fields))
+
+    def act(self, state, mask=None, recurrent_state=None):
+        """
+        Chooses actions for a batch of state windows, starting the actor from `recurrent_state`, or from the start of
+            an episode without it. Returns the actions, their log probabilities, the state values and the new
+            recurrent state.
+        """
+        if recurrent_state is None:
+            recurrent_state = self.initial_state(state.shape[0])
 
         action, probs, mu, log_std, (hidden_states, cell_states) = \
-            self.actor.get_action(state, None, mask=mask, hidden_state=hidden_state, cell_state=cell_state)
+            self.actor.get_action(state, None, mask=mask, hidden_state=recurrent_state.actor_hidden,
+                                  cell_state=recurrent_state.actor_cell)
 
         action_logprob = probs.log_prob(action)
 
         state_value = self.critic(state, hidden_states=hidden_states, cell_states=cell_states)
 
-        return action.detach(), action_logprob.detach(), state_value.detach()
+        recurrent_state = recurrent_state._replace(actor_hidden=hidden_states, actor_cell=cell_states)
+
+        return action.detach(), action_logprob.detach(), state_value.detach(), recurrent_state
+
+    def act_step(self, state, mask=None, recurrent_state=None):
+        """
+        Like `act`, but only runs the newest observation in `state` through the actor and the critic, continuing from
+            the recurrent state they were left in by the last step, instead of running the whole window through them
+            every step. Use benchmarks/incremental_inference.py to see how far it drifts from `act`.
+        """
+        if recurrent_state is None:
+            recurrent_state = self.initial_state(state.shape[0])
+
+        action, probs, mu, log_std, (actor_hidden, actor_cell) = \
+            self.actor.get_action(state[:, -1:, :], None, mask=mask, hidden_state=recurrent_state.actor_hidden,
+                                  cell_state=recurrent_state.actor_cell)
+
+        action_logprob = probs.log_prob(action)
+
+        state_value, (critic_hidden, critic_cell) = \
+            self.critic.step(state[:, -1:, :], recurrent_state.critic_hidden, recurrent_state.critic_cell)
+
+        recurrent_state = RecurrentState(actor_hidden, actor_cell, critic_hidden, critic_cell)
+
+        return action.detach(), action_logprob.detach(), state_value.detach(), recurrent_state
 
     def evaluate(self, state, action, mask=None, hidden_state=None, cell_state=None):
         if cell_state is None or hidden_state is None:
-            hidden_state = self.actor.hidden_state
-            cell_state = self.actor.cell_state
+            hidden_state, cell_state, _, _ = self.initial_state(state.shape[0])
 
         _, probs, action_mean, _, (hidden_states, cell_states) = \
             self.actor.get_action(state, action, mask=mask, hidden_state=hidden_state, cell_state=cell_state)
@@ -46,9 +105,6 @@ class ActorCritic(nn.Module):
 
         return logprobs, state_values, dist_entropy
 
-    def start_new_episode(self):
-        self.actor.reset_lstm()
-
 
 class Actor(nn.Module):
     def __init__(self, feature_count, action_dim, log_std=-3, max_log_std=0.45, device='cpu'):
@@ -109,13 +165,9 @@ class Actor(nn.Module):
         self.raycast.apply(init_weights)
         self.decoder.apply(init_weights)
 
-    def reset_lstm(self):
-        self.hidden_state = torch.zeros(self.num_layers, 1, self.hidden_dims, dtype=torch.bfloat16, device=self.device)
-        self.cell_state = torch.zeros(self.num_layers, 1, self.hidden_dims, dtype=torch.bfloat16, device=self.device)
-
-    def forward(self, state, mask=None, hidden_state=None, cell_state=None):
+    def encode(self, state):
         """
-        Input shape: (batch_size, sequence_length, feature_count)
+        Input shape: (batch_size, sequence_length, feature_count), output shape: (batch_size, sequence_length, hidden_dims)
         """
         # Encode the static features of the state
         x = F.leaky_relu(self.fc0(state[:, :, :self.feature_count - 128]), 0.01)
@@ -127,9 +179,15 @@ class Actor(nn.Module):
         raycast_out = self.raycast(raycasting_data)
 
         # Concatenate the raycast output with the non-raycasting part of state
-        x = torch.cat((x, raycast_out), dim=2)
+        return torch.cat((x, raycast_out), dim=2)
 
-        x, (hidden_state, cell_state) = self.lstm(x, (hidden_state, cell_state))
+    def forward(self, state, mask=None, hidden_state=None, cell_state=None):
+        """
+        Input shape: (batch_size, sequence_length, feature_count)
+        """
+        x = self.encode(state)
+
+        x, (hidden_state, cell_state) = run_lstm(self.lstm, x, hidden_state, cell_state)
 
         x = x[:, -1, :]
 
@@ -159,8 +217,6 @@ class Actor(nn.Module):
         probs = Normal(action_mean, action_std)
 
         if action is None:
-            self.hidden_state = hidden_state
-            self.cell_state = cell_state
             action = probs.sample()
 
         return action, probs, action_mean, log_std, (hidden_state, cell_state)
@@ -190,7 +246,9 @@ class Critic(nn.Module):
             nn.LeakyReLU()
         )
 
-        self.lstm = nn.LSTM(self.hidden_dims, self.hidden_dims, 4, batch_first=True)
+        self.num_layers = 4
+
+        self.lstm = nn.LSTM(self.hidden_dims, self.hidden_dims, self.num_layers, batch_first=True)
 
         # self.fc1 = nn.Linear(self.hidden_dims, self.hidden_dims)
         # self.fc2 = nn.Linear(self.hidden_dims, self.hidden_dims)
@@ -233,12 +291,10 @@ class Critic(nn.Module):
         #     nn.init.constant_(layer.linear1.bias, 0)
         #     nn.init.constant_(layer.linear2.bias, 0)
 
-    def forward(self, state, hidden_states=None, cell_states=None):
+    def encode(self, state):
         """
-        Input shape: (batch_size, sequence_length, feature_count)
+        Input shape: (batch_size, sequence_length, feature_count), output shape: (batch_size, sequence_length, hidden_dims)
         """
-        # state = state[:, -1, :]
-
         # Encode the static features of the state
         x = F.leaky_relu(self.fc0(state[:, :, :self.feature_count - 128]), 0.01)
 
@@ -249,7 +305,26 @@ class Critic(nn.Module):
         raycast_out = self.raycast(raycasting_data)
 
         # Concatenate the raycast output with the non-raycasting part of state
-        x = torch.cat((x, raycast_out), dim=2)
+        return torch.cat((x, raycast_out), dim=2)
+
+    def step(self, state, hidden_state, cell_state):
+        """
+        Runs the observations in `state` through the critic, continuing from the given recurrent state. Returns the
+            value and the new recurrent state. Input shape: (batch_size, steps, feature_count)
+        """
+        x = self.encode(state)
+
+        x, (hidden_state, cell_state) = run_lstm(self.lstm, x, hidden_state, cell_state)
+
+        return self.decoder(x[:, -1, :]), (hidden_state, cell_state)
+
+    def forward(self, state, hidden_states=None, cell_states=None):
+        """
+        Input shape: (batch_size, sequence_length, feature_count)
+        """
+        # state = state[:, -1, :]
+
+        x = self.encode(state)
 
         x, _ = self.lstm(x, (hidden_states, cell_states))
 
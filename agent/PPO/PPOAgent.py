@@ -3,6 +3,7 @@ import torch.nn as nn
 import numpy as np
 
 from PPO.ActorCritic import ActorCritic
+from PPO.RecurrentStateStore import RecurrentStateStore
 from RolloutBuffer import RolloutBuffer
 from RE3.RandomEncoder import RandomEncoder
 
@@ -25,6 +26,7 @@ class PPOAgent:
                  beta=0.1,
                  kl_threshold=0.1,
                  lambda_gae=0.95,
+                 incremental_inference=False,
                  device='cpu'
                  ):
         self.gamma = gamma
@@ -37,6 +39,9 @@ class PPOAgent:
         self.kl_threshold = kl_threshold
         self.lambda_gae = lambda_gae
 
+        # Only run the newest observation through the policy when choosing actions, see ActorCritic.act_step
+        self.incremental_inference = incremental_inference
+
         self.device = device
 
         self.buffer_size = buffer_size
@@ -44,6 +49,11 @@ class PPOAgent:
         self.batch_size = batch_size
         self.replay_buffers = []
 
+        # The recurrent state choose_action left the batch it was called for last in, and the states of every
+        #   environment when we choose actions for more than one, see start_envs
+        self.recurrent_state = None
+        self.state_store = None
+
         self.random_encoder = RandomEncoder(state_dim).to(device)
 
         self.policy = ActorCritic(state_dim, action_dim, log_std, device)
@@ -58,16 +68,45 @@ class PPOAgent:
         self.mse_loss = nn.MSELoss()
 
     def start_new_episode(self):
-        self.policy.start_new_episode()
+        self.recurrent_state = self.policy.initial_state()
+
+    def start_envs(self, n_envs):
+        """
+        Keeps the recurrent states of `n_envs` environments that choose_action is called for in batches, e.g. from a
+            VecFitnessCourseEnvironment, instead of the state of a single one.
+        """
+        self.state_store = RecurrentStateStore(n_envs, num_layers=self.policy.actor.num_layers,
+                                               hidden_dims=self.policy.actor.hidden_dims, device=self.device)
+
+    def reset_envs(self, mask):
+        """
+        Starts new episodes for the environments where the boolean `mask` is set.
+        """
+        self.state_store.reset(mask)
 
     def load_policy_dict(self, policy):
         self.policy.load_state_dict(policy)
 
-    def choose_action(self, state_sequence: torch.Tensor):
+    def choose_action(self, state_sequence: torch.Tensor, env_indices=None):
+        """
+        Chooses actions for a batch of state sequences. With `env_indices`, row j of the batch continues from the
+            recurrent state of environment env_indices[j], see start_envs.
+        """
         with torch.no_grad():
             self.policy.eval()
 
-            action, action_logprob, state_value = self.policy.act(state_sequence, self.action_mask)
+            if env_indices is not None:
+                self.recurrent_state = self.state_store.gather(env_indices)
+
+            if self.incremental_inference:
+                action, action_logprob, state_value, self.recurrent_state = \
+                    self.policy.act_step(state_sequence, self.action_mask, self.recurrent_state)
+            else:
+                action, action_logprob, state_value, self.recurrent_state = \
+                    self.policy.act(state_sequence, self.action_mask, self.recurrent_state)
+
+            if env_indices is not None:
+                self.state_store.scatter(env_indices, self.recurrent_state)
 
         return action, action_logprob, state_value
 
@@ -87,6 +126,11 @@ class PPOAgent:
         old_params = self.policy.actor.named_parameters()
         old_params = {k: v.clone() for k, v in old_params}
 
+        # Workers can leave out most recurrent states, rebuild those before making the batches. Each buffer runs the
+        #   actor the way its worker does.
+        for buffer in self.replay_buffers:
+            buffer.reconstruct_recurrent_states(self.policy.actor)
+
         # Optimize policy for K epochs
         for epoch in range(self.K_epochs):
             for (n, buffer) in enumerate(self.replay_buffers):
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+import numpy as np
+import torch
+
+# LSTM states of the actor and the critic, each (layers, batch_size, hidden_dims)
+RecurrentState = namedtuple('RecurrentState', ('actor_hidden', 'actor_cell', 'critic_hidden', 'critic_cell'))
+
+
+class RecurrentStateStore:
+    """
+    Keeps the recurrent state of the actor and the critic for each of `n_envs` environments, so they can share one
+        batched forward pass. All four states live in one (4, layers, n_envs, hidden_dims) tensor, so each of them is a
+        contiguous (layers, n_envs, hidden_dims) tensor and every operation on the store is a single tensor operation.
+
+    Environments that step at different times gather the states of the ones in the batch, run the batch through the
+        policy, and scatter the new states back:
+        recurrent_state = store.gather(indices)
+        action, logprob, value, recurrent_state = policy.act(states, recurrent_state=recurrent_state)
+        store.scatter(indices, recurrent_state)
+    """
+    def __init__(self, n_envs, num_layers=4, hidden_dims=512, dtype=torch.bfloat16, device="cpu"):
+        self.n_envs = n_envs
+        self.device = device
+
+        self.states = torch.zeros((len(RecurrentState._fields), num_layers, n_envs, hidden_dims), dtype=dtype,
+                                  device=device)
+
+    def __len__(self):
+        return self.n_envs
+
+    @property
+    def state(self):
+        """
+        Views of the states of all the environments.
+        """
+        return RecurrentState(*self.states.unbind(dim=0))
+
+    def reset(self, mask=None):
+        """
+        Zeros the states of the environments where the boolean `mask` is set, e.g. the ones whose episodes ended, or
+            of all of them.
+        """
+        if mask is None:
+            self.states.zero_()
+            return
+
+        mask = torch.as_tensor(mask, dtype=torch.bool, device=self.device)
+        self.states.masked_fill_(mask.view(1, 1, -1, 1), 0)
+
+    def indices(self, indices):
+        if torch.is_tensor(indices):
+            return indices.to(device=self.device, dtype=torch.int64)
+
+        return torch.as_tensor(np.asarray(indices, dtype=np.int64), device=self.device)
+
+    def gather(self, indices):
+        """
+        Copies out the states of the environments in `indices`, in that order, as a RecurrentState with a batch of
+            len(indices).
+        """
+        return RecurrentState(*self.states.index_select(2, self.indices(indices)).unbind(dim=0))
+
+    def scatter(self, indices, recurrent_state):
+        """
+        Stores the batch in `recurrent_state` as the states of the environments in `indices`.
+        """
+        self.states.index_copy_(2, self.indices(indices), torch.stack(recurrent_state))
@@ -1,3 +1,4 @@
+import atexit
 import os
 import pickle
 import string
@@ -10,38 +11,394 @@ import torch
 from threading import Thread
 
 from redis import from_url as redis_from_url
+from redis.exceptions import ResponseError
 
 from PPO.PPOAgent import PPOAgent
 from RolloutBuffer import RolloutBuffer
+from SequenceWindow import SequenceWindow
+from SharedMemoryRing import SharedMemoryRing
+from TransitionSender import TransitionSender
+import TransitionCodec
 
 
+# `state` is only the newest observation, the learner rebuilds the window from the worker's earlier ones, which it
+#   tells apart by the episode and step of each
 Transition = namedtuple('Transition', ('state', 'action', 'reward',
-                                       'done',  'logprob', 'state_value', 'hidden_state', 'cell_state'))
+                                       'done',  'logprob', 'state_value', 'hidden_state', 'cell_state', 'episode',
+                                       'step'))
 TransitionMessage = namedtuple('TransitionMessage', ('transition', 'worker_name'))
 
+# Consecutive transitions of one worker, as a Transition with every field stacked along the first dimension
+TransitionGroupMessage = namedtuple('TransitionGroupMessage', ('transitions', 'worker_name'))
+
+# Observations of a worker the learner doesn't have yet, from steps we didn't send, that the next window starts with.
+#   Every field is stacked along the first dimension.
+Observations = namedtuple('Observations', ('state', 'episode', 'step'))
+ObservationsMessage = namedtuple('ObservationsMessage', ('observations', 'worker_name'))
+
+# The actor's recurrent state going into the given steps, when transitions don't carry theirs, see
+#   RedisHub.recurrent_state_interval, and whether the worker runs the actor incrementally, which the learner needs to
+#   rebuild the rest the same way. Every field is stacked along the first dimension.
+RecurrentStates = namedtuple('RecurrentStates', ('hidden_state', 'cell_state', 'episode', 'step', 'incremental'))
+RecurrentStatesMessage = namedtuple('RecurrentStatesMessage', ('recurrent_states', 'worker_name'))
+
+
+def stack_transitions(transitions):
+    """
+    Stacks a list of transitions into one Transition with a (len(transitions), ...) tensor for each field.
+    """
+    return Transition(*(torch.stack(field) if torch.is_tensor(field[0]) else torch.tensor(field)
+                        for field in zip(*transitions)))
+
 
 class RedisHub:
-    def __init__(self, redis_url, identifier, device='cpu'):
+    wire_formats = ("binary", "pickle")
+    transports = ("pubsub", "streams", "shared_memory")
+
+    def __init__(self, redis_url, identifier, device='cpu', group_size=1, group_timeout=0.5, wire_format="pickle",
+                 recurrent_state_interval=1, transport="pubsub", stream_maxlen=10000, stream_backlog=256,
+                 flow_check_interval=0.1, ring_slots=64, ring_slot_size=None, incremental_inference=False):
+        if wire_format not in self.wire_formats:
+            raise ValueError(f"Unknown wire format {wire_format}, expected one of {self.wire_formats}")
+
+        if transport not in self.transports:
+            raise ValueError(f"Unknown transport {transport}, expected one of {self.transports}")
+
         self.redis = redis_from_url(redis_url)
         self.key = identifier
         self.device = device
 
+        # How transitions are encoded, see TransitionCodec. The learner reads both.
+        self.wire_format = wire_format
+
+        # pubsub: Transitions are published to the `identifier` channel. Whatever the learner doesn't keep up with, or
+        #   gets while a buffer is full, is lost, and workers hold back when the learner says their buffer is full.
+        # streams: Every worker ID adds its transitions to a stream of its own, `identifier`.<worker ID>, which the
+        #   learner reads through a consumer group, deleting the entries it has added to its buffers. Like with
+        #   pub/sub, the learner keeps reading while a buffer is full, keeping the observations but not the transitions,
+        #   and workers hold back when it says their buffer is full. They also hold back while `stream_backlog` entries
+        #   are waiting for the learner, which we check every `flow_check_interval` seconds, so nothing is lost to a
+        #   learner that can't keep up, short of entries trimmed once a stream grows past `stream_maxlen`.
+        # shared_memory: For workers on the same host as the learner. Every worker ID writes its transitions to a
+        #   SharedMemoryRing of its own, named like its stream, with `ring_slots` slots of `ring_slot_size` bytes, see
+        #   size_ring_slots, and lists it in the `identifier`.rings set for the learner to find. The learner reads the
+        #   rings like it reads pub/sub, and workers hold back while their buffer is full, like with pub/sub, or their
+        #   ring is. Writing never waits, messages that find the ring full are dropped. Models and the rest of the
+        #   control plane stay on Redis.
+        self.transport = transport
+        self.stream_maxlen = stream_maxlen
+        self.stream_backlog = stream_backlog
+        self.flow_check_interval = flow_check_interval
+        self.flow_checked = {}
+        self.ring_slots = ring_slots
+        self.ring_slot_size = ring_slot_size
+        self.rings = {}
+        self.ring_dropped = 0
+
+        # Transitions are sent in groups of `group_size` per worker ID, or whatever a group has after `group_timeout`
+        #   seconds, so Redis and the learner handle one message per group instead of one per step
+        self.group_size = group_size
+        self.group_timeout = group_timeout
+        self.groups = {}
+        self.group_started = {}
+
+        # (episode, step) of the last observation we sent for each worker ID
+        self.positions = {}
+
+        # Above 1, transitions don't carry the actor's recurrent state. We only send the state going into every
+        #   `recurrent_state_interval`th step of an episode, and into the first step we send after a gap, and the
+        #   learner rebuilds the rest, see RolloutBuffer.reconstruct_recurrent_states. Episodes start from zeros.
+        self.recurrent_state_interval = recurrent_state_interval
+
+        # Whether the worker runs the actor on only the newest observation, see PPOAgent.incremental_inference
+        self.incremental_inference = incremental_inference
+
+        # ((episode, step), hidden_state, cell_state) the actor was left in by the last step of each worker ID
+        self.last_recurrent_states = {}
+
         self.latest_model = 0
         self.model = None
 
         self.pubsub = None
-        self.buffer_full = False
+
+        # Whether the learner's buffer for each worker ID we send transitions as is full
+        self.buffers_full = {}
+
+        # With streams, whether too many of the entries of each worker ID are waiting for the learner
+        self.streams_backlogged = {}
+
+        # Sends transitions from a background thread if started, see start_sender
+        self.sender = None
 
         # Randomly generate worker ID
         self.worker_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
 
-    def add(self, state_sequence, actions, reward, last_done, logprob, state_value, hidden_state, cell_state):
-        transition = Transition(state_sequence, actions, reward, last_done, logprob, state_value, hidden_state.squeeze(), cell_state.squeeze())
-        message = TransitionMessage(transition, self.worker_id)
+    def add(self, state_sequence, actions, reward, last_done, logprob, state_value, hidden_state, cell_state,
+            worker_id=None, position=None):
+        """
+        Sends a transition from the `state_sequence` window, a SequenceWindow or a (sequence_length, features) tensor
+            along with the (episode, step) `position` of its newest observation.
+
+        Only the newest observation is sent. When we haven't sent the step before it, e.g. because the learner's buffer
+            was full, we first send the rest of the window.
+
+        Nothing is sent while the learner's buffer for `worker_id` is full, but every step should still be added, so we
+            know the recurrent state going into the next one we send.
+        """
+        worker_id = worker_id if worker_id is not None else self.worker_id
+
+        if isinstance(state_sequence, SequenceWindow):
+            position = state_sequence.position
+            state_sequence = state_sequence.sequence
+
+        episode, step = position
+        hidden_state, cell_state = hidden_state.squeeze(), cell_state.squeeze()
+
+        previous_recurrent_state = self.last_recurrent_states.get(worker_id)
+        if self.recurrent_state_interval > 1:
+            self.last_recurrent_states[worker_id] = ((episode, step), hidden_state, cell_state)
+
+        if (self.buffers_full.get(worker_id, False) or self.streams_backlogged.get(worker_id, False)
+                or self.transport == "shared_memory" and self.ring_full(worker_id)):
+            return
+
+        gap = step > 0 and self.positions.get(worker_id) != (episode, step - 1)
+        if gap:
+            self.add_observations(state_sequence, episode, step, worker_id)
+
+        self.positions[worker_id] = (episode, step)
+
+        if self.recurrent_state_interval > 1:
+            if gap and previous_recurrent_state is not None and previous_recurrent_state[0] == (episode, step - 1):
+                self.add_recurrent_state(previous_recurrent_state[1], previous_recurrent_state[2], episode, step,
+                                         worker_id)
+
+            # What the actor was left in by this step is what goes into the next one
+            if (step + 1) % self.recurrent_state_interval == 0:
+                self.add_recurrent_state(hidden_state, cell_state, episode, step + 1, worker_id)
+
+            hidden_state = cell_state = torch.empty(0, dtype=hidden_state.dtype)
+
+        # Copy the row, sending a view would send the whole window
+        transition = Transition(state_sequence[-1].clone(), actions, reward, last_done, logprob, state_value,
+                                hidden_state, cell_state, episode, step)
+
+        if self.group_size <= 1:
+            self.send(TransitionMessage(transition, worker_id))
+            return
+
+        group = self.groups.setdefault(worker_id, [])
+        if len(group) == 0:
+            self.group_started[worker_id] = time.time()
+
+        group.append(transition)
+
+        if len(group) >= self.group_size or time.time() - self.group_started[worker_id] >= self.group_timeout:
+            self.flush_group(worker_id)
+
+    def add_observations(self, state_sequence, episode, step, worker_id):
+        """
+        Sends the observations before `step` in the `state_sequence` window, after everything we've already grouped so
+            they stay in order.
+        """
+        self.flush_group(worker_id)
+
+        count = min(step, len(state_sequence) - 1)
+
+        observations = Observations(state_sequence[-1 - count:-1].clone(),
+                                    torch.full((count,), episode, dtype=torch.int64),
+                                    torch.arange(step - count, step, dtype=torch.int64))
+
+        self.send(ObservationsMessage(observations, worker_id))
+
+    def add_recurrent_state(self, hidden_state, cell_state, episode, step, worker_id):
+        """
+        Sends the actor's recurrent state going into `step` of `episode`. The learner keeps these until the transition
+            of that step comes along, so they don't have to be in order with the transitions.
+        """
+        recurrent_states = RecurrentStates(hidden_state.unsqueeze(dim=0).clone(), cell_state.unsqueeze(dim=0).clone(),
+                                           torch.tensor([episode], dtype=torch.int64),
+                                           torch.tensor([step], dtype=torch.int64),
+                                           torch.tensor([self.incremental_inference], dtype=torch.bool))
+
+        self.send(RecurrentStatesMessage(recurrent_states, worker_id))
+
+    def flush_group(self, worker_id=None):
+        """
+        Sends the transitions grouped so far for `worker_id`, our own worker ID by default, even if the group isn't full.
+        """
+        worker_id = worker_id if worker_id is not None else self.worker_id
+
+        group = self.groups.pop(worker_id, None)
+        if group:
+            self.send(TransitionGroupMessage(stack_transitions(group), worker_id))
+
+    def send(self, message):
+        if self.sender is not None:
+            self.sender.put(message)
+            return
+
+        # Encode the transition and publish it to the "replay_buffer" channel
+        data = self.encode(message)
+        self.publish_message(self.redis, self.channel_of(message), data)
+
+    def stream_key(self, worker_id):
+        return f"{self.key}.{worker_id}"
+
+    def channel_of(self, message):
+        return self.key if self.transport == "pubsub" else self.stream_key(message.worker_name)
+
+    def publish_message(self, client, channel, data):
+        """
+        Sends an encoded message with `client`, a Redis client or pipeline, over our transport.
+        """
+        if self.transport == "streams":
+            client.xadd(channel, {"data": data}, maxlen=self.stream_maxlen, approximate=True)
+        elif self.transport == "shared_memory":
+            # Waiting for the learner would hold up every other worker ID we send for
+            if not self.ring(channel).write(data, block=False):
+                self.ring_dropped += 1
+        else:
+            client.publish(channel, data)
+
+    def ring(self, name):
+        """
+        The ring we write to for the stream key `name`, created the first time.
+        """
+        if name not in self.rings:
+            if self.ring_slot_size is None:
+                raise ValueError("Call size_ring_slots or pass ring_slot_size before sending over shared memory")
+
+            if not self.rings:
+                atexit.register(self.close_rings)
+
+            self.rings[name] = SharedMemoryRing(name, self.ring_slots, self.ring_slot_size, create=True)
+            self.redis.sadd(f"{self.key}.rings", name)
+
+        return self.rings[name]
+
+    def size_ring_slots(self, sequence_length, features, action_dim, num_layers, hidden_dims, dtype=torch.bfloat16):
+        """
+        Makes ring slots big enough for the largest message we send, for windows of `sequence_length` observations of
+            `features` and an actor with `num_layers` layers of `hidden_dims` that runs in `dtype`: a transition or full
+            group, the observations we send after a gap, or a recurrent state. Raises ValueError if we were given a
+            `ring_slot_size` that's smaller.
+        """
+        # At least as long as any worker ID we send as, e.g. <worker ID>-<index> in the vec worker
+        worker_name = f"{self.worker_id}-{'0' * 8}"
+
+        zeros = torch.zeros((num_layers, hidden_dims), dtype=dtype)
+        recurrent_state = zeros if self.recurrent_state_interval <= 1 else torch.empty(0, dtype=dtype)
+
+        transition = Transition(torch.zeros(features, dtype=torch.bfloat16), torch.zeros((1, action_dim), dtype=dtype),
+                                0.0, False, torch.zeros((1, action_dim), dtype=dtype), torch.zeros((1, 1), dtype=dtype),
+                                recurrent_state, recurrent_state, 0, 0)
+
+        if self.group_size <= 1:
+            messages = [TransitionMessage(transition, worker_name)]
+        else:
+            messages = [TransitionGroupMessage(stack_transitions([transition] * self.group_size), worker_name)]
+
+        count = sequence_length - 1
+        messages.append(ObservationsMessage(Observations(torch.zeros((count, features), dtype=torch.bfloat16),
+                                                         torch.zeros(count, dtype=torch.int64),
+                                                         torch.zeros(count, dtype=torch.int64)), worker_name))
+
+        messages.append(RecurrentStatesMessage(RecurrentStates(zeros.unsqueeze(dim=0), zeros.unsqueeze(dim=0),
+                                                               torch.zeros(1, dtype=torch.int64),
+                                                               torch.zeros(1, dtype=torch.int64),
+                                                               torch.zeros(1, dtype=torch.bool)), worker_name))
+
+        # Pickled messages vary a little in size with what's in them
+        needed = max(len(self.encode(message)) for message in messages) * 9 // 8 + 1024
+
+        if self.ring_slot_size is None:
+            self.ring_slot_size = needed
+        elif self.ring_slot_size < needed:
+            raise ValueError(f"Ring slots of {self.ring_slot_size} bytes are too small for our messages of up to "
+                             f"{needed} bytes with a group size of {self.group_size} and a recurrent state interval "
+                             f"of {self.recurrent_state_interval}")
+
+    def close_rings(self):
+        """
+        Frees the rings we created, whatever the learner hasn't read from them yet is lost.
+        """
+        # The sender might still be writing to them
+        self.stop_sender()
+
+        for name, ring in self.rings.items():
+            self.redis.srem(f"{self.key}.rings", name)
+            ring.close(unlink=True)
+
+        self.rings = {}
+
+    def encode(self, message):
+        if self.wire_format == "pickle":
+            return pickle.dumps(message)
+
+        if isinstance(message, ObservationsMessage):
+            return TransitionCodec.encode_fields(TransitionCodec.observations_kind, message.worker_name,
+                                                 message.observations)
+
+        if isinstance(message, RecurrentStatesMessage):
+            return TransitionCodec.encode_fields(TransitionCodec.recurrent_states_kind, message.worker_name,
+                                                 message.recurrent_states)
+
+        if isinstance(message, TransitionMessage):
+            transitions = stack_transitions([message.transition])
+        else:
+            transitions = message.transitions
+
+        return TransitionCodec.encode_fields(TransitionCodec.transitions_kind, message.worker_name, transitions)
 
-        # Pickle the transition and publish it to the "replay_buffer" channel
-        data = pickle.dumps(message)
-        self.redis.publish(self.key, data)
+    @staticmethod
+    def decode(data):
+        """
+        Decodes a message in either wire format. Binary transitions always decode to a TransitionGroupMessage.
+        """
+        if TransitionCodec.is_encoded(data):
+            kind, worker_name, fields = TransitionCodec.decode_fields(data)
+
+            if kind == TransitionCodec.observations_kind:
+                return ObservationsMessage(Observations(*fields), worker_name)
+
+            if kind == TransitionCodec.recurrent_states_kind:
+                return RecurrentStatesMessage(RecurrentStates(*fields), worker_name)
+
+            return TransitionGroupMessage(Transition(*fields), worker_name)
+
+        return pickle.loads(data)
+
+    def decode_received(self, data):
+        """
+        Decodes a message a listener received, or returns None if it can't be, e.g. because its worker runs another
+            version, so the listener skips it instead of stopping.
+        """
+        try:
+            return self.decode(data)
+        except Exception as e:
+            print(f"Skipping a message that couldn't be decoded: {e!r}")
+            return None
+
+    def start_sender(self, queue_size=256, full_policy="block", batch_size=64, spill_path=None):
+        """
+        Sends transitions from a background thread from now on, so add() doesn't wait on the network. See
+            TransitionSender for the options.
+        """
+        self.sender = TransitionSender(self.redis, self.channel_of, queue_size=queue_size, full_policy=full_policy,
+                                       batch_size=batch_size, spill_path=spill_path, encode=self.encode,
+                                       publish=self.publish_message)
+
+        # Otherwise whatever is still queued when the worker exits is lost
+        atexit.register(self.stop_sender)
+
+    def stop_sender(self):
+        """
+        Sends the transitions that are still queued and goes back to sending them from add().
+        """
+        if self.sender is not None:
+            self.sender.close()
+            self.sender = None
 
     def get_latest_model(self):
         model_timestamp = self.redis.get("rac1.fitness-course.model_timestamp")
@@ -133,22 +490,106 @@ class RedisHub:
     def unblock_workers(self):
         self.redis.publish("unblock_workers", "Doit")
 
-    def check_buffer_full(self):
+    def check_buffer_full(self, worker_id=None):
+        """
+        Whether the learner's buffer for `worker_id`, our own worker ID by default, is full. With streams, also whether
+            too many of its entries are waiting for the learner, and with shared memory, whether its ring is full.
+        """
+        worker_id = worker_id if worker_id is not None else self.worker_id
+
+        if self.transport == "streams":
+            full = self.check_full_flags(worker_id)
+            return self.check_stream_backlog(worker_id) or full
+
+        if self.transport == "shared_memory":
+            return self.check_full_flags(worker_id) or self.ring_full(worker_id)
+
+        return self.check_full_flags(worker_id)
+
+    def ring_full(self, worker_id):
+        ring = self.rings.get(self.stream_key(worker_id))
+        return ring is not None and ring.full()
+
+    def check_full_flags(self, worker_id):
+        """
+        Whether the learner has told us over pub/sub that its buffer for `worker_id` is full.
+        """
         if self.pubsub is None:
             self.pubsub = self.redis.pubsub()
-            self.pubsub.subscribe(f"{self.worker_id}.full")
             self.pubsub.subscribe("unblock_workers")
 
-        message = self.pubsub.get_message(ignore_subscribe_messages=True)
+        if worker_id not in self.buffers_full:
+            self.pubsub.subscribe(f"{worker_id}.full")
+            self.buffers_full[worker_id] = False
+
+        while True:
+            message = self.pubsub.get_message(ignore_subscribe_messages=True)
+            if message is None:
+                break
+
+            channel = message["channel"].decode()
+
+            # If we get message on the 'unblock_workers' we should set all our buffers to not full
+            if channel == "unblock_workers":
+                for key in self.buffers_full:
+                    self.buffers_full[key] = False
+            else:
+                full_worker_id = channel[:-len(".full")]
+                self.buffers_full[full_worker_id] = True if message["data"].decode() == "True" else False
+
+                # The learner drops what we send while the buffer is full, and by the time it has room again the
+                #   transitions we've grouped would be from an old policy
+                if self.buffers_full[full_worker_id]:
+                    self.groups.pop(full_worker_id, None)
+                    self.positions.pop(full_worker_id, None)
+
+        return self.buffers_full[worker_id]
+
+    def check_stream_backlog(self, worker_id):
+        now = time.time()
+
+        if now - self.flow_checked.get(worker_id, 0) >= self.flow_check_interval:
+            self.flow_checked[worker_id] = now
+
+            # The learner deletes the entries it has added, so what's left is waiting for it
+            self.streams_backlogged[worker_id] = self.redis.xlen(self.stream_key(worker_id)) >= self.stream_backlog
+
+        return self.streams_backlogged[worker_id]
+
+    def publish_profile(self, summary, expire=30):
+        """
+        Publishes a StepProfiler summary for this worker to its hash, which expires when the worker stops publishing.
+        """
+        key = f"rac1.fitness-course.worker_profile.{self.worker_id}"
+
+        if self.sender is not None:
+            summary = {**summary, **self.sender.metrics()}
+
+        if self.transport == "shared_memory":
+            summary = {**summary, "ring_dropped": float(self.ring_dropped)}
 
-        # If we get message on the 'unblock_workers' we should set buffer_full to False
-        if message is not None and message["channel"].decode() == "unblock_workers":
-            self.buffer_full = False
+        pipeline = self.redis.pipeline()
+        pipeline.hset(key, mapping={**summary, "time": time.time()})
+        pipeline.expire(key, expire)
+        pipeline.execute()
 
-        if message is not None:
-            self.buffer_full = True if message["data"].decode() == "True" else False
+    def get_worker_profiles(self):
+        """
+        The latest StepProfiler summary of every worker that is still publishing them, by worker ID.
+        """
+        keys = list(self.redis.scan_iter(match="rac1.fitness-course.worker_profile.*"))
+
+        pipeline = self.redis.pipeline()
+        for key in keys:
+            pipeline.hgetall(key)
 
-        return self.buffer_full
+        profiles = {}
+        for key, profile in zip(keys, pipeline.execute()):
+            if profile:
+                worker_id = key.decode().rsplit(".", 1)[-1]
+                profiles[worker_id] = {field.decode(): float(value) for field, value in profile.items()}
+
+        return profiles
 
     def get_action_mask(self):
         mask = self.redis.get("rac1.fitness-course.action_mask")
@@ -196,31 +637,11 @@ class RedisHub:
                 for message in messages:
                     if message["type"] == "message":
                         # Convert the message to states from bytes
-                        data = message["data"]
-                        data = pickle.loads(data)
-                        transition = data.transition
-
-                        if data.worker_name in buffers:
-                            replay_buffer = buffers[data.worker_name]
-                        else:
-                            buffers[data.worker_name] = RolloutBuffer(data.worker_name, 1000000, agent.buffer_size, agent.gamma,
-                                                                      agent.lambda_gae, device=agent.device)
-                            agent.replay_buffers.append(buffers[data.worker_name])
-                            replay_buffer = buffers[data.worker_name]
-
-                        replay_buffer.add(
-                            transition.state,
-                            transition.action,
-                            transition.reward,
-                            transition.done,
-                            transition.logprob,
-                            transition.state_value,
-                            replay_buffer.hidden_state,
-                            replay_buffer.cell_state
-                        )
-
-                        replay_buffer.hidden_state = transition.hidden_state
-                        replay_buffer.cell_state = transition.cell_state
+                        data = self.decode_received(message["data"])
+                        if data is None:
+                            continue
+
+                        replay_buffer = self.add_message(agent, buffers, data)
 
                         # If the replay buffer is full, we need to notify the worker to stop sending messages
                         if replay_buffer.ready:
@@ -233,7 +654,212 @@ class RedisHub:
         print("Restarting listener...")
         self.listen_for_messages(agent)
 
+    def listen_for_streams(self, agent: PPOAgent, group="learner", consumer="learner", count=64, block=100):
+        """
+        Reads the workers' streams through the consumer group `group`, acknowledging and deleting entries once they're
+            added, so workers see how many are waiting by the length of their stream. Like with pub/sub, we keep
+            reading while a worker's buffer is full, which drops the transitions but keeps the observations, and tell
+            the worker to hold back.
+        """
+        buffers = {buffer.owner: buffer for buffer in agent.replay_buffers}
+
+        streams = set()
+        last_scan = 0
+
+        while True:
+            read = []
+
+            # Look for new workers every now and then
+            if time.time() - last_scan > 1.0:
+                last_scan = time.time()
+
+                for key in self.redis.scan_iter(match=f"{self.key}.*", _type="STREAM"):
+                    key = key.decode()
+                    if key in streams:
+                        continue
+
+                    try:
+                        self.redis.xgroup_create(key, group, id="0", mkstream=True)
+                    except ResponseError as e:
+                        if "BUSYGROUP" not in str(e):
+                            raise
+
+                    streams.add(key)
+
+                    # Entries we read before a restart but never acknowledged come first
+                    read += self.redis.xreadgroup(group, consumer, {key: "0"})
+
+            if streams:
+                read += self.redis.xreadgroup(group, consumer, {key: ">" for key in streams}, count=count, block=block)
+            else:
+                time.sleep(0.01)
+
+            added = {}
+            full = set()
+
+            for key, entries in read:
+                key = key.decode()
+
+                for entry_id, fields in entries:
+                    # Acknowledged and deleted whether we could use it or not, it won't get any better
+                    added.setdefault(key, []).append(entry_id)
+
+                    # Pending entries that were deleted before they were acknowledged come back without their fields
+                    data = self.decode_received(fields[b"data"]) if fields else None
+                    if data is None:
+                        continue
+
+                    replay_buffer = self.add_message(agent, buffers, data)
+
+                    if replay_buffer.ready:
+                        full.add(data.worker_name)
+
+            if added or full:
+                pipeline = self.redis.pipeline(transaction=False)
+                for key, entry_ids in added.items():
+                    pipeline.xack(key, group, *entry_ids)
+                    pipeline.xdel(key, *entry_ids)
+
+                # If the replay buffer is full, we need to notify the worker to stop sending messages
+                for worker_name in full:
+                    pipeline.publish(f"{worker_name}.full", "True")
+                pipeline.execute()
+
+    def listen_for_rings(self, agent: PPOAgent, count=64):
+        """
+        Reads the workers' shared memory rings. Like with pub/sub, we keep reading while a worker's buffer is full,
+            which drops the transitions but keeps the observations, and tell the worker to hold back. Rings taken out
+            of the `identifier`.rings set are closed once we've read what's left in them.
+        """
+        buffers = {buffer.owner: buffer for buffer in agent.replay_buffers}
+
+        rings = {}
+        names = set()
+        last_scan = 0
+
+        while True:
+            if time.time() - last_scan > 1.0:
+                last_scan = time.time()
+                names = {name.decode() for name in self.redis.smembers(f"{self.key}.rings")}
+
+                for name in names - rings.keys():
+                    try:
+                        rings[name] = SharedMemoryRing(name)
+                    except FileNotFoundError:
+                        # Its worker is gone, or isn't on this host
+                        print(f"Couldn't open the shared memory of {name}, is its worker on another host?")
+                        self.redis.srem(f"{self.key}.rings", name)
+
+            read = 0
+
+            for name, ring in list(rings.items()):
+                for _ in range(count):
+                    data = ring.read_message()
+                    if data is None:
+                        break
+
+                    read += 1
+
+                    data = self.decode_received(data)
+                    if data is None:
+                        continue
+
+                    replay_buffer = self.add_message(agent, buffers, data)
+
+                    if replay_buffer.ready:
+                        self.redis.publish(f"{data.worker_name}.full", "True")
+
+                if name not in names and ring.pending() == 0:
+                    ring.close()
+                    del rings[name]
+
+            if read == 0:
+                time.sleep(0.001)
+
+    def add_message(self, agent: PPOAgent, buffers, data):
+        """
+        Adds a decoded message to the buffer of the worker that sent it, which is created the first time, and returns
+            that buffer.
+        """
+        if data.worker_name in buffers:
+            replay_buffer = buffers[data.worker_name]
+        else:
+            buffers[data.worker_name] = RolloutBuffer(data.worker_name, 1000000, agent.buffer_size, agent.gamma,
+                                                      agent.lambda_gae, device=agent.device)
+            agent.replay_buffers.append(buffers[data.worker_name])
+            replay_buffer = buffers[data.worker_name]
+
+        if isinstance(data, ObservationsMessage):
+            observations = data.observations
+            replay_buffer.add_observations(observations.state, observations.episode, observations.step)
+        elif isinstance(data, RecurrentStatesMessage):
+            recurrent_states = data.recurrent_states
+            replay_buffer.add_recurrent_states(recurrent_states.hidden_state, recurrent_states.cell_state,
+                                               recurrent_states.episode, recurrent_states.step,
+                                               recurrent_states.incremental)
+        elif isinstance(data, TransitionGroupMessage):
+            self.add_transition_group(replay_buffer, data.transitions)
+        else:
+            self.add_transition(replay_buffer, data.transition)
+
+        return replay_buffer
+
+    def add_transition(self, replay_buffer, transition):
+        # Without a recurrent state, the buffer rebuilds the one going into this step
+        carries_state = transition.hidden_state.numel() > 0
+
+        replay_buffer.add(
+            transition.state,
+            transition.action,
+            transition.reward,
+            transition.done,
+            transition.logprob,
+            transition.state_value,
+            replay_buffer.hidden_state if carries_state else None,
+            replay_buffer.cell_state if carries_state else None,
+            transition.episode,
+            transition.step
+        )
+
+        if carries_state:
+            replay_buffer.hidden_state = transition.hidden_state
+            replay_buffer.cell_state = transition.cell_state
+
+    def add_transition_group(self, replay_buffer, transitions):
+        if transitions.hidden_state[0].numel() == 0:
+            # Without recurrent states, the buffer rebuilds the ones going into these steps
+            replay_buffer.add_many(transitions.state, transitions.action, transitions.reward, transitions.done,
+                                   transitions.logprob, transitions.state_value, None, None, transitions.episode,
+                                   transitions.step)
+            return
+
+        # Like single transitions, each one is stored with the recurrent state from before its step
+        hidden_states = torch.cat((replay_buffer.hidden_state.unsqueeze(0), transitions.hidden_state[:-1]))
+        cell_states = torch.cat((replay_buffer.cell_state.unsqueeze(0), transitions.cell_state[:-1]))
+
+        replay_buffer.add_many(
+            transitions.state,
+            transitions.action,
+            transitions.reward,
+            transitions.done,
+            transitions.logprob,
+            transitions.state_value,
+            hidden_states,
+            cell_states,
+            transitions.episode,
+            transitions.step
+        )
+
+        replay_buffer.hidden_state = transitions.hidden_state[-1]
+        replay_buffer.cell_state = transitions.cell_state[-1]
+
     def start_listening(self, agent: PPOAgent):
-        thread = Thread(target=self.listen_for_messages, args=(agent,))
+        listen = {
+            "pubsub": self.listen_for_messages,
+            "streams": self.listen_for_streams,
+            "shared_memory": self.listen_for_rings,
+        }[self.transport]
+
+        thread = Thread(target=listen, args=(agent,))
         thread.daemon = True
         thread.start()
@@ -66,8 +66,7 @@ def main():
                 pygame.quit()
                 return
 
-        collisions = np.array(game.get_collisions_with_normals())
-        distances = collisions[:64].reshape(8, 8)
+        distances, _, normals_x, normals_y, normals_z = game.get_collisions_with_normals()
 
         # Calculate points based on distances in the collisions
         # We know which direction we should place the point by getting the grid position of the collision
@@ -133,8 +132,7 @@ def main():
 
         points = np.array(points)
 
-        # Get the normals from the last 64*3 values in collisions
-        normals = collisions[64:].reshape(64, 3)
+        normals = np.stack((normals_x, normals_y, normals_z), axis=-1).reshape(64, 3)
 
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         draw_points(points, normals)
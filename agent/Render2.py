@@ -20,41 +20,11 @@ def extract_vector(vector):
 
 
 def get_collisions_with_normals(game):
-    collisions = []
-    normals_x = []
-    normals_y = []
-    normals_z = []
-    classes = []
+    collisions, classes, normals_x, normals_y, normals_z = game.get_collisions_with_normals()
 
-    for i in range(8):
-        for j in range(8):
-            offset = 4 * (i * 8 + j)
-
-            collision_address = game.collisions_address + offset
-            collision_value = game.process.read_float(collision_address)
-
-            normal_x_address = game.collisions_normals_x + offset
-            normal_x = game.process.read_float(normal_x_address)
-
-            normal_y_address = game.collisions_normals_y + offset
-            normal_y = game.process.read_float(normal_y_address)
-
-            normal_z_address = game.collisions_normals_z + offset
-            normal_z = game.process.read_float(normal_z_address)
-
-            class_address = game.collisions_class_address + offset
-            class_value = game.process.read_int(class_address)
-
-            if class_value > 5000:
-                class_value = -1
-
-            collisions.append(collision_value)
-            normals_x.append(normal_x)
-            normals_y.append(normal_y)
-            normals_z.append(normal_z)
-            classes.append(class_value)
+    classes = np.where(classes > 5000, -1, classes.astype(np.int64))
 
-    return np.array(collisions), np.array(normals_x), np.array(normals_y), np.array(normals_z), np.array(classes)
+    return collisions, normals_x, normals_y, normals_z, classes
 
 
 def class_to_color(class_value):
@@ -90,20 +60,19 @@ def draw_plane(color):
 def render_scene(game, camera_position, collisions, normals_x, normals_y, normals_z, classes):
     for i in range(8):
         for j in range(8):
-            idx = i * 8 + j
-            distance = collisions[idx]
+            distance = collisions[i, j]
 
             if distance < 0 or np.isnan(distance):  # Skip invalid distances
                 continue
 
-            normal = np.array([normals_x[idx], normals_z[idx], normals_y[idx]])
+            normal = np.array([normals_x[i, j], normals_z[i, j], normals_y[i, j]])
             if np.any(np.isnan(normal)) or np.all(normal == 0):  # Skip invalid normals
                 continue
 
             # Normalize the normal vector
             normal = normal / np.linalg.norm(normal)
 
-            color = class_to_color(classes[idx])
+            color = class_to_color(classes[i, j])
             glPushMatrix()
             # Position relative to camera
             position = [camera_position[0] + j - 4, camera_position[1] - (i - 4), camera_position[2] - distance]
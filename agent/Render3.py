@@ -44,7 +44,9 @@ def main():
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
         # Get collision data
-        collisions, normals_x, normals_y, normals_z, classes = rc1_game.get_collisions_with_normals()
+        collisions, classes, normals_x, normals_y, normals_z = (
+            grid.ravel() for grid in rc1_game.get_collisions_with_normals()
+        )
 
         # Debug: Print the first few collisions and normals
         print("Collisions:", collisions[:5])
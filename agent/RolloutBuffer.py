@@ -5,9 +5,12 @@ import numpy as np
 
 from threading import Lock
 
+from ObservationStream import ObservationStream
+
 
 class RolloutBuffer:
-    def __init__(self, owner, capacity, buffer_size=512, gamma=0.99, lambda_gae=1, device='cpu', cell_size=512):
+    def __init__(self, owner, capacity, buffer_size=512, gamma=0.99, lambda_gae=1, device='cpu', cell_size=512,
+                 sequence_length=30, features=155):
         self.owner = owner
         self.capacity = capacity
         self.buffer = [None] * capacity
@@ -29,6 +32,20 @@ class RolloutBuffer:
         self.hidden_state = torch.zeros((4, cell_size), dtype=torch.bfloat16, device='cpu')
         self.cell_state = torch.zeros((4, cell_size), dtype=torch.bfloat16, device='cpu')
 
+        # Workers only send the newest observation of every step, transitions hold the index of theirs in the stream
+        #   and we build the windows when we make the batches
+        self.observations = ObservationStream(sequence_length, features, capacity=2 * buffer_size)
+
+        # (episode, step) of every transition in the buffer, in order
+        self.transition_positions = []
+
+        # When workers don't send the recurrent state with every transition: the states going into some of the steps,
+        #   by (episode, step), see reconstruct_recurrent_states
+        self.recurrent_states = {}
+
+        # Whether the worker runs the actor on only the newest observation, as it tells us with its recurrent states
+        self.incremental_inference = False
+
         self.device = device
 
     def compute_returns_and_advantages(self, last_value, done):
@@ -60,7 +77,13 @@ class RolloutBuffer:
 
         self.last_episode_start = self.total
 
-    def add(self, state, actions, reward, done, logprob, state_value, cell_state, hidden_state):
+    def add(self, state, actions, reward, done, logprob, state_value, cell_state, hidden_state, episode, step):
+        # Observations go into the stream even once we're full, so the windows of the worker's next transitions have
+        #   what they need after we're cleared
+        self.lock.acquire()
+        index = self.observations.append(state.to('cpu'), int(episode), int(step))
+        self.lock.release()
+
         if self.ready:
             return
 
@@ -69,7 +92,6 @@ class RolloutBuffer:
             self.ready = True
             return
 
-        state = state.to('cpu')
         actions = actions.to('cpu')
         reward = torch.tensor(reward, dtype=torch.bfloat16, device='cpu')
         done = torch.tensor(done, dtype=torch.bool, device='cpu')
@@ -78,7 +100,12 @@ class RolloutBuffer:
 
         self.lock.acquire()
 
-        self.buffer[self.position] = (state, actions, reward, done, logprob, state_value, cell_state.to('cpu'), hidden_state.to('cpu'))
+        # Recurrent states left out are filled in by reconstruct_recurrent_states
+        if cell_state is not None:
+            cell_state, hidden_state = cell_state.to('cpu'), hidden_state.to('cpu')
+
+        self.buffer[self.position] = (index, actions, reward, done, logprob, state_value, cell_state, hidden_state)
+        self.transition_positions.append((int(episode), int(step)))
 
         self.position = (self.position + 1) % self.capacity
         self.lock.release()
@@ -87,6 +114,151 @@ class RolloutBuffer:
 
         self.total += 1
 
+    def add_many(self, states, actions, rewards, dones, logprobs, state_values, cell_states, hidden_states, episodes,
+                 steps):
+        """
+        Adds consecutive transitions stacked along the first dimension, like calling add() for each of them in order,
+            but moving them to the CPU and converting the rewards and dones once for the whole group. The recurrent
+            states can be None for all of them, like for add().
+        """
+        self.lock.acquire()
+        indices = self.observations.append_many(states.to('cpu'), episodes, steps)
+        self.lock.release()
+
+        positions = list(zip(torch.as_tensor(episodes).tolist(), torch.as_tensor(steps).tolist()))
+
+        if cell_states is None:
+            cell_states = hidden_states = [None] * len(states)
+        else:
+            cell_states = cell_states.to('cpu')
+            hidden_states = hidden_states.to('cpu')
+
+        actions = actions.to('cpu')
+        rewards = torch.as_tensor(rewards, dtype=torch.bfloat16, device='cpu')
+        dones = torch.as_tensor(dones, dtype=torch.bool, device='cpu')
+        logprobs = logprobs.to('cpu')
+        state_values = state_values.to('cpu')
+
+        for i in range(len(states)):
+            if self.ready:
+                return
+
+            if self.total >= self.buffer_size:
+                self.compute_returns_and_advantages(state_values[i], dones[i])
+                self.ready = True
+                return
+
+            self.lock.acquire()
+
+            self.buffer[self.position] = (indices[i], actions[i], rewards[i], dones[i], logprobs[i], state_values[i],
+                                          cell_states[i], hidden_states[i])
+            self.transition_positions.append(positions[i])
+
+            self.position = (self.position + 1) % self.capacity
+            self.lock.release()
+
+            self.new_samples += 1
+
+            self.total += 1
+
+    def add_observations(self, states, episodes, steps):
+        """
+        Adds observations without transitions, which the windows of the next transitions start from, e.g. when the
+            worker sends the window it didn't send the steps of.
+        """
+        self.lock.acquire()
+        self.observations.append_many(states.to('cpu'), episodes, steps)
+        self.lock.release()
+
+    def add_recurrent_states(self, hidden_states, cell_states, episodes, steps, incremental=None):
+        """
+        Keeps the recurrent states going into the given steps for the transitions of those steps that don't have
+            theirs, see reconstruct_recurrent_states. `incremental` is whether the worker ran the actor incrementally
+            for each of them.
+        """
+        self.lock.acquire()
+
+        if incremental is not None and len(incremental) > 0:
+            self.incremental_inference = bool(incremental[-1])
+
+        for hidden_state, cell_state, episode, step in zip(hidden_states, cell_states, torch.as_tensor(episodes).tolist(),
+                                                           torch.as_tensor(steps).tolist()):
+            self.recurrent_states[(episode, step)] = (hidden_state.to('cpu'), cell_state.to('cpu'))
+
+        self.lock.release()
+
+    def reconstruct_recurrent_states(self, actor, incremental=None):
+        """
+        Fills in the recurrent states of the transitions that came without theirs. We use the state the worker sent
+            for the step if there is one, zeros at the start of an episode, and otherwise run the window of the step
+            before through `actor` from the state going into it, like the worker did, which is exact as long as
+            `actor` is the policy the worker ran. With `incremental`, only the newest observation is run, like
+            ActorCritic.act_step, which by default is what the worker said it does. Each round runs the next step of all
+            the chains of missing states in one batch.
+
+        The states of transitions we couldn't rebuild, because we have neither the step before them nor a state for
+            them, e.g. after the sender dropped messages, start from zeros.
+        """
+        missing = [i for i in range(self.total) if self.buffer[i][6] is None]
+        if len(missing) == 0:
+            return
+
+        incremental = incremental if incremental is not None else self.incremental_inference
+
+        zeros = torch.zeros((actor.num_layers, actor.hidden_dims), dtype=torch.bfloat16)
+
+        # How many steps each transition is from one whose state we know, grouped by that
+        depths = {}
+        rounds = []
+
+        for i in missing:
+            episode, step = self.transition_positions[i]
+
+            if (episode, step) in self.recurrent_states:
+                self.set_recurrent_state(i, *self.recurrent_states[(episode, step)])
+            elif step > 0 and i > 0 and self.buffer[i][0] == self.buffer[i - 1][0] + 1:
+                # The transition before is the step before in the same episode, see ObservationStream
+                depths[i] = depths.get(i - 1, 0) + 1
+
+                if depths[i] > len(rounds):
+                    rounds.append([])
+                rounds[depths[i] - 1].append(i)
+            else:
+                self.set_recurrent_state(i, zeros, zeros)
+
+        device = next(actor.parameters()).device
+
+        # Run it in eval mode like the worker does, even if the learner has put it in train mode
+        training = actor.training
+        actor.eval()
+
+        try:
+            with torch.no_grad():
+                for transitions in rounds:
+                    previous = [i - 1 for i in transitions]
+
+                    self.lock.acquire()
+                    windows = self.observations.gather([self.buffer[i][0] for i in previous])
+                    self.lock.release()
+
+                    if incremental:
+                        windows = windows[:, -1:, :]
+
+                    hidden_state = torch.stack([self.buffer[i][6] for i in previous], dim=1).to(device)
+                    cell_state = torch.stack([self.buffer[i][7] for i in previous], dim=1).to(device)
+
+                    _, _, hidden_state, cell_state = actor(windows.to(device), hidden_state=hidden_state,
+                                                           cell_state=cell_state)
+
+                    for j, i in enumerate(transitions):
+                        self.set_recurrent_state(i, hidden_state[:, j].to('cpu'), cell_state[:, j].to('cpu'))
+        finally:
+            actor.train(training)
+
+    def set_recurrent_state(self, index, hidden_state, cell_state):
+        # Stored in the order RedisHub.add_transition passes them to add()
+        self.buffer[index] = self.buffer[index][:6] + (hidden_state, cell_state) + self.buffer[index][8:]
+
     def clear(self):
         self.lock.acquire()
 
@@ -96,6 +268,17 @@ class RolloutBuffer:
         self.total = 0
         self.ready = False
         self.cached = [None] * self.capacity
+        self.transition_positions = []
+
+        self.observations.trim()
+
+        # Only the states of steps after the last observation can still be needed
+        if self.observations.last is not None:
+            last_episode, last_step = self.observations.last
+            self.recurrent_states = {(episode, step): state for (episode, step), state in self.recurrent_states.items()
+                                     if episode == last_episode and step > last_step}
+        else:
+            self.recurrent_states = {}
 
         self.lock.release()
 
@@ -133,7 +316,10 @@ class RolloutBuffer:
             (states, actions, rewards, dones, logprobs, state_values, cell_states, hidden_states, advantages, returns) \
                 = zip(*batch)
 
-            states = torch.stack(states)
+            self.lock.acquire()
+            states = self.observations.gather(states)
+            self.lock.release()
+
             actions = torch.stack(actions)
             rewards = torch.stack(rewards)
             dones = torch.stack(dones)
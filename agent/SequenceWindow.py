@@ -0,0 +1,79 @@
+import torch
+
+
+class SequenceWindow:
+    """
+    The last `sequence_length` observations, oldest first, kept in a circular buffer of twice that length.
+
+    Every row is written twice, `sequence_length` rows apart, so the window is always one contiguous slice of the
+        buffer. Appending copies one row instead of shifting the whole window like torch.roll does, and `sequence` and
+        `batch` are views that never copy.
+    """
+    def __init__(self, sequence_length, features, dtype=torch.bfloat16, device="cpu"):
+        self.sequence_length = sequence_length
+        self.features = features
+
+        self.buffer = torch.zeros((2 * sequence_length, features), dtype=dtype, device=device)
+
+        # Views of every row, so appending doesn't have to index into the buffer
+        self.rows = self.buffer.unbind(dim=0)
+
+        # The window starts at `start`, the next row goes into `start` and `start + sequence_length`
+        self.start = 0
+
+        # Which episode this is, counting resets, and the step of the newest observation in it
+        self.episode = 0
+        self.step = -1
+
+    def __len__(self):
+        return self.sequence_length
+
+    def reset(self, state=None):
+        """
+        Zeros the window for a new episode, and appends `state` as its first observation if given.
+        """
+        self.buffer.zero_()
+        self.start = 0
+
+        self.episode += 1
+        self.step = -1
+
+        if state is not None:
+            self.append(state)
+
+    def append(self, state):
+        """
+        Drops the oldest observation and appends `state` as the newest one.
+        """
+        self.rows[self.start].copy_(state)
+        self.rows[self.start + self.sequence_length].copy_(state)
+
+        self.start = (self.start + 1) % self.sequence_length
+        self.step += 1
+
+    @property
+    def position(self):
+        """
+        (episode, step) of the newest observation.
+        """
+        return self.episode, self.step
+
+    @property
+    def sequence(self):
+        """
+        (sequence_length, features) view of the window. It changes with the next append, clone it to keep it.
+        """
+        return self.buffer[self.start:self.start + self.sequence_length]
+
+    @property
+    def batch(self):
+        """
+        (1, sequence_length, features) view of the window, for the model.
+        """
+        return self.sequence.unsqueeze(dim=0)
+
+    def snapshot(self):
+        """
+        A copy of the window that doesn't share the buffer, e.g. to send it somewhere or to keep it.
+        """
+        return self.sequence.clone()
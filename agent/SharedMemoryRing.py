@@ -0,0 +1,159 @@
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+class SharedMemoryRing:
+    """
+    A ring of fixed size slots in shared memory that one process writes messages to and another reads them from, so a
+        worker on the same host as the learner can hand it encoded transitions with a single copy on each side.
+
+    The shared memory starts with a header of int64s: the number of slots, the size of a slot, and how many messages
+        have been written and read. Every slot starts with its sequence number and the size of its message, followed by
+        up to `slot_size` bytes of the message.
+
+    Message `n` goes in slot `n % slots`, and the slot's sequence number is the handshake between the two sides:
+        n: The slot is free for the writer to put message `n` in.
+        n + 1: Message `n` is in the slot, for the reader.
+        n + slots: The reader is done with it, it's free for message `n + slots`.
+
+    Each side only writes its own count and the sequence numbers it hands over, always after the slot's data, so
+        neither needs a lock. That takes at least 2 slots, with 1, n + 1 and n + slots would be the same.
+    """
+    header_size = 4 * 8
+    slot_header_size = 2 * 8
+
+    def __init__(self, name, slots=256, slot_size=256 * 1024, create=False):
+        self.name = name
+
+        if create and slots < 2:
+            raise ValueError(f"A ring needs at least 2 slots, got {slots}")
+
+        if create:
+            try:
+                self.memory = shared_memory.SharedMemory(name, create=True, size=self.size(slots, slot_size))
+            except FileExistsError:
+                # Left over from a worker that didn't get to clean up
+                self.unlink(name)
+                self.memory = shared_memory.SharedMemory(name, create=True, size=self.size(slots, slot_size))
+        else:
+            self.memory = self.attach(name)
+
+        self.header = np.ndarray((4,), dtype=np.int64, buffer=self.memory.buf)
+
+        if create:
+            self.header[:] = (slots, slot_size, 0, 0)
+
+        self.slots, self.slot_size = int(self.header[0]), int(self.header[1])
+        self.stride = self.slot_header_size + self.slot_size + -self.slot_size % 8
+
+        # (sequence number, size) of every slot
+        self.slot_headers = np.ndarray((self.slots, self.stride // 8), dtype=np.int64, buffer=self.memory.buf,
+                                       offset=self.header_size)[:, :2]
+
+        if create:
+            self.slot_headers[:, 0] = np.arange(self.slots)
+            self.slot_headers[:, 1] = 0
+
+    @classmethod
+    def size(cls, slots, slot_size):
+        return cls.header_size + slots * (cls.slot_header_size + slot_size + -slot_size % 8)
+
+    @staticmethod
+    def attach(name):
+        """
+        Opens the shared memory of a ring another process created, without taking it over: by default, the resource
+            tracker would unlink it when we exit.
+        """
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(name, track=False)
+
+        memory = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+
+        return memory
+
+    @staticmethod
+    def unlink(name):
+        try:
+            memory = shared_memory.SharedMemory(name)
+        except FileNotFoundError:
+            return
+
+        memory.close()
+        memory.unlink()
+
+    @property
+    def n_written(self):
+        return int(self.header[2])
+
+    @property
+    def n_read(self):
+        return int(self.header[3])
+
+    def pending(self):
+        """
+        How many messages were written that haven't been read yet.
+        """
+        return self.n_written - self.n_read
+
+    def full(self):
+        return self.pending() >= self.slots
+
+    def data_offset(self, slot):
+        return self.header_size + slot * self.stride + self.slot_header_size
+
+    def write(self, data, block=True, poll_interval=0.0005):
+        """
+        Copies `data` into the next slot. If the ring is full, waits for the reader to free it, or with `block` off,
+            returns False without writing anything.
+        """
+        if len(data) > self.slot_size:
+            raise ValueError(f"Message of {len(data)} bytes doesn't fit in a {self.slot_size} byte slot")
+
+        sequence = self.n_written
+        slot = sequence % self.slots
+
+        while self.slot_headers[slot, 0] != sequence:
+            if not block:
+                return False
+
+            time.sleep(poll_interval)
+
+        offset = self.data_offset(slot)
+        self.memory.buf[offset:offset + len(data)] = data
+        self.slot_headers[slot, 1] = len(data)
+
+        # Hand the slot over to the reader only once it holds the message
+        self.slot_headers[slot, 0] = sequence + 1
+        self.header[2] = sequence + 1
+
+        return True
+
+    def read_message(self):
+        """
+        Copies the next message out of its slot and frees the slot, or returns None if there isn't one yet.
+        """
+        sequence = self.n_read
+        slot = sequence % self.slots
+
+        if self.slot_headers[slot, 0] != sequence + 1:
+            return None
+
+        offset = self.data_offset(slot)
+        data = bytes(self.memory.buf[offset:offset + int(self.slot_headers[slot, 1])])
+
+        self.slot_headers[slot, 0] = sequence + self.slots
+        self.header[3] = sequence + 1
+
+        return data
+
+    def close(self, unlink=False):
+        # The views have to go before the shared memory can be closed
+        del self.header, self.slot_headers
+
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
@@ -0,0 +1,281 @@
+"""
+Headless stand-in for RPCS3 running the Kerwan fitness course. It owns a shared memory region laid out like the game's
+    memory, speaks the PRX's mailbox protocol (frame counter, frame progress, inputs, death count, raycasts) and runs
+    simplified kinematics along the fitness course checkpoints, so workers, the learner and Redis can be run and load
+    tested without an emulator.
+
+Workers start one with --simulator, or run one standalone and attach to it by name:
+    python Simulator.py --name rac1-simulator
+    python worker.py --simulator-name rac1-simulator
+
+The simulator and the worker poll each other, so use --frame-wait yield on the worker when they share a core.
+"""
+import math
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from Environments.FitnessCourseEnvironment import FitnessCourseEnvironment
+from Game.FrameWaiter import sched_yield
+from Game.MemoryProcess import GameMemory, DEFAULT_MEMORY_SIZE
+from Game.RC1Game import RC1Game
+
+# Kerwan, where the fitness course is
+kerwan = 3
+
+# Controller buttons, as the worker writes them
+button_cross = 0x40
+
+
+class FitnessCourseSimulator:
+    """
+    Steps a player along a track that runs through the fitness course checkpoints. The ground height under the player
+        is interpolated along the nearest track segment, and the player falls to their death when they leave the track.
+    """
+    max_speed = 0.4  # Units per frame
+    acceleration = 0.04
+    friction = 0.85
+    turn_speed = 0.06  # Radians per frame at full right stick
+    jump_speed = 0.5
+    gravity = 0.03
+
+    track_width = 8.0
+    death_depth = 30.0
+
+    ray_distance = 64.0
+    no_hit_class = -1
+
+    spawn_position = (259, 143, 49.5)
+
+    def __init__(self, memory, checkpoints=None):
+        self.memory = memory
+
+        if checkpoints is None:
+            checkpoints = [(c.x, c.y, c.z) for c in FitnessCourseEnvironment.checkpoints_template]
+
+        # Track segments loop from each checkpoint to the next one
+        points = np.array(checkpoints, dtype=np.float64)
+        self.segment_starts = points
+        self.segment_vectors = np.roll(points, -1, axis=0) - points
+        self.segment_lengths = np.maximum((self.segment_vectors[:, :2] ** 2).sum(axis=1), 1e-9)
+
+        # Rows of rays fan out over 90 degrees of pitch, which is all that matters for hitting the ground plane
+        pitches = np.radians(90 * (np.arange(8) - 4) / 8)
+        self.ray_pitches = np.broadcast_to(pitches[:, None], (8, 8))
+
+        self.vertical_speed = 0.0
+        self.camera_yaw = -2.5
+
+        self.normals_x = np.zeros(64, dtype='>f4').tobytes()
+        self.normals_y = self.normals_x
+        self.normals_z = np.ones(64, dtype='>f4').tobytes()
+
+        self.memory.write_uint(RC1Game.current_planet_address, kerwan)
+        self.memory.write_uint(RC1Game.death_count_address, 0)
+        self.memory.write(RC1Game.player_position_address, struct.pack('>3f', *self.spawn_position))
+
+    def ground(self, x, y):
+        """
+        Returns the ground height under (x, y) and how far (x, y) is from the middle of the track.
+        """
+        offsets = np.array((x, y)) - self.segment_starts[:, :2]
+        t = np.clip((offsets * self.segment_vectors[:, :2]).sum(axis=1) / self.segment_lengths, 0, 1)
+
+        closest = self.segment_starts + t[:, None] * self.segment_vectors
+        distances = np.hypot(closest[:, 0] - x, closest[:, 1] - y)
+
+        segment = np.argmin(distances)
+
+        return closest[segment, 2], distances[segment]
+
+    def read_vector(self, address):
+        return struct.unpack('>3f', self.memory.read(address, 12))
+
+    def write_vector(self, address, x, y, z):
+        self.memory.write(address, struct.pack('>3f', x, y, z))
+
+    def step(self):
+        buttons = self.memory.read_uint(RC1Game.input_address)
+        joysticks = self.memory.read_uint(RC1Game.joystick_address)
+
+        left_x = (joysticks & 0xFF) / 127 - 1
+        left_y = ((joysticks >> 8) & 0xFF) / 127 - 1
+        right_x = ((joysticks >> 16) & 0xFF) / 127 - 1
+
+        self.camera_yaw -= right_x * self.turn_speed
+
+        x, y, z = self.read_vector(RC1Game.player_position_address)
+        _, _, yaw = self.read_vector(RC1Game.player_rotation_address)
+        speed = self.memory.read_float(RC1Game.player_speed_address)
+
+        # The left stick moves the player relative to the camera, up on the stick is forward
+        forward_x, forward_y = math.cos(self.camera_yaw), math.sin(self.camera_yaw)
+        move_x = forward_x * -left_y + forward_y * left_x
+        move_y = forward_y * -left_y - forward_x * left_x
+        move = min(1.0, math.hypot(move_x, move_y))
+
+        if move > 0.1:
+            yaw = math.atan2(move_y, move_x)
+            speed = min(speed + self.acceleration, self.max_speed * move)
+        else:
+            speed *= self.friction
+
+        x += math.cos(yaw) * speed
+        y += math.sin(yaw) * speed
+
+        ground, distance_from_track = self.ground(x, y)
+        on_track = distance_from_track < self.track_width
+        grounded = on_track and z <= ground + 0.01
+
+        if grounded and buttons & button_cross:
+            self.vertical_speed = self.jump_speed
+            grounded = False
+
+        if not grounded:
+            self.vertical_speed -= self.gravity
+            z += self.vertical_speed
+
+            if on_track and z < ground and z > ground - 1.0:
+                z = ground
+                self.vertical_speed = 0.0
+        else:
+            z = ground
+            self.vertical_speed = 0.0
+
+        if z < ground - self.death_depth:
+            self.die()
+            return
+
+        self.write_vector(RC1Game.player_position_address, x, y, z)
+        self.write_vector(RC1Game.player_rotation_address, 0.0, 0.0, yaw)
+        self.memory.write(RC1Game.player_speed_address, struct.pack('>f', speed))
+        self.memory.write_uint(RC1Game.player_state_address, 0 if grounded else 3)
+
+        distance_from_ground = z - ground if on_track else self.ray_distance
+        self.memory.write(RC1Game.dist_from_ground_address, struct.pack('>f', distance_from_ground))
+
+        self.update_camera(x, y, z, ground if on_track else None)
+
+    def die(self):
+        self.memory.write_uint(RC1Game.death_count_address, self.memory.read_uint(RC1Game.death_count_address) + 1)
+
+        self.vertical_speed = 0.0
+        self.write_vector(RC1Game.player_position_address, *self.spawn_position)
+        self.memory.write(RC1Game.player_speed_address, struct.pack('>f', 0.0))
+
+    def update_camera(self, x, y, z, ground):
+        forward_x, forward_y = math.cos(self.camera_yaw), math.sin(self.camera_yaw)
+
+        camera_x, camera_y, camera_z = x - 6 * forward_x, y - 6 * forward_y, z + 3
+
+        self.write_vector(RC1Game.camera_position_address, camera_x, camera_y, camera_z)
+        self.write_vector(RC1Game.camera_rotation_address, 0.0, 0.0, self.camera_yaw)
+        self.write_vector(RC1Game.camera_forward_address, forward_x, forward_y, 0.0)
+        self.write_vector(RC1Game.camera_right_address, forward_y, -forward_x, 0.0)
+        self.write_vector(RC1Game.camera_up_address, 0.0, 0.0, 1.0)
+
+        # Rays only hit the ground plane under the player, anything that doesn't is a miss at the full ray distance
+        distances = np.full((8, 8), self.ray_distance)
+        classes = np.full((8, 8), self.no_hit_class, dtype=np.int64)
+
+        if ground is not None:
+            down = -np.sin(self.ray_pitches)
+            with np.errstate(divide='ignore'):
+                hit_distances = np.where(down > 0, (camera_z - ground) / down, np.inf)
+
+            hits = hit_distances < self.ray_distance
+            distances[hits] = hit_distances[hits]
+            classes[hits] = 0
+
+        self.memory.write(RC1Game.collisions_address, distances.astype('>f4').tobytes())
+        self.memory.write(RC1Game.collisions_class_address, classes.astype('>i4').tobytes())
+        self.memory.write(RC1Game.collisions_normals_x, self.normals_x)
+        self.memory.write(RC1Game.collisions_normals_y, self.normals_y)
+        self.memory.write(RC1Game.collisions_normals_z, self.normals_z)
+
+    def run(self, fps=None):
+        """
+        Runs a frame every time the frame progress is bumped past the frame counter, like the PRX does, as fast as the
+            workers ask for them or capped at `fps`.
+        """
+        while True:
+            target_frame = self.memory.read_uint(RC1Game.frame_progress_address)
+            frame_count = self.memory.read_uint(RC1Game.frame_count_address)
+
+            if frame_count >= target_frame:
+                sched_yield()
+                continue
+
+            while frame_count < target_frame:
+                start = time.perf_counter()
+
+                self.step()
+                frame_count += 1
+
+                if fps:
+                    time.sleep(max(0.0, 1 / fps - (time.perf_counter() - start)))
+
+            self.memory.write_uint(RC1Game.frame_count_address, frame_count)
+
+
+def run_simulator(name, fps=None):
+    """
+    Attaches to the shared memory created by whoever started us and runs the simulator on it.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+
+    FitnessCourseSimulator(GameMemory(buffer=memory.buf)).run(fps=fps)
+
+
+def start_simulator(fps=None, size=DEFAULT_MEMORY_SIZE):
+    """
+    Creates the shared memory and starts a simulator process on it. Returns the shared memory, which we have to unlink
+        when we're done with it, and the simulator process.
+    """
+    memory = shared_memory.SharedMemory(create=True, size=size)
+
+    process = multiprocessing.Process(target=run_simulator, args=(memory.name, fps), daemon=True)
+    process.start()
+
+    # Don't hand the memory out before the simulator has put us on the fitness course
+    game_memory = GameMemory(buffer=memory.buf)
+    while game_memory.read_uint(RC1Game.current_planet_address) != kerwan and process.is_alive():
+        time.sleep(0.01)
+    game_memory.view.release()
+
+    return memory, process
+
+
+def attach_simulator(name):
+    """
+    Attaches to the shared memory of a simulator that was started standalone.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+
+    # The standalone simulator is responsible for unlinking its memory, not us
+    resource_tracker.unregister(memory._name, "shared_memory")
+
+    return memory
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", type=str, default="rac1-simulator")
+    parser.add_argument("--fps", type=float, default=None)
+
+    args = parser.parse_args()
+
+    memory = shared_memory.SharedMemory(name=args.name, create=True, size=DEFAULT_MEMORY_SIZE)
+    print(f"Simulator running on shared memory {memory.name}")
+
+    try:
+        FitnessCourseSimulator(GameMemory(buffer=memory.buf)).run(fps=args.fps)
+    except KeyboardInterrupt:
+        print("Exiting...")
+    finally:
+        memory.unlink()
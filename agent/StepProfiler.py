@@ -0,0 +1,128 @@
+import time
+
+import numpy as np
+
+
+class StepProfiler:
+    """
+    Times the phases of every step of the worker loop, to tell whether a worker is held up by the emulator, inference
+        or the network.
+
+    Call begin_step() at the start of every step and lap(phase) at the end of every phase, which adds the time since
+        the last lap to that phase. A phase can be lapped more than once per step. end_step() keeps the per step totals
+        of the last `history` steps, and every `report_interval` seconds returns a summary of them, see summary().
+    """
+    phases = (
+        "backpressure",   # Waiting for the learner's buffer to have room, see RedisHub.check_buffer_full
+        "model_check",    # Checking for and loading new models
+        "choose_action",  # Inference
+        "write",          # Sending the actions to the game
+        "frame_wait",     # Waiting for the game to run its frames
+        "read",           # Reading the game's memory
+        "compute",        # Rewards and the observation
+        "reset",          # Resetting environments whose episodes ended
+        "redis_add",      # Sending the transition
+        "other",          # Everything else in the loop
+    )
+
+    def __init__(self, history=4096, report_interval=5.0):
+        self.history = history
+        self.report_interval = report_interval
+
+        self.index = {phase: i for i, phase in enumerate(self.phases)}
+
+        # Seconds spent in each phase in the current step, and in each of the last `history` steps
+        self.current = [0.0] * len(self.phases)
+        self.times = np.zeros((history, len(self.phases)), dtype=np.float64)
+        self.steps = 0
+
+        # Environment steps since the last report, a loop step can step more than one environment
+        self.report_steps = 0
+        self.report_time = time.perf_counter()
+
+        self.last = None
+
+    def begin_step(self):
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        if self.last is None:
+            # Not in a step
+            return
+
+        now = time.perf_counter()
+        self.current[self.index[phase]] += now - self.last
+        self.last = now
+
+    def end_step(self, env_steps=1):
+        """
+        Ends a step of the loop that stepped `env_steps` environments. Returns a summary every `report_interval`
+            seconds, otherwise None.
+        """
+        self.lap("other")
+
+        self.times[self.steps % self.history] = self.current
+        self.current = [0.0] * len(self.phases)
+
+        self.steps += 1
+        self.report_steps += env_steps
+
+        now, self.last = self.last, None
+
+        if now - self.report_time < self.report_interval:
+            return None
+
+        summary = self.summary(self.report_steps / (now - self.report_time))
+
+        self.report_steps = 0
+        self.report_time = now
+
+        return summary
+
+    def summary(self, steps_per_sec=0.0):
+        """
+        Flat dict of the steps/sec and of the mean, p50 and p99 time of each phase in milliseconds, over the recent
+            steps, e.g. {"steps_per_sec": 1200.0, "frame_wait_mean": 0.41, "frame_wait_p50": 0.38, ...}.
+        """
+        times = self.times[:min(self.steps, self.history)] * 1000
+        if len(times) == 0:
+            times = np.zeros((1, len(self.phases)))
+
+        means = times.mean(axis=0)
+        p50, p99 = np.percentile(times, (50, 99), axis=0)
+
+        summary = {"steps_per_sec": round(float(steps_per_sec), 1),
+                   "step_ms": round(float(times.sum(axis=1).mean()), 4)}
+        for i, phase in enumerate(self.phases):
+            summary[f"{phase}_mean"] = round(float(means[i]), 4)
+            summary[f"{phase}_p50"] = round(float(p50[i]), 4)
+            summary[f"{phase}_p99"] = round(float(p99[i]), 4)
+
+        return summary
+
+    @classmethod
+    def format_summary(cls, summary):
+        """
+        One line with the steps/sec and the share of the step time each phase takes, biggest first.
+        """
+        step_ms = summary["step_ms"] or 1.0
+        shares = sorted(((summary[f"{phase}_mean"] / step_ms, phase) for phase in cls.phases), reverse=True)
+
+        return f"{summary['steps_per_sec']:.0f} steps/sec, {step_ms:.2f} ms/step: " + \
+            " ".join(f"{phase} {share * 100:.0f}%" for share, phase in shares if share >= 0.005)
+
+    @classmethod
+    def fleet_summary(cls, profiles):
+        """
+        Combines the summaries of many workers, e.g. from RedisHub.get_worker_profiles(), into one: their total
+            steps/sec and the mean time of each phase weighted by how many steps each worker ran.
+        """
+        total = sum(profile.get("steps_per_sec", 0.0) for profile in profiles)
+        weights = [profile.get("steps_per_sec", 0.0) / total if total > 0 else 1 / len(profiles)
+                   for profile in profiles]
+
+        summary = {"steps_per_sec": total, "workers": len(profiles)}
+        for key in ["step_ms"] + [f"{phase}_mean" for phase in cls.phases]:
+            summary[key] = sum(weight * profile.get(key, 0.0) for weight, profile in zip(weights, profiles))
+
+        return summary
@@ -0,0 +1,124 @@
+"""
+Binary wire format for groups of transitions, observations or recurrent states, which the learner decodes into
+    tensors that point straight into the message with torch.frombuffer, without unpickling anything.
+
+A message is:
+    - the header: magic, version, kind of message, number of fields, number of items, length of the worker name
+    - a descriptor for each field: dtype, number of dimensions and shape of one item's tensor, padded to 4 dims
+    - the worker name in UTF-8
+    - each field's (items, *shape) tensor as raw little-endian bytes, starting at a multiple of 8 bytes
+"""
+import struct
+import sys
+import warnings
+
+import torch
+
+if sys.byteorder != 'little':
+    raise ImportError("Tensors are written as they are in memory, so this only works on little-endian hosts")
+
+magic = b'RCTR'
+version = 4
+
+# What the fields are, e.g. a Transition or Observations in RedisHub
+transitions_kind = 0
+observations_kind = 1
+recurrent_states_kind = 2
+
+header_format = struct.Struct('<4sHHHIH')
+descriptor_format = struct.Struct('<BB4I')
+
+max_dims = 4
+alignment = 8
+
+dtypes = [torch.bfloat16, torch.float16, torch.float32, torch.float64, torch.bool, torch.uint8, torch.int32,
+          torch.int64]
+dtype_codes = {dtype: code for code, dtype in enumerate(dtypes)}
+
+
+def padding(size):
+    return -size % alignment
+
+
+def is_encoded(data):
+    return data[:len(magic)] == magic
+
+
+def encode_fields(kind, worker_name, fields):
+    """
+    Encodes the tensors in `fields`, all stacked along a first dimension of the same number of items, and the name of
+        the worker that sent them.
+    """
+    name = worker_name.encode()
+    count = len(fields[0])
+
+    descriptors = []
+    payloads = []
+    position = header_format.size + descriptor_format.size * len(fields) + len(name)
+
+    for field in fields:
+        if len(field) != count:
+            raise ValueError(f"Expected {count} items in every field, got {len(field)}")
+
+        shape = field.shape[1:]
+        if len(shape) > max_dims:
+            raise ValueError(f"Fields can have at most {max_dims} dimensions per item, got {tuple(shape)}")
+
+        descriptors.append(descriptor_format.pack(dtype_codes[field.dtype], len(shape),
+                                                  *shape, *[0] * (max_dims - len(shape))))
+
+        payloads.append(bytes(padding(position)))
+        position += padding(position)
+
+        data = field.detach().to('cpu').contiguous().reshape(-1).view(torch.uint8).numpy()
+        payloads.append(data)
+        position += data.nbytes
+
+    header = header_format.pack(magic, version, kind, len(fields), count, len(name))
+
+    return b''.join((header, *descriptors, name, *payloads))
+
+
+def decode_fields(data):
+    """
+    Returns the kind, worker name and list of field tensors of a message from encode_fields(). The tensors are views
+        of `data`.
+    """
+    message_magic, message_version, kind, n_fields, count, name_length = header_format.unpack_from(data)
+
+    if message_magic != magic or message_version != version:
+        raise ValueError(f"Not a version {version} transition message")
+
+    position = header_format.size
+
+    descriptors = []
+    for _ in range(n_fields):
+        descriptors.append(descriptor_format.unpack_from(data, position))
+        position += descriptor_format.size
+
+    worker_name = bytes(data[position:position + name_length]).decode()
+    position += name_length
+
+    fields = []
+    with warnings.catch_warnings():
+        # The tensors share the message's bytes, which are read-only. Nothing on the learner writes to them in place.
+        warnings.filterwarnings("ignore", message="The given buffer is not writable")
+
+        for code, ndim, *dims in descriptors:
+            dtype = dtypes[code]
+            shape = (count, *dims[:ndim])
+
+            position += padding(position)
+
+            elements = 1
+            for size in shape:
+                elements *= size
+
+            if elements == 0:
+                fields.append(torch.empty(shape, dtype=dtype))
+                continue
+
+            fields.append(torch.frombuffer(data, dtype=dtype, count=elements, offset=position).view(shape))
+            position += elements * fields[-1].element_size()
+
+    return kind, worker_name, fields
@@ -0,0 +1,293 @@
+import os
+import pickle
+import queue
+import struct
+import tempfile
+import time
+from collections import deque
+from threading import Lock, Thread
+
+import numpy as np
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+
+class TransitionSender:
+    """
+    Publishes messages to a Redis channel from a background thread, so the step loop only has to queue them and the
+        network round trips overlap with inference and the next frame advance.
+
+    The thread encodes whatever is in the queue with `encode` and publishes it in one pipeline, up to `batch_size`
+        messages per round trip. Messages are encoded on the thread, so the caller must not modify the tensors in them
+        after put().
+
+    `channel` can also be a function that returns the channel of each message, and `publish(pipeline, channel, data)`
+        can send them some other way than PUBLISH, e.g. XADD to a stream, or right away, e.g. to shared memory.
+
+    Batches are sent again after connection errors, starting from the message that failed if publish() had already
+        sent the ones before it. A message that fails with any other error can never be sent, and is dropped.
+
+    When the queue holds `queue_size` messages, `full_policy` decides what put() does:
+        block: Waits for the thread to make room, the step loop runs at the pace of the network.
+        drop_oldest: Drops the oldest message in the queue. The learner misses those transitions.
+        spill: Hands it to the thread to encode and append to a file on disk instead, which it sends once the queue is
+            empty. Messages keep their order, everything after the first spilled message is spilled until the file
+            is sent.
+    """
+    full_policies = ("block", "drop_oldest", "spill")
+
+    # Errors after which sending the same messages again can work
+    retry_errors = (RedisConnectionError, RedisTimeoutError, ConnectionError, TimeoutError)
+
+    # Each spilled message: size of the channel and of the encoded message, followed by both
+    spill_format = '<II'
+
+    def __init__(self, redis, channel, queue_size=256, full_policy="block", batch_size=64, spill_path=None,
+                 latency_history=1024, encode=pickle.dumps, publish=None):
+        if full_policy not in self.full_policies:
+            raise ValueError(f"Unknown full policy {full_policy}, expected one of {self.full_policies}")
+
+        self.redis = redis
+        self.channel = channel
+        self.full_policy = full_policy
+        self.batch_size = batch_size
+        self.encode = encode
+        self.publish = publish if publish is not None else self.publish_message
+
+        # (time queued, message)
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # (time queued, message) waiting for the thread to spill them, so put() never encodes or writes to disk
+        self.overflow = deque()
+
+        self.spill_lock = Lock()
+        self.spill_file = None
+        self.spill_read = 0
+        self.spilled = 0
+        if full_policy == "spill":
+            if spill_path is None:
+                fd, spill_path = tempfile.mkstemp(prefix="transitions-", suffix=".spill")
+                os.close(fd)
+
+            self.spill_path = spill_path
+            self.spill_file = open(spill_path, 'w+b')
+
+        self.sent = 0
+        self.dropped = 0
+        self.spilled_total = 0
+        self.batches = 0
+
+        # Seconds from put() to the end of the round trip that sent the message, for the last `latency_history` messages
+        self.latencies = np.zeros(latency_history)
+        self.latency_count = 0
+
+        self.running = True
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, message):
+        item = (time.perf_counter(), message)
+
+        if self.full_policy == "block":
+            self.queue.put(item)
+        elif self.full_policy == "drop_oldest":
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    pass
+
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+        else:
+            with self.spill_lock:
+                if self.spilled == 0 and not self.overflow:
+                    try:
+                        self.queue.put_nowait(item)
+                        return
+                    except queue.Full:
+                        pass
+
+                self.overflow.append(item)
+
+    @staticmethod
+    def publish_message(pipeline, channel, data):
+        pipeline.publish(channel, data)
+
+    def channel_of(self, message):
+        return self.channel(message) if callable(self.channel) else self.channel
+
+    def spill_overflow(self):
+        """
+        Encodes the messages put() handed over and appends them to the spill file, on the thread.
+        """
+        while self.overflow:
+            # Only taken off once it's in the file, until then put() keeps spilling what comes after it
+            queued, message = self.overflow[0]
+            channel, data = self.channel_of(message).encode(), self.encode(message)
+
+            with self.spill_lock:
+                self.spill_file.seek(0, os.SEEK_END)
+                self.spill_file.write(struct.pack(self.spill_format, len(channel), len(data)))
+                self.spill_file.write(channel)
+                self.spill_file.write(data)
+
+                self.overflow.popleft()
+                self.spilled += 1
+                self.spilled_total += 1
+
+    def read_spill(self):
+        """
+        Reads up to `batch_size` spilled messages as (time queued, channel, encoded message), oldest first. The file is emptied
+            once all of it has been read.
+        """
+        items = []
+
+        with self.spill_lock:
+            if self.spilled == 0:
+                return items
+
+            self.spill_file.flush()
+            self.spill_file.seek(self.spill_read)
+
+            # We don't keep when spilled messages were queued, their latency counts from when they're read back
+            now = time.perf_counter()
+
+            size_bytes = struct.calcsize(self.spill_format)
+            while self.spilled > 0 and len(items) < self.batch_size:
+                channel_size, size = struct.unpack(self.spill_format, self.spill_file.read(size_bytes))
+                items.append((now, self.spill_file.read(channel_size).decode(), self.spill_file.read(size)))
+
+                self.spill_read += size_bytes + channel_size + size
+                self.spilled -= 1
+
+            if self.spilled == 0:
+                self.spill_file.seek(0)
+                self.spill_file.truncate()
+                self.spill_read = 0
+
+        return items
+
+    def next_batch(self):
+        """
+        The next batch of (time queued, channel, encoded message) to send: everything queued, up to `batch_size`, and once the
+            queue is empty, spilled messages.
+        """
+        items = []
+
+        self.spill_overflow()
+
+        try:
+            # Don't wait for more when there are spilled messages to send
+            items.append(self.queue.get(timeout=0.1 if self.spilled == 0 else 0))
+        except queue.Empty:
+            return self.read_spill()
+
+        while len(items) < self.batch_size:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return [(queued, self.channel_of(message), self.encode(message)) for queued, message in items]
+
+    def run(self):
+        batch = []
+
+        while self.running or batch or not self.queue.empty() or self.spilled > 0 or self.overflow:
+            if not batch:
+                batch = self.next_batch()
+                if not batch:
+                    continue
+
+            # How many messages of the batch publish() took before one failed
+            published = 0
+            error = None
+
+            pipeline = self.redis.pipeline(transaction=False)
+            for _, channel, data in batch:
+                try:
+                    self.publish(pipeline, channel, data)
+                except Exception as e:
+                    error = e
+                    break
+
+                published += 1
+
+            try:
+                pipeline.execute()
+            except self.retry_errors as e:
+                # Keep the batch and try again, Redis might be restarting
+                print(f"Failed to send {len(batch)} transitions: {e}")
+                time.sleep(1.0)
+                continue
+            except Exception as e:
+                print(f"Dropping {published} transitions Redis didn't take: {e}")
+                self.dropped += published
+                batch = batch[published:]
+                continue
+
+            self.record_sent(batch[:published])
+            batch = batch[published:]
+
+            if error is None:
+                continue
+
+            if isinstance(error, self.retry_errors):
+                print(f"Failed to send {len(batch)} transitions: {error}")
+                time.sleep(1.0)
+            else:
+                print(f"Dropping a message that can't be sent: {error}")
+                self.dropped += 1
+                batch = batch[1:]
+
+    def record_sent(self, items):
+        if not items:
+            return
+
+        now = time.perf_counter()
+        for queued, _, _ in items:
+            self.latencies[self.latency_count % len(self.latencies)] = now - queued
+            self.latency_count += 1
+
+        self.sent += len(items)
+        self.batches += 1
+
+    def close(self, timeout=10.0):
+        """
+        Sends what's left in the queue and the spill file, waiting up to `timeout` seconds, and stops the thread.
+        """
+        self.running = False
+        self.thread.join(timeout)
+
+        if self.thread.is_alive():
+            print(f"Gave up sending {self.queue.qsize() + self.spilled + len(self.overflow)} transitions")
+            return
+
+        if self.spill_file is not None:
+            self.spill_file.close()
+            os.remove(self.spill_path)
+            self.spill_file = None
+
+    def metrics(self):
+        """
+        Flat dict of the queue depth, how many messages were sent, dropped and spilled, and the mean and p99 send
+            latency in milliseconds over the recent messages.
+        """
+        latencies = self.latencies[:min(self.latency_count, len(self.latencies))] * 1000
+        if len(latencies) == 0:
+            latencies = np.zeros(1)
+
+        return {
+            "send_queue_depth": float(self.queue.qsize()),
+            "send_spilled": float(self.spilled + len(self.overflow)),
+            "sent": float(self.sent),
+            "send_dropped": float(self.dropped),
+            "send_spilled_total": float(self.spilled_total),
+            "send_batch_mean": round(self.sent / self.batches, 2) if self.batches > 0 else 0.0,
+            "send_latency_mean": round(float(latencies.mean()), 4),
+            "send_latency_p99": round(float(np.percentile(latencies, 99)), 4),
+        }
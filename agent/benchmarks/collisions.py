@@ -0,0 +1,97 @@
+"""
+Compares the original scalar RC1Game.get_collisions and get_collisions_with_normals loops against the bulk-read
+    versions, after checking that both give the same values.
+
+Run from the agent directory: python -m benchmarks.collisions
+"""
+import numpy as np
+
+from benchmarks.common import FileProcess, FilePreadProcess, memory_file, timeit
+
+from Game.RC1Game import RC1Game
+
+iterations = 2000
+
+
+def get_collisions_scalar(game, normalized=True):
+    """The loop get_collisions used before it read the grid in bulk."""
+    collisions = []
+    classes = []
+
+    for i in range(8):
+        for j in range(8):
+            offset = 4 * (i * 8 + j)
+
+            collision_value = game.process.read_float(game.collisions_address + offset)
+            class_value = game.process.read_int(game.collisions_class_address + offset)
+
+            if normalized:
+                collision_value = np.interp(collision_value, [-32, 64], [-1, 1])
+                class_value = np.interp(class_value, [-2, 4096], [-1, 1])
+
+            collisions.append(collision_value)
+            classes.append(class_value)
+
+    return [*collisions, *classes]
+
+
+def get_collisions_with_normals_scalar(game):
+    """The loop get_collisions_with_normals used before it read the grids in bulk."""
+    channels = ([], [], [], [], [])
+    addresses = (game.collisions_address, game.collisions_class_address,
+                 game.collisions_normals_x, game.collisions_normals_y, game.collisions_normals_z)
+
+    for i in range(8):
+        for j in range(8):
+            offset = 4 * (i * 8 + j)
+
+            for n, (channel, address) in enumerate(zip(channels, addresses)):
+                if n == 1:
+                    channel.append(game.process.read_int(address + offset))
+                else:
+                    channel.append(game.process.read_float(address + offset))
+
+    return channels
+
+
+def fill_raycasts(process):
+    rng = np.random.default_rng(0)
+
+    distances = rng.uniform(-40, 70, 64).astype('>f4')
+    distances[:8] = -32.0
+
+    classes = rng.integers(-2, 5000, 64).astype('>i4')
+    classes[:8] = -2
+
+    process.write_memory(RC1Game.collisions_address, distances.tobytes())
+    process.write_memory(RC1Game.collisions_class_address, classes.tobytes())
+
+    for address in (RC1Game.collisions_normals_x, RC1Game.collisions_normals_y, RC1Game.collisions_normals_z):
+        process.write_memory(address, rng.uniform(-1, 1, 64).astype('>f4').tobytes())
+
+
+if __name__ == "__main__":
+    with memory_file(RC1Game.offset + 0x1000000) as path:
+        for process_class in (FileProcess, FilePreadProcess):
+            game = RC1Game(pid=0)
+            game.process = process_class(path, base_offset=RC1Game.offset)
+
+            fill_raycasts(game.process)
+
+            for normalized in (True, False):
+                expected = np.array(get_collisions_scalar(game, normalized), dtype=np.float64)
+                actual = game.get_collisions(normalized)
+                assert np.array_equal(expected.view(np.int64), actual.view(np.int64)), "Observations differ"
+
+            for expected, actual in zip(get_collisions_with_normals_scalar(game), game.get_collisions_with_normals()):
+                assert np.array_equal(np.array(expected).reshape(8, 8), actual), "Normals differ"
+
+            print(f"{process_class.__name__}:")
+            scalar = timeit("  scalar get_collisions", lambda: get_collisions_scalar(game), iterations)
+            bulk = timeit("  bulk get_collisions", lambda: game.get_collisions(), iterations)
+            print(f"  speedup: {scalar / bulk:.1f}x")
+
+            scalar = timeit("  scalar get_collisions_with_normals",
+                            lambda: get_collisions_with_normals_scalar(game), iterations)
+            bulk = timeit("  bulk get_collisions_with_normals", lambda: game.get_collisions_with_normals(), iterations)
+            print(f"  speedup: {scalar / bulk:.1f}x")
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from Game.LinuxProcess import Process, PreadProcess
+
+
+class FileProcess(Process):
+    """
+    `Process` that reads and writes a regular file instead of /proc/<pid>/mem.
+    """
+    def __init__(self, path, base_offset=0):
+        super().__init__(os.getpid(), base_offset=base_offset)
+        self.path = path
+
+        # process_vm_readv/writev would access our own address space, not the file
+        self.vm_readv = False
+        self.vm_writev = False
+
+    def memory_path(self):
+        return self.path
+
+
+class FilePreadProcess(PreadProcess):
+    """
+    `PreadProcess` that reads and writes a regular file instead of /proc/<pid>/mem.
+    """
+    def __init__(self, path, base_offset=0):
+        super().__init__(os.getpid(), base_offset=base_offset)
+        self.path = path
+
+        # process_vm_readv/writev would access our own address space, not the file
+        self.vm_readv = False
+        self.vm_writev = False
+
+    def memory_path(self):
+        return self.path
+
+
+@contextmanager
+def memory_file(size):
+    """
+    Creates a sparse temporary file of the given size that stands in for the emulator's memory.
+    """
+    # Prefer a RAM-backed directory so we measure syscall overhead rather than the disk
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+    fd, path = tempfile.mkstemp(prefix="rac1-memory-", dir=directory)
+    try:
+        os.ftruncate(fd, size)
+        os.close(fd)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def timeit(name, function, iterations):
+    # Warm up so we don't measure first-touch page faults
+    for _ in range(min(iterations, 100)):
+        function()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<40} {elapsed / iterations * 1e6:10.2f} us/call")
+
+    return elapsed / iterations
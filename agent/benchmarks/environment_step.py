@@ -0,0 +1,48 @@
+"""
+Measures FitnessCourseEnvironment steps/sec against the in-memory `GameMemory` backend, with the frame counter advanced
+    by a harness the way the PRX does it, so the numbers only include the agent side of a step.
+
+Run from the agent directory: python -m benchmarks.environment_step
+"""
+import time
+
+from Environments.FitnessCourseEnvironment import FitnessCourseEnvironment
+from Game.MemoryProcess import GameMemory
+from Game.RC1Game import RC1Game
+
+steps = 5000
+
+# Kerwan, where the fitness course is
+kerwan = 3
+
+
+def make_memory():
+    memory = GameMemory()
+    memory.advance_frames_on_write(RC1Game.frame_count_address, RC1Game.frame_progress_address)
+
+    memory.write_uint(RC1Game.current_planet_address, kerwan)
+    memory.write_uint(RC1Game.death_count_address, 1)
+
+    return memory
+
+
+def run(name, **kwargs):
+    env = FitnessCourseEnvironment(pid=0, memory=make_memory(), **kwargs)
+    env.game.open_process()
+    env.reset()
+
+    actions = [0.5, -0.5, 1.0, 0.0, 0.0, 1.0, 0.0]
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(actions)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<40} {steps / elapsed:10.0f} steps/sec {elapsed / steps * 1e6:10.2f} us/step")
+
+
+if __name__ == "__main__":
+    run("default")
+    run("cache_reads", cache_reads=True)
+    run("batch_writes", batch_writes=True)
+    run("cache_reads + batch_writes", cache_reads=True, batch_writes=True)
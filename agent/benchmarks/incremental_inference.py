@@ -0,0 +1,127 @@
+"""
+Runs an episode of simulator observations through the policy in window mode (`ActorCritic.act`, the whole window every
+    step) and in incremental mode (`ActorCritic.act_step`, only the newest observation), and reports how far the action
+    means, standard deviations and state values of the incremental mode drift from window mode, along with the time
+    per step of both. Pass a model saved by the learner to check trained weights instead of freshly initialized ones.
+
+Run from the agent directory: python -m benchmarks.incremental_inference [--model models_bak/...pth] [--steps 1000]
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from Environments.FitnessCourseEnvironment import FitnessCourseEnvironment
+from Game.MemoryProcess import GameMemory
+from Game.RC1Game import RC1Game
+from PPO.ActorCritic import ActorCritic
+from PPO.RecurrentStateStore import RecurrentState
+from SequenceWindow import SequenceWindow
+from Simulator import FitnessCourseSimulator
+
+features = 27 + 128
+sequence_length = 30
+
+
+def record_observations(steps):
+    memory = GameMemory()
+    simulator = FitnessCourseSimulator(memory)
+    memory.advance_frames_on_write(RC1Game.frame_count_address, RC1Game.frame_progress_address,
+                                   step=lambda _: simulator.step())
+
+    env = FitnessCourseEnvironment(pid=0, memory=memory)
+    env.start()
+
+    rng = np.random.default_rng(0)
+
+    # Observations are overwritten by the next step, so keep copies
+    observations = [env.reset()[0].clone()]
+    for _ in range(steps - 1):
+        observations.append(env.step(rng.uniform(-1, 1, 7))[0].clone())
+
+    env.stop()
+
+    return observations
+
+
+def run(policy, observations, incremental):
+    """
+    Returns the action means, standard deviations and state values for every step, and the seconds per step.
+    """
+    recurrent_state = policy.initial_state()
+
+    window = SequenceWindow(sequence_length, features)
+    window.reset()
+
+    outputs = []
+    elapsed = 0.0
+
+    for observation in observations:
+        window.append(observation)
+        state = window.batch
+
+        start = time.perf_counter()
+
+        if incremental:
+            _, _, mu, log_std, (actor_hidden, actor_cell) = \
+                policy.actor.get_action(state[:, -1:, :], hidden_state=recurrent_state.actor_hidden,
+                                        cell_state=recurrent_state.actor_cell)
+            state_value, (critic_hidden, critic_cell) = \
+                policy.critic.step(state[:, -1:, :], recurrent_state.critic_hidden, recurrent_state.critic_cell)
+
+            recurrent_state = RecurrentState(actor_hidden, actor_cell, critic_hidden, critic_cell)
+        else:
+            _, _, mu, log_std, (hidden_states, cell_states) = \
+                policy.actor.get_action(state, hidden_state=recurrent_state.actor_hidden,
+                                        cell_state=recurrent_state.actor_cell)
+            state_value = policy.critic(state, hidden_states=hidden_states, cell_states=cell_states)
+
+            recurrent_state = recurrent_state._replace(actor_hidden=hidden_states, actor_cell=cell_states)
+
+        elapsed += time.perf_counter() - start
+
+        outputs.append(torch.cat((mu.flatten(), log_std.flatten(), state_value.flatten())).float())
+
+    return torch.stack(outputs), elapsed / len(observations)
+
+
+def report(name, drift):
+    per_step = drift.max(dim=1).values
+
+    print(f"{name:<12} mean {drift.mean().item():10.5f}   max {drift.max().item():10.5f}   "
+          f"max in first {sequence_length} steps {per_step[:sequence_length].max().item():10.5f}   "
+          f"max after {per_step[sequence_length:].max().item() if len(per_step) > sequence_length else 0.0:10.5f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--steps", type=int, default=1000)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+
+    policy = ActorCritic(features, 7, log_std=-0.5)
+    policy.actor.max_log_std = 0.8
+
+    if args.model:
+        policy.load_state_dict(torch.load(args.model, map_location="cpu")['model_state_dict'])
+
+    policy.eval()
+
+    observations = record_observations(args.steps)
+
+    with torch.no_grad():
+        window_outputs, window_time = run(policy, observations, incremental=False)
+        incremental_outputs, incremental_time = run(policy, observations, incremental=True)
+
+    drift = (incremental_outputs - window_outputs).abs()
+
+    print(f"Absolute drift of incremental mode from window mode over {len(observations)} steps:")
+    report("action mean", drift[:, :7])
+    report("action std", drift[:, 7:14])
+    report("state value", drift[:, 14:])
+
+    print(f"{'window':<12} {window_time * 1e3:10.2f} ms/step")
+    print(f"{'incremental':<12} {incremental_time * 1e3:10.2f} ms/step")
@@ -0,0 +1,91 @@
+"""
+Compares building the FitnessCourseEnvironment observation as a list of np.interp calls converted with torch.tensor,
+    like step used to, against ObservationBuilder, after checking that both give the same observations. Then measures
+    FitnessCourseEnvironment steps/sec against the simulator.
+
+Run from the agent directory: python -m benchmarks.observation
+"""
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.common import timeit
+
+from Environments.FitnessCourseEnvironment import FitnessCourseEnvironment
+from Environments.ObservationBuilder import ObservationBuilder
+from Game.Game import affine_interp
+from Game.MemoryProcess import GameMemory
+from Game.RC1Game import RC1Game
+from Simulator import FitnessCourseSimulator
+
+iterations = 20000
+steps = 5000
+
+specs = FitnessCourseEnvironment.observation_features
+scalars = 27
+
+
+def build_list(values, collisions):
+    """How step used to build the observation."""
+    state = [np.interp(value, (spec.low, spec.high), (-1, 1)) if spec.low is not None else value
+             for spec, value in zip(specs[:scalars], values)]
+
+    normalized = np.empty(128, dtype=np.float64)
+    affine_interp(collisions[:64], [-32, 64], [-1, 1], out=normalized[:64])
+    affine_interp(collisions[64:], [-2, 4096], [-1, 1], out=normalized[64:])
+
+    return torch.tensor([*state, *normalized], dtype=torch.bfloat16)
+
+
+def build_vectorized(builder, values, collisions):
+    builder.raw[:scalars] = values
+    builder.raw[scalars:] = collisions
+
+    return builder.build()
+
+
+def random_inputs(rng):
+    values = tuple(float(value) for value in rng.uniform(-600, 600, scalars))
+    collisions = np.concatenate((rng.uniform(-40, 70, 64), rng.integers(0, 0xFFFFFFFF, 64)))
+
+    # Hit the end points exactly as well
+    collisions[:4] = (-32, 64, -40, 70)
+
+    return values, collisions
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    builder = ObservationBuilder(specs)
+
+    for _ in range(10000):
+        values, collisions = random_inputs(rng)
+        expected = build_list(values, collisions)
+        actual = build_vectorized(builder, values, collisions)
+        assert torch.equal(expected.view(torch.int16), actual.view(torch.int16)), "Observations differ"
+
+    values, collisions = random_inputs(rng)
+    before = timeit("list + torch.tensor", lambda: build_list(values, collisions), iterations)
+    after = timeit("ObservationBuilder", lambda: build_vectorized(builder, values, collisions), iterations)
+    print(f"speedup: {before / after:.1f}x")
+
+    memory = GameMemory()
+    simulator = FitnessCourseSimulator(memory)
+    memory.advance_frames_on_write(RC1Game.frame_count_address, RC1Game.frame_progress_address,
+                                   step=lambda _: simulator.step())
+
+    env = FitnessCourseEnvironment(pid=0, memory=memory)
+    env.start()
+    env.reset()
+
+    actions = rng.uniform(-1, 1, (steps, 7))
+
+    start = time.perf_counter()
+    for action in actions:
+        if env.step(action)[2]:
+            env.reset()
+    elapsed = time.perf_counter() - start
+
+    print(f"{'FitnessCourseEnvironment.step':<40} {steps / elapsed:10.0f} steps/sec {elapsed / steps * 1e6:10.2f} "
+          f"us/step (includes the simulator)")
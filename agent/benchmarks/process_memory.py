@@ -0,0 +1,64 @@
+"""
+Compares the open-per-call `Process` against the persistent descriptor `PreadProcess` on a file-backed stand-in for
+    the emulator's memory, and scalar reads against vectored `read_many` reads.
+
+Run from the agent directory: python -m benchmarks.process_memory
+"""
+import ctypes
+import os
+
+from benchmarks.common import FileProcess, FilePreadProcess, memory_file, timeit
+
+from Game.LinuxProcess import Process
+from Game.RC1Game import RC1Game
+
+iterations = 20000
+
+step_regions = [
+    (RC1Game.player_position_address, 12),
+    (RC1Game.player_rotation_address, 12),
+    (RC1Game.camera_position_address, 12),
+    (RC1Game.camera_rotation_address, 12),
+    (RC1Game.player_speed_address, 4),
+    (RC1Game.player_state_address, 4),
+    (RC1Game.dist_from_ground_address, 4),
+    (RC1Game.death_count_address, 4),
+]
+
+
+def read_scalar(process):
+    for address, size in step_regions:
+        process.read_memory(address, size)
+
+
+def run(name, process):
+    print(f"{name}:")
+    read_int = timeit("  read_int", lambda: process.read_int(RC1Game.frame_count_address), iterations)
+    timeit("  read_memory(12)", lambda: process.read_memory(RC1Game.player_position_address, 12), iterations)
+    timeit("  write_int", lambda: process.write_int(RC1Game.input_address, 0x40), iterations)
+    timeit(f"  {len(step_regions)} regions, one at a time", lambda: read_scalar(process), iterations)
+    timeit(f"  {len(step_regions)} regions, read_many", lambda: process.read_many(step_regions), iterations)
+
+    buffer = bytearray(sum(size for _, size in step_regions))
+    timeit(f"  {len(step_regions)} regions, read_many_into", lambda: process.read_many_into(step_regions, buffer),
+           iterations)
+
+    if process.process_handle is not None:
+        process.close_process()
+
+    return read_int
+
+
+if __name__ == "__main__":
+    with memory_file(RC1Game.offset + 0x1000000) as path:
+        file_time = run("Process", FileProcess(path, base_offset=RC1Game.offset))
+        pread_time = run("PreadProcess", FilePreadProcess(path, base_offset=RC1Game.offset))
+
+    print(f"read_int speedup: {file_time / pread_time:.1f}x\n")
+
+    # process_vm_readv needs a real address space, so point a Process at a buffer in our own process instead
+    memory = bytearray(b"\x01" * 0x1000000)
+    process = Process(os.getpid(), base_offset=ctypes.addressof(ctypes.c_char.from_buffer(memory)))
+    print(f"process_vm_readv available: {process.vm_readv}")
+    timeit(f"  {len(step_regions)} regions, one at a time", lambda: read_scalar(process), iterations)
+    timeit(f"  {len(step_regions)} regions, read_many", lambda: process.read_many(step_regions), iterations)
@@ -0,0 +1,90 @@
+"""
+Records a memory trace of FitnessCourseEnvironment running against the simulator, replays it through `ReplayProcess`
+    after checking that the replay gives the same observations, and measures steps/sec of the replay. Pass a trace
+    recorded with `worker.py --record-trace` to replay real game data instead.
+
+Run from the agent directory: python -m benchmarks.replay_step [trace]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from Environments.FitnessCourseEnvironment import FitnessCourseEnvironment
+from Game.MemoryProcess import GameMemory
+from Game.MemoryTrace import TraceReader, TraceWriter
+from Game.RC1Game import RC1Game
+from Simulator import FitnessCourseSimulator
+
+steps = 5000
+
+
+def run_episode(env, actions):
+    np.random.seed(0)
+
+    # Observations are overwritten by the next step, so keep copies
+    observations = [env.reset()[0].clone()]
+    for action in actions:
+        observations.append(env.step(action)[0].clone())
+
+    return torch.stack(observations)
+
+
+def record(path, actions):
+    memory = GameMemory()
+    simulator = FitnessCourseSimulator(memory)
+    memory.advance_frames_on_write(RC1Game.frame_count_address, RC1Game.frame_progress_address,
+                                   step=lambda _: simulator.step())
+
+    writer = TraceWriter.for_game(path, RC1Game)
+
+    env = FitnessCourseEnvironment(pid=0, process_class=writer.process_class(memory.process_class))
+    env.start()
+    observations = run_episode(env, actions)
+
+    env.stop()
+    writer.close()
+
+    print(f"Recorded {writer.frames} frames of {writer.frame_size} bytes into {os.path.getsize(path)} bytes, "
+          f"{os.path.getsize(path) / writer.frames:.1f} bytes/frame")
+
+    return observations
+
+
+def replay(path, actions=None):
+    trace = TraceReader(path)
+
+    env = FitnessCourseEnvironment(pid=0, process_class=trace.process_class)
+    env.start()
+
+    observations = run_episode(env, actions) if actions is not None else None
+
+    env.reset()
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step([0.0] * 7)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'replay':<40} {steps / elapsed:10.0f} steps/sec {elapsed / steps * 1e6:10.2f} us/step")
+
+    return observations
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        replay(sys.argv[1])
+    else:
+        rng = np.random.default_rng(0)
+        actions = rng.uniform(-1, 1, (steps, 7))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fitness-course.trace")
+
+            recorded = record(path, actions)
+            replayed = replay(path, actions)
+
+            assert torch.equal(recorded, replayed), "Replayed observations differ from the recorded ones"
@@ -0,0 +1,56 @@
+"""
+Compares appending an observation to the worker's state sequence with torch.roll against `SequenceWindow`, after
+    checking that both give the same windows.
+
+Run from the agent directory: python -m benchmarks.sequence_window
+"""
+import torch
+
+from SequenceWindow import SequenceWindow
+from benchmarks.common import timeit
+
+features = 27 + 128
+iterations = 20000
+
+
+def check(sequence_length):
+    states = torch.randn((3 * sequence_length, features)).to(torch.bfloat16)
+
+    window = SequenceWindow(sequence_length, features)
+    window.reset(states[0])
+
+    state_sequence = torch.zeros((sequence_length, features), dtype=torch.bfloat16)
+    state_sequence[-1] = states[0]
+
+    for state in states[1:]:
+        state_sequence = torch.roll(state_sequence, -1, 0)
+        state_sequence[-1] = state
+
+        window.append(state)
+
+        assert torch.equal(window.sequence, state_sequence), "Window differs from torch.roll"
+        assert window.batch.is_contiguous()
+
+
+def run(sequence_length):
+    state = torch.randn(features).to(torch.bfloat16)
+
+    state_sequence = torch.zeros((sequence_length, features), dtype=torch.bfloat16)
+
+    def roll():
+        nonlocal state_sequence
+        state_sequence = torch.roll(state_sequence, -1, 0)
+        state_sequence[-1] = state
+
+    window = SequenceWindow(sequence_length, features)
+
+    timeit(f"torch.roll, {sequence_length} steps", roll, iterations)
+    timeit(f"SequenceWindow, {sequence_length} steps", lambda: window.append(state), iterations)
+
+
+if __name__ == "__main__":
+    torch.set_num_threads(1)
+
+    for sequence_length in (30, 120, 480):
+        check(sequence_length)
+        run(sequence_length)
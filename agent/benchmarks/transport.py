@@ -0,0 +1,178 @@
+"""
+Compares sending transition groups over pub/sub, Redis Streams and shared memory rings with a local redis-server. A
+    publisher sends `--messages` groups as fast as it can, holding back like the worker does, while a consumer that
+    takes `--delay` seconds per message reads them. Prints the messages per second that got through and how many were
+    lost.
+
+With pub/sub, the publisher never holds back, since the learner only tells workers to once a buffer is full, and Redis
+    disconnects a consumer that falls too far behind, losing what it hadn't read. With streams, the publisher holds back
+    by the length of the stream and nothing should be lost. With shared memory, it holds back while the ring is full.
+
+Run from the agent directory with redis-server running: python -m benchmarks.transport --redis-url redis://localhost
+"""
+import argparse
+import time
+from threading import Event, Thread
+
+import torch
+from redis.exceptions import ConnectionError, ResponseError
+
+from RedisHub import RedisHub, Transition, TransitionGroupMessage, stack_transitions
+
+features = 27 + 128
+sequence_length = 30
+num_layers = 4
+hidden_dims = 512
+worker_name = "benchmark-0"
+
+
+def make_message(group_size, recurrent_state_interval):
+    # Transitions only carry the recurrent state when it's sent every step, see RedisHub.add
+    def recurrent_state():
+        if recurrent_state_interval > 1:
+            return torch.empty(0, dtype=torch.bfloat16)
+
+        return torch.randn((num_layers, hidden_dims)).to(torch.bfloat16)
+
+    transitions = [
+        Transition(torch.randn(features).to(torch.bfloat16), torch.randn((1, 7)), 0.5, False, torch.randn(1),
+                   torch.randn((1, 1)), recurrent_state(), recurrent_state(), 1, step)
+        for step in range(group_size)
+    ]
+
+    return TransitionGroupMessage(stack_transitions(transitions), worker_name)
+
+
+def consume_pubsub(hub, received, delay, ready, done):
+    pubsub = hub.redis.pubsub()
+    pubsub.subscribe(hub.key)
+    ready.set()
+
+    while not done.is_set():
+        try:
+            message = pubsub.get_message(timeout=0.1)
+        except ConnectionError:
+            # Redis dropped us for falling behind, along with whatever we hadn't read
+            return
+
+        if message is None or message["type"] != "message":
+            continue
+
+        hub.decode(message["data"])
+        received.append(time.perf_counter())
+
+        time.sleep(delay)
+
+
+def consume_streams(hub, received, delay, ready, done, group="benchmark"):
+    key = hub.stream_key(worker_name)
+
+    try:
+        hub.redis.xgroup_create(key, group, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    ready.set()
+
+    while not done.is_set():
+        for _, entries in hub.redis.xreadgroup(group, "benchmark", {key: ">"}, count=64, block=100):
+            for entry_id, fields in entries:
+                hub.decode(fields[b"data"])
+                received.append(time.perf_counter())
+
+                time.sleep(delay)
+
+            entry_ids = [entry_id for entry_id, _ in entries]
+            pipeline = hub.redis.pipeline(transaction=False)
+            pipeline.xack(key, group, *entry_ids)
+            pipeline.xdel(key, *entry_ids)
+            pipeline.execute()
+
+
+def consume_rings(hub, received, delay, ready, done):
+    # Read the publisher's own ring, attaching to it by name from the same process would confuse the resource tracker
+    ring = hub.ring(hub.stream_key(worker_name))
+    ready.set()
+
+    while not done.is_set():
+        data = ring.read_message()
+        if data is None:
+            time.sleep(0.0001)
+            continue
+
+        hub.decode(data)
+        received.append(time.perf_counter())
+
+        time.sleep(delay)
+
+
+def run(args, transport):
+    hub = RedisHub(args.redis_url, f"benchmark.{transport}", group_size=args.group_size, wire_format="binary",
+                   recurrent_state_interval=args.recurrent_state_interval, transport=transport,
+                   stream_maxlen=args.stream_maxlen, stream_backlog=args.stream_backlog, ring_slots=args.ring_slots)
+    hub.worker_id = worker_name
+    hub.redis.delete(hub.stream_key(worker_name))
+
+    if transport == "shared_memory":
+        hub.size_ring_slots(sequence_length, features, 7, num_layers, hidden_dims)
+
+    message = make_message(args.group_size, args.recurrent_state_interval)
+    data = hub.encode(message)
+
+    received = []
+    ready, done = Event(), Event()
+
+    consume = {"pubsub": consume_pubsub, "streams": consume_streams, "shared_memory": consume_rings}[transport]
+    consumer = Thread(target=consume, args=(hub, received, args.delay, ready, done), daemon=True)
+    consumer.start()
+    ready.wait()
+
+    start = time.perf_counter()
+    held_back = 0.0
+
+    for _ in range(args.messages):
+        if transport != "pubsub":
+            wait_start = time.perf_counter()
+            while hub.check_buffer_full(worker_name):
+                time.sleep(0.001)
+            held_back += time.perf_counter() - wait_start
+
+        hub.publish_message(hub.redis, hub.channel_of(message), data)
+
+    # Give the consumer time to catch up with whatever made it
+    deadline = time.perf_counter() + args.drain_timeout
+    while len(received) < args.messages and time.perf_counter() < deadline:
+        time.sleep(0.05)
+
+    done.set()
+    consumer.join()
+
+    elapsed = (received[-1] if received else time.perf_counter()) - start
+    lost = args.messages - len(received)
+
+    print(f"{transport:<13} {len(received) / elapsed:10.0f} messages/sec "
+          f"({len(received) * args.group_size / elapsed:10.0f} transitions/sec), "
+          f"lost {lost} of {args.messages} ({lost / args.messages:.1%}), "
+          f"{len(data)} bytes/message, publisher held back {held_back:.2f}s")
+
+    hub.redis.delete(hub.stream_key(worker_name))
+    hub.close_rings()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", type=str, default="redis://localhost:6379")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--group-size", type=int, default=16)
+    parser.add_argument("--recurrent-state-interval", type=int, default=1)
+    parser.add_argument("--ring-slots", type=int, default=64)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds the consumer takes per message")
+    parser.add_argument("--stream-maxlen", type=int, default=10000)
+    parser.add_argument("--stream-backlog", type=int, default=256)
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+
+    for transport in RedisHub.transports:
+        run(args, transport)
@@ -0,0 +1,75 @@
+"""
+Compares encoding and decoding transitions with pickle against TransitionCodec's binary format, one transition per
+    message and in groups, after checking that both decode to the same tensors. Prints the time per transition and the
+    bytes per transition of each.
+
+Run from the agent directory: python -m benchmarks.wire_format
+"""
+import pickle
+
+import torch
+
+import TransitionCodec
+from RedisHub import Transition, TransitionMessage, TransitionGroupMessage, stack_transitions
+from benchmarks.common import timeit
+
+features = 27 + 128
+iterations = 2000
+
+
+def make_transition():
+    # Shaped like what the worker sends, see RedisHub.add
+    return Transition(torch.randn(features).to(torch.bfloat16), torch.randn((1, 7)), 0.5, False, torch.randn(1),
+                      torch.randn((1, 1)), torch.randn((4, 512)).to(torch.bfloat16),
+                      torch.randn((4, 512)).to(torch.bfloat16), 1, 10)
+
+
+def check(group):
+    fields = stack_transitions(group)
+
+    kind, worker_name, decoded = TransitionCodec.decode_fields(
+        TransitionCodec.encode_fields(TransitionCodec.transitions_kind, "worker", fields))
+
+    assert kind == TransitionCodec.transitions_kind and worker_name == "worker"
+    for field, decoded_field in zip(fields, decoded):
+        assert field.dtype == decoded_field.dtype and torch.equal(field, decoded_field), "Binary round trip differs"
+
+
+def run(group_size):
+    group = [make_transition() for _ in range(group_size)]
+    check(group)
+
+    if group_size == 1:
+        message = TransitionMessage(group[0], "worker")
+    else:
+        message = TransitionGroupMessage(stack_transitions(group), "worker")
+
+    pickled = pickle.dumps(message)
+
+    def encode_binary():
+        # Stacking is part of the cost for a single transition, groups are stacked either way
+        fields = stack_transitions(group) if group_size == 1 else message.transitions
+        return TransitionCodec.encode_fields(TransitionCodec.transitions_kind, "worker", fields)
+
+    encoded = encode_binary()
+
+    print(f"{group_size} transitions per message: pickle {len(pickled) / group_size:.0f} bytes/transition, "
+          f"binary {len(encoded) / group_size:.0f} bytes/transition")
+
+    results = {
+        "pickle encode": timeit(f"pickle encode, {group_size}", lambda: pickle.dumps(message), iterations),
+        "pickle decode": timeit(f"pickle decode, {group_size}", lambda: pickle.loads(pickled), iterations),
+        "binary encode": timeit(f"binary encode, {group_size}", encode_binary, iterations),
+        "binary decode": timeit(f"binary decode, {group_size}",
+                                lambda: TransitionCodec.decode_fields(encoded), iterations),
+    }
+
+    for name, seconds in results.items():
+        print(f"  {name:<14} {group_size / seconds:12.0f} transitions/sec")
+
+
+if __name__ == "__main__":
+    torch.set_num_threads(1)
+
+    for group_size in (1, 16, 64):
+        run(group_size)
@@ -8,6 +8,7 @@ import wandb
 
 from PPO.PPOAgent import PPOAgent
 from RedisHub import RedisHub
+from StepProfiler import StepProfiler
 
 from util import update_graph_html
 
@@ -48,7 +49,8 @@ def start(args):
     commit = args.commit
 
     # redis = redis_from_url(f"redis://{args.redis_host}:{args.redis_port}")
-    redis = RedisHub(f"redis://{args.redis_host}:{args.redis_port}", "rac1.fitness-course.rollout_buffer", device=device)
+    redis = RedisHub(f"redis://{args.redis_host}:{args.redis_port}", "rac1.fitness-course.rollout_buffer", device=device,
+                     transport=args.transport)
 
     # Unblock potentially stale workers
     redis.unblock_workers()
@@ -129,9 +131,23 @@ def start(args):
 
     last_kl_div = 0
 
+    last_fleet_report = time.time()
+
     while True:
         processed = False
 
+        # What the workers spend their steps on, from the profiles they publish
+        if time.time() - last_fleet_report > args.fleet_report_interval:
+            last_fleet_report = time.time()
+
+            profiles = redis.get_worker_profiles()
+            if len(profiles) > 0:
+                fleet = StepProfiler.fleet_summary(list(profiles.values()))
+                print(f"\rfleet: {fleet['workers']} workers, {StepProfiler.format_summary(fleet)}")
+
+                if args.wandb:
+                    wandb.log({"fleet_steps_per_sec": fleet["steps_per_sec"]})
+
         print("\r", end="")
 
         all_buffers_ready = all([replay_buffer.ready for replay_buffer in agent.replay_buffers])
@@ -219,6 +235,8 @@ if __name__ == "__main__":
                           default=False if "pydevd" in sys.modules else True)
         args.add_argument("--commit", type=bool, action=argparse.BooleanOptionalAction,
                           default=False if "pydevd" in sys.modules else True)
+        args.add_argument("--fleet-report-interval", type=float, default=10.0)
+        args.add_argument("--transport", type=str, choices=RedisHub.transports, default="pubsub")
         args = args.parse_args()
 
         start(args)
@@ -5,6 +5,12 @@ import torch
 from RunningStats import RunningStats
 from Watchdog import Watchdog
 from Environments.FitnessCourseEnvironment import FitnessCourseEnvironment
+from Environments.VecFitnessCourseEnvironment import VecFitnessCourseEnvironment
+from Game.FrameWaiter import FrameWaiter
+from AllocationMonitor import AllocationMonitor, freeze_gc
+from StepProfiler import StepProfiler
+from TransitionSender import TransitionSender
+from SequenceWindow import SequenceWindow
 
 import numpy as np
 
@@ -22,6 +28,52 @@ configuration = {
 }
 
 
+def start_game(args, index=0):
+    """
+    Starts the `index`th game this worker steps, or finds it if it's already running. Returns its PID and, for the
+        simulator, its memory.
+    """
+    # If we're not being debugged in PyCharm mode, we start a new RPCS3 process using the watchdog, otherwise we connect to an existing one
+    pid = 0
+    memory = None
+    import sys
+    if args.simulator or args.simulator_name:
+        # Run against the headless simulator instead of RPCS3
+        import atexit
+        from Game.MemoryProcess import GameMemory
+        from Simulator import attach_simulator, start_simulator
+
+        if args.simulator_name:
+            # Simulators for more than one game are started as <name>-0, <name>-1, ...
+            simulator_memory = attach_simulator(args.simulator_name if args.envs == 1 else f"{args.simulator_name}-{index}")
+        else:
+            simulator_memory, simulator = start_simulator(fps=args.simulator_fps)
+            atexit.register(simulator_memory.unlink)
+            pid = simulator.pid
+
+        memory = GameMemory(buffer=simulator_memory.buf)
+    elif not "pydevd" in sys.modules:
+        # Make new environment and watchdog
+        watchdog = Watchdog(render=args.eval)
+        if not watchdog.start(force=True):
+            print("Damn, watchdog failed to start the process!")
+            exit(-1)
+        else:
+            pid = watchdog.pid
+    else:
+        # Find the rpcs3 process
+        import psutil
+        found = 0
+        for proc in psutil.process_iter():
+            if proc.name() == args.process_name:
+                pid = proc.pid
+                found += 1
+                if found > index:
+                    break
+
+    return pid, memory
+
+
 def start_worker(args):
     device = torch.device('cpu')
     if torch.cuda.is_available():
@@ -36,37 +88,75 @@ def start_worker(args):
     project_key = args.project_key
     device = "cpu" if args.cpu_only else device
 
-    # If we're not being debugged in PyCharm mode, we start a new RPCS3 process using the watchdog, otherwise we connect to an existing one
-    pid = 0
     import sys
-    if not "pydevd" in sys.modules:
-        # Make new environment and watchdog
-        watchdog = Watchdog(render=eval_mode)
-        if not watchdog.start(force=True):
-            print("Damn, watchdog failed to start the process!")
-            exit(-1)
-        else:
-            pid = watchdog.pid
+    pids, memories = zip(*[start_game(args, index) for index in range(args.envs)])
+    pid, memory = pids[0], memories[0]
+
+    process_class = None
+    if args.memory_backend == "pread":
+        from Game.LinuxProcess import PreadProcess
+        process_class = PreadProcess
+
+    if args.record_trace:
+        # Record everything we read and write so it can be replayed offline with ReplayProcess
+        import atexit
+        from Game.Game import Process
+        from Game.MemoryTrace import TraceWriter
+        from Game.RC1Game import RC1Game
+
+        trace_writer = TraceWriter.for_game(args.record_trace, RC1Game)
+        atexit.register(trace_writer.close)
+
+        if memory is not None:
+            # The trace wraps the simulator's memory, so the game gets to it through the process class alone
+            process_class, memory = memory.process_class, None
+        process_class = trace_writer.process_class(process_class or Process)
+
+    # Times the phases of every step and publishes a summary to Redis every few seconds, for the learner to show
+    profiler = StepProfiler(report_interval=args.profile_interval) if args.profile_steps else None
+
+    if args.envs > 1:
+        # Every game keeps its own frame wait statistics
+        frame_waiters = [FrameWaiter(strategy=args.frame_wait, timeout=args.frame_timeout) for _ in pids]
+
+        env = VecFitnessCourseEnvironment(pids, mode=args.vec_mode, sequence_length=sequence_length, device=device,
+                                          memories=memories, frame_waiters=frame_waiters, eval_mode=eval_mode,
+                                          process_class=process_class, cache_reads=args.cache_reads,
+                                          batch_writes=args.batch_writes, reuse_buffers=args.reuse_buffers,
+                                          profiler=profiler)
     else:
-        # Find the rpcs3 process
-        import psutil
-        for proc in psutil.process_iter():
-            if proc.name() == process_name:
-                pid = proc.pid
-                break
+        frame_waiter = FrameWaiter(strategy=args.frame_wait, timeout=args.frame_timeout)
 
-    env = FitnessCourseEnvironment(pid=pid, eval_mode=eval_mode, device=device)
+        env = FitnessCourseEnvironment(pid=pid, eval_mode=eval_mode, device=device, process_class=process_class,
+                                       cache_reads=args.cache_reads, batch_writes=args.batch_writes,
+                                       frame_waiter=frame_waiter, memory=memory, reuse_buffers=args.reuse_buffers,
+                                       profiler=profiler)
 
     # Watchdog starts RPCS3 and the game for us if it's not already running
     env.start()
 
     # Connect to Redis
-    redis = RedisHub(f"redis://{args.redis_host}:{args.redis_port}", f"{project_key}.rollout_buffer", device=device)
+    redis = RedisHub(f"redis://{args.redis_host}:{args.redis_port}", f"{project_key}.rollout_buffer", device=device,
+                     group_size=args.group_size, group_timeout=args.group_timeout, wire_format=args.wire_format,
+                     recurrent_state_interval=args.recurrent_state_interval, transport=args.transport,
+                     stream_maxlen=args.stream_maxlen, stream_backlog=args.stream_backlog, ring_slots=args.ring_slots,
+                     ring_slot_size=args.ring_slot_size, incremental_inference=args.incremental_inference)
+
+    # Send transitions from a background thread, so the step loop doesn't wait for Redis
+    if args.send_queue > 0:
+        redis.start_sender(queue_size=args.send_queue, full_policy=args.send_full_policy,
+                           batch_size=args.send_batch, spill_path=args.send_spill_path)
 
     # state_running_stats = RunningStats()
 
     # Agent that we will use only for inference, learning related parameters are not used
-    agent = PPOAgent(features, 7, log_std=-0.5, device=device)
+    agent = PPOAgent(features, 7, log_std=-0.5, incremental_inference=args.incremental_inference, device=device)
+
+    # Fails here rather than on the first send if --ring-slot-size is too small for what we send
+    if args.transport == "shared_memory":
+        actor = agent.policy.actor
+        redis.size_ring_slots(sequence_length, features, 7, actor.num_layers, actor.hidden_dims,
+                              dtype=next(actor.parameters()).dtype)
 
     if eval_mode:
         pass
@@ -82,10 +172,23 @@ def start_worker(args):
     else:
         agent.policy.actor.max_log_std = 0.8
 
+    if args.envs > 1:
+        run_vec_worker(args, env, redis, agent, profiler)
+        return
+
     total_steps = 0
     episodes = 0
     scores = []
 
+    allocation_monitor = None
+    if args.profile_allocations or args.trace_allocations:
+        allocation_monitor = AllocationMonitor(trace=args.trace_allocations)
+
+    if args.gc_freeze:
+        freeze_gc()
+
+    state_window = SequenceWindow(sequence_length, features, dtype=torch.bfloat16, device=device)
+
     # Start stepping through the environment
     while True:
         torch.cuda.empty_cache()
@@ -96,8 +199,7 @@ def start_worker(args):
         # state_running_stats.update(state)
         # state = state_running_stats.normalize(state)
 
-        state_sequence = torch.zeros((sequence_length, features), dtype=torch.bfloat16).to(device)
-        state_sequence[-1] = state
+        state_window.reset(state)
     
         accumulated_reward = 0
         steps = 0
@@ -109,22 +211,38 @@ def start_worker(args):
         agent.action_mask = redis.get_action_mask()
 
         while True:
+            if profiler is not None:
+                profiler.begin_step()
+
             while redis.check_buffer_full():
                 must_check_new_model = True
                 time.sleep(0.1)
 
+            if profiler is not None:
+                profiler.lap("backpressure")
+
+            if allocation_monitor is not None:
+                allocation_monitor.begin_step()
+
             if steps % 5 == 0 or must_check_new_model:
                 new_model = redis.get_new_model()
                 if new_model is not None:
                     agent.load_policy_dict(new_model)
 
+            if profiler is not None:
+                profiler.lap("model_check")
+
             # old_hidden_state = agent.policy.actor.hidden_state.clone().detach()
             # old_cell_state = agent.policy.actor.cell_state.clone().detach()
 
             # actions, logprob, state_value = (torch.zeros(7), torch.zeros(1), torch.zeros(1))
-            actions, logprob, state_value = agent.choose_action(state_sequence.unsqueeze(dim=0))
+            actions, logprob, state_value = agent.choose_action(state_window.batch)
             actions = actions.to(dtype=torch.float32).squeeze().cpu()
 
+            if profiler is not None:
+                profiler.lap("choose_action")
+
+            # Laps write, frame_wait, read and compute
             new_state, reward, done = env.step(actions)
 
             # state_running_stats.update(new_state)
@@ -134,7 +252,7 @@ def start_worker(args):
 
             # Give some run-in time before we start evaluating the model so state observations are normalized properly
             if not eval_mode:
-                redis.add(state_sequence, actions, reward, last_done, logprob, state_value, agent.policy.actor.hidden_state, agent.policy.actor.cell_state)
+                redis.add(state_window, actions, reward, last_done, logprob, state_value, agent.recurrent_state.actor_hidden, agent.recurrent_state.actor_cell)
             elif eval_mode:
                 # Visualize the actions
                 Visualizer.draw_state_value_face(state_value)
@@ -145,17 +263,26 @@ def start_worker(args):
                 if "pydevd" not in sys.modules:
                     Plotter.add_data(state_value.item(), reward)
 
-            # Roll the state sequence and append the new normalized state
-            new_state_sequence = torch.roll(state_sequence, -1, 0)
-            new_state_sequence[-1] = new_state
+            if profiler is not None:
+                profiler.lap("redis_add")
+
+            # Append the new normalized state to the state sequence
+            state_window.append(new_state)
 
-            state_sequence = new_state_sequence
             last_done = done
 
             accumulated_reward += reward
             steps += 1
             total_steps += 1
 
+            if allocation_monitor is not None:
+                allocation_monitor.end_step()
+
+            if profiler is not None:
+                summary = profiler.end_step()
+                if summary is not None:
+                    redis.publish_profile(summary)
+
             if eval_mode or steps % 5 == 0:
                 print(f"Score: %6.2f    death: %05.2f checkpoint: %d  closest_dist: %02.2f  value: %3.2f         " % (
                     accumulated_reward,
@@ -172,7 +299,8 @@ def start_worker(args):
         avg_score = np.mean(scores[-100:])
 
         print('score: %.2f' % accumulated_reward, 'checkpoints: %d' % env.n_checkpoints,
-              'avg score: %.2f' % avg_score)
+              'avg score: %.2f' % avg_score,
+              'frame wait ms p50/p90/p99: %.2f/%.2f/%.2f' % tuple(frame_waiter.percentiles((50, 90, 99)).values()))
 
         # Append score to Redis key "scores"
         if not eval_mode:
@@ -182,6 +310,106 @@ def start_worker(args):
         episodes += 1
 
 
+def run_vec_worker(args, vec_env, redis, agent, profiler=None):
+    """
+    Steps all the games in `vec_env` with one batched forward pass per step. Every game sends its transitions as a
+        worker of its own, so it gets a rollout buffer of its own on the learner.
+    """
+    project_key = args.project_key
+
+    worker_ids = [f"{redis.worker_id}-{index}" for index in range(vec_env.n_envs)]
+
+    agent.start_envs(vec_env.n_envs)
+    agent.action_mask = redis.get_action_mask()
+
+    indices, observations = vec_env.reset()
+
+    # What we chose for each game whose step is still in flight, until we know the reward
+    pending = {}
+
+    last_dones = np.ones(vec_env.n_envs, dtype=bool)
+    scores = []
+    steps = 0
+
+    must_check_new_model = False
+
+    while True:
+        if profiler is not None:
+            profiler.begin_step()
+
+        # Only stop stepping when the learner has all it wants from every game
+        while all(redis.check_buffer_full(worker_id) for worker_id in worker_ids):
+            must_check_new_model = True
+            time.sleep(0.1)
+
+        if profiler is not None:
+            profiler.lap("backpressure")
+
+        if steps % 5 == 0 or must_check_new_model:
+            new_model = redis.get_new_model()
+            if new_model is not None:
+                agent.load_policy_dict(new_model)
+
+            must_check_new_model = False
+
+        if profiler is not None:
+            profiler.lap("model_check")
+
+        actions, logprobs, state_values = agent.choose_action(observations, indices)
+        actions = actions.to(dtype=torch.float32).cpu()
+
+        # Copy out everything we send for each game, the batches are overwritten by the next step and sending a view
+        #   would send the whole batch
+        for j, index in enumerate(indices):
+            pending[index] = (observations[j].clone(), vec_env.windows[index].position, actions[j].clone(),
+                              logprobs[j:j + 1].clone(), state_values[j:j + 1].clone(),
+                              agent.recurrent_state.actor_hidden[:, j].clone(),
+                              agent.recurrent_state.actor_cell[:, j].clone())
+
+        if profiler is not None:
+            profiler.lap("choose_action")
+
+        # Laps write, frame_wait, read, compute and reset
+        indices, observations, rewards, dones = vec_env.step(indices, actions.tolist())
+
+        # Games whose episodes ended start their next one from a fresh recurrent state
+        episode_ended = np.zeros(vec_env.n_envs, dtype=bool)
+        episode_ended[indices] = dones
+        agent.reset_envs(episode_ended)
+
+        for j, index in enumerate(indices):
+            state_sequence, position, action, logprob, state_value, hidden_state, cell_state = pending.pop(index)
+
+            # Doesn't send anything while the learner's buffer for this game is full
+            redis.add(state_sequence, action, float(rewards[j]), bool(last_dones[index]), logprob, state_value,
+                      hidden_state, cell_state, worker_id=worker_ids[index], position=position)
+
+            last_dones[index] = dones[j]
+
+        if profiler is not None:
+            profiler.lap("redis_add")
+
+        for index, score, checkpoints in vec_env.finished_episodes:
+            scores.append(score)
+
+            print(f'game: {index}', 'score: %.2f' % score, 'checkpoints: %d' % checkpoints,
+                  'avg score: %.2f' % np.mean(scores[-100:]),
+                  'frame wait ms p50/p90/p99: %.2f/%.2f/%.2f' %
+                  tuple(vec_env.envs[index].game.frame_waiter.percentiles((50, 90, 99)).values()))
+
+            redis.redis.rpush(f"{project_key}.avg_scores", score)
+            redis.redis.rpush(f"{project_key}.checkpoints", checkpoints)
+
+        vec_env.finished_episodes.clear()
+
+        if profiler is not None:
+            summary = profiler.end_step(env_steps=len(indices))
+            if summary is not None:
+                redis.publish_profile(summary)
+
+        steps += 1
+
+
 if __name__ == "__main__":
     # Catch Ctrl+C and exit gracefully
     try:
@@ -198,9 +426,56 @@ if __name__ == "__main__":
         parser.add_argument("--eval", type=bool, action=argparse.BooleanOptionalAction, default=False)
         parser.add_argument("--project-key", type=str, default="rac1.fitness-course")
         parser.add_argument("--cpu-only", action="store_true", default=False)
+        parser.add_argument("--memory-backend", type=str, choices=["file", "pread"], default="file")
+        parser.add_argument("--cache-reads", action="store_true", default=False)
+        parser.add_argument("--batch-writes", action="store_true", default=False)
+        parser.add_argument("--frame-wait", type=str, choices=FrameWaiter.strategies, default="spin")
+        parser.add_argument("--frame-timeout", type=float, default=10.0)
+        parser.add_argument("--simulator", action="store_true", default=False)
+        parser.add_argument("--simulator-name", type=str, default=None)
+        parser.add_argument("--simulator-fps", type=float, default=None)
+        parser.add_argument("--record-trace", type=str, default=None)
+        parser.add_argument("--reuse-buffers", action="store_true", default=False)
+        parser.add_argument("--profile-allocations", action="store_true", default=False)
+        parser.add_argument("--trace-allocations", action="store_true", default=False)
+        parser.add_argument("--gc-freeze", action="store_true", default=False)
+        parser.add_argument("--incremental-inference", action="store_true", default=False)
+        parser.add_argument("--envs", type=int, default=1)
+        parser.add_argument("--vec-mode", type=str, choices=VecFitnessCourseEnvironment.modes, default="lockstep")
+        parser.add_argument("--profile-steps", type=bool, action=argparse.BooleanOptionalAction, default=False)
+        parser.add_argument("--profile-interval", type=float, default=5.0)
+        parser.add_argument("--send-queue", type=int, default=0,
+                            help="Send transitions from a background thread with a queue of this many, 0 sends them "
+                                 "from the step loop")
+        parser.add_argument("--send-full-policy", type=str, choices=TransitionSender.full_policies, default="block")
+        parser.add_argument("--send-batch", type=int, default=64)
+        parser.add_argument("--send-spill-path", type=str, default=None)
+        parser.add_argument("--group-size", type=int, default=1,
+                            help="Transitions per message, 1 sends each step on its own")
+        parser.add_argument("--group-timeout", type=float, default=0.5)
+        parser.add_argument("--wire-format", type=str, choices=RedisHub.wire_formats, default="binary")
+        parser.add_argument("--recurrent-state-interval", type=int, default=1,
+                            help="Send the actor's recurrent state every this many steps, the learner rebuilds the rest")
+        parser.add_argument("--transport", type=str, choices=RedisHub.transports, default="pubsub")
+        parser.add_argument("--stream-maxlen", type=int, default=10000, help="Entries each worker's stream is trimmed to")
+        parser.add_argument("--stream-backlog", type=int, default=256,
+                            help="Hold back while this many messages are waiting for the learner in our stream")
+        parser.add_argument("--ring-slots", type=int, default=64, help="Messages each shared memory ring holds")
+        parser.add_argument("--ring-slot-size", type=int, default=None,
+                            help="Largest message in bytes, by default the largest we send with the other flags")
 
         args = parser.parse_args()
 
+        if args.envs > 1 and (args.eval or args.record_trace):
+            parser.error("--eval and --record-trace only work with a single game")
+
+        if (args.simulator or args.simulator_name) and args.memory_backend != "file":
+            # The simulator's memory isn't a process we could pread from
+            parser.error("--memory-backend pread doesn't work with --simulator or --simulator-name")
+
+        if args.ring_slots < 2:
+            parser.error("--ring-slots must be at least 2")
+
         with torch.no_grad():
             start_worker(args)
     except KeyboardInterrupt: